@@ -0,0 +1,74 @@
+import os
+import threading
+
+import boto3
+from botocore.config import Config
+
+# One set of tuned clients per container, shared by every handler packaged with this module.
+# Clients are built on first use so importing a handler costs no client construction.
+LAMBDA_TIMEOUT_SECONDS = int(os.environ.get("LAMBDA_TIMEOUT_SECONDS", "30"))
+MAX_POOL_CONNECTIONS = int(os.environ.get("AWS_MAX_POOL_CONNECTIONS", "50"))
+
+CLIENT_CONFIG = Config(
+    max_pool_connections=MAX_POOL_CONNECTIONS,
+    tcp_keepalive=True,
+    connect_timeout=min(5, max(1, LAMBDA_TIMEOUT_SECONDS // 10)),
+    read_timeout=max(5, LAMBDA_TIMEOUT_SECONDS // 2),
+    retries={"mode": "adaptive", "max_attempts": 4},
+)
+
+_session = None
+_clients = {}
+_resources = {}
+_lock = threading.Lock()
+
+
+def get_client(service_name, endpoint_url=None):
+    key = (service_name, endpoint_url)
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _get_session().client(service_name, endpoint_url=endpoint_url, config=CLIENT_CONFIG)
+                _clients[key] = client
+    return client
+
+
+def get_resource(service_name):
+    resource = _resources.get(service_name)
+    if resource is None:
+        with _lock:
+            resource = _resources.get(service_name)
+            if resource is None:
+                resource = _get_session().resource(service_name, config=CLIENT_CONFIG)
+                _resources[service_name] = resource
+    return resource
+
+
+def client(service_name):
+    # Module-level stand-in for boto3.client(...) that builds the real client on first call
+    return _Lazy(get_client, service_name)
+
+
+def resource(service_name):
+    return _Lazy(get_resource, service_name)
+
+
+def _get_session():
+    # boto3's default session is not safe to build clients from concurrently
+    global _session
+    if _session is None:
+        _session = boto3.session.Session()
+    return _session
+
+
+class _Lazy:
+    __slots__ = ("_factory", "_service_name")
+
+    def __init__(self, factory, service_name):
+        self._factory = factory
+        self._service_name = service_name
+
+    def __getattr__(self, name):
+        return getattr(self._factory(self._service_name), name)
@@ -0,0 +1,312 @@
+"""Push an archive of broadcasts through the broadcast encode, resumably and within MediaConvert's request limits.
+
+    python backfillBroadcasts.py run manifest.jsonl --role arn:aws:iam::...:role/MediaConvertRole --bucket <destination>
+    python backfillBroadcasts.py run                 resume the checkpointed run
+    python backfillBroadcasts.py poll                update job statuses once
+    python backfillBroadcasts.py status
+
+The manifest is JSONL ({"input_s3": ..., "id": ...} per line) or CSV with those columns; id
+defaults to the input's file name without its extension.
+"""
+import argparse
+import csv
+import json
+import os
+import posixpath
+import random
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from botocore.exceptions import ClientError
+
+import broadcastJob
+import encodeScheduler
+import transcoder
+
+# Each broadcast is one backfill-class job (broadcastJob, the dev2streamlambda job spec), so the
+# scheduler's backfill budget bounds how many run at once; submissions wait while it is spent.
+# create_job and list_jobs calls share one token bucket sized to the account's MediaConvert
+# request rate. Throttling halves the rate and each success wins back a little of it.
+#
+# Every broadcast is a row in a local SQLite checkpoint. A row is marked SUBMITTING before its
+# create_job call, and the job's ClientRequestToken is derived from the broadcast, so a run that
+# crashes mid-submission resumes by resubmitting and gets the same job back. --retry-failed bumps
+# a row's generation, which is part of that token, so a broadcast whose job failed gets a new job
+# rather than the failed one. Completion comes from list_jobs pages, newest first, read back to
+# the oldest open submission.
+BACKFILL_DB = os.environ.get("BACKFILL_DB", "backfill.sqlite3")
+CREATE_JOB_RATE = float(os.environ.get("BACKFILL_REQUEST_RATE", "5"))
+BACKFILL_WORKERS = int(os.environ.get("BACKFILL_WORKERS", "8"))
+POLL_INTERVAL_SECONDS = int(os.environ.get("BACKFILL_POLL_SECONDS", "60"))
+MAX_ATTEMPTS = 8
+MAX_BACKOFF_SECONDS = 60
+BUDGET_WAIT_SECONDS = 30
+# list_jobs CreatedAt and our submit times come from different clocks
+CLOCK_SKEW_SECONDS = 300
+LIST_PAGE_SIZE = 20
+THROTTLE_CODES = ("TooManyRequestsException", "ThrottlingException", "Throttling", "SlowDown")
+
+OPEN_STATUSES = ("SUBMITTED", "PROGRESSING")
+# Submissions that were rejected, and jobs that MediaConvert failed
+RETRY_STATUSES = ("FAILED", "ERROR")
+TO_SUBMIT = ("PENDING", "SUBMITTING")
+
+
+class TokenBucket:
+    # Thread-safe request pacing whose rate adapts to throttling
+
+    def __init__(self, rate, burst=None, min_rate=0.1):
+        self.max_rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+
+    def throttled(self):
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = min(self.tokens, 0.0)
+
+    def succeeded(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+class Checkpoint:
+    # SQLite progress file; only the driver's main thread touches it
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS broadcasts ("
+            " id TEXT PRIMARY KEY, input_s3 TEXT NOT NULL, status TEXT NOT NULL DEFAULT 'PENDING',"
+            " job_id TEXT, attempts INTEGER NOT NULL DEFAULT 0, error TEXT,"
+            " submitted_at REAL, updated_at REAL, generation INTEGER NOT NULL DEFAULT 0)"
+        )
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(broadcasts)")}
+        if "generation" not in columns:
+            # Checkpoints written before retries had generations
+            self.db.execute("ALTER TABLE broadcasts ADD COLUMN generation INTEGER NOT NULL DEFAULT 0")
+        self.db.execute("CREATE INDEX IF NOT EXISTS broadcasts_status ON broadcasts (status)")
+        self.db.commit()
+
+    def add(self, rows):
+        # Broadcasts already in the checkpoint keep their progress
+        self.db.executemany("INSERT OR IGNORE INTO broadcasts (id, input_s3) VALUES (?, ?)", rows)
+        self.db.commit()
+
+    def to_submit(self, after_rowid=0, limit=500):
+        placeholders = ",".join("?" * len(TO_SUBMIT))
+        return self.db.execute(
+            f"SELECT rowid, id, input_s3, generation FROM broadcasts WHERE status IN ({placeholders}) AND rowid > ?"
+            " ORDER BY rowid LIMIT ?", (*TO_SUBMIT, after_rowid, limit)
+        ).fetchall()
+
+    def mark(self, broadcast_id, status, job_id=None, error=None, attempts=0):
+        now = time.time()
+        self.db.execute(
+            "UPDATE broadcasts SET status = ?, job_id = COALESCE(?, job_id), error = ?,"
+            " attempts = attempts + ?, updated_at = ?,"
+            " submitted_at = CASE WHEN ? = 'SUBMITTED' THEN ? ELSE submitted_at END WHERE id = ?",
+            (status, job_id, error, attempts, now, status, now, broadcast_id)
+        )
+        self.db.commit()
+
+    def open_jobs(self):
+        # ({job_id: (broadcast id, status)}, earliest submit time)
+        placeholders = ",".join("?" * len(OPEN_STATUSES))
+        rows = self.db.execute(
+            f"SELECT job_id, id, status, submitted_at FROM broadcasts WHERE status IN ({placeholders})",
+            OPEN_STATUSES
+        ).fetchall()
+        return {job_id: (broadcast_id, status) for job_id, broadcast_id, status, _ in rows}, \
+            min((submitted_at for *_, submitted_at in rows), default=None)
+
+    def retry_failed(self):
+        placeholders = ",".join("?" * len(RETRY_STATUSES))
+        self.db.execute(
+            "UPDATE broadcasts SET status = 'PENDING', attempts = 0, generation = generation + 1"
+            f" WHERE status IN ({placeholders})", RETRY_STATUSES
+        )
+        self.db.commit()
+
+    def counts(self):
+        return dict(self.db.execute("SELECT status, COUNT(*) FROM broadcasts GROUP BY status ORDER BY status"))
+
+
+def read_manifest(path):
+    # (id, input_s3) per manifest line, streamed
+    with open(path, newline="") as f:
+        if path.lower().endswith(".csv"):
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for row in rows:
+            input_s3 = row["input_s3"].strip()
+            yield row.get("id") or posixpath.splitext(posixpath.basename(input_s3))[0], input_s3
+
+
+def submit_one(broadcast_id, input_s3, bucket, role, limiter, generation=0):
+    # (status, job id, error, attempts); runs on a worker thread
+    attempts = 0
+    while True:
+        limiter.take()
+        attempts += 1
+        try:
+            response = broadcastJob.submit(
+                input_s3, broadcast_id, bucket, role, encode_class=encodeScheduler.BACKFILL, attempt=generation
+            )
+        except encodeScheduler.EncodeBudgetExceeded:
+            # Not a failed attempt: running backfill jobs have to finish first
+            attempts -= 1
+            time.sleep(BUDGET_WAIT_SECONDS * random.uniform(0.5, 1.5))
+            continue
+        except ClientError as e:
+            code = e.response["Error"]["Code"]
+            if code in THROTTLE_CODES and attempts < MAX_ATTEMPTS:
+                limiter.throttled()
+                time.sleep(min(MAX_BACKOFF_SECONDS, 2 ** attempts) * random.uniform(0.5, 1))
+                continue
+            return "FAILED", None, f"{code}: {e.response['Error'].get('Message', '')}", attempts
+        limiter.succeeded()
+        return "SUBMITTED", response["Job"]["Id"], None, attempts
+
+
+def poll(store, limiter):
+    # Applies list_jobs statuses to open submissions; returns how many changed
+    jobs, oldest = store.open_jobs()
+    if not jobs:
+        return 0
+    kwargs = {"MaxResults": LIST_PAGE_SIZE, "Order": "DESCENDING"}
+    queue = encodeScheduler.get_class(encodeScheduler.BACKFILL).queue
+    if queue:
+        kwargs["Queue"] = queue
+    changed = 0
+    while jobs:
+        limiter.take()
+        page = transcoder.list_jobs(**kwargs)
+        for job in page.get("Jobs", []):
+            if job["Id"] not in jobs:
+                continue
+            broadcast_id, status = jobs.pop(job["Id"])
+            if job["Status"] != status:
+                store.mark(broadcast_id, job["Status"], error=job.get("ErrorMessage"))
+                changed += 1
+            # Frees the slot here too, in case its state change event was lost
+            encodeScheduler.release_job(job["Status"], job.get("UserMetadata", {}))
+        listed = page.get("Jobs", [])
+        if "NextToken" not in page or not listed or _timestamp(listed[-1]["CreatedAt"]) < oldest - CLOCK_SKEW_SECONDS:
+            break
+        kwargs["NextToken"] = page["NextToken"]
+    return changed
+
+
+def run(store, bucket, role, rate=CREATE_JOB_RATE, workers=BACKFILL_WORKERS,
+        poll_interval=POLL_INTERVAL_SECONDS, wait_for_jobs=False):
+    limiter = TokenBucket(rate)
+    futures = {}
+    last_poll = time.monotonic()
+
+    def collect(timeout):
+        nonlocal last_poll
+        done, _ = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            broadcast_id = futures.pop(future)
+            status, job_id, error, attempts = future.result()
+            store.mark(broadcast_id, status, job_id=job_id, error=error, attempts=attempts)
+        if time.monotonic() - last_poll >= poll_interval:
+            poll(store, limiter)
+            last_poll = time.monotonic()
+            report(store)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        after = 0
+        while True:
+            rows = store.to_submit(after)
+            if not rows:
+                break
+            for after, broadcast_id, input_s3, generation in rows:
+                while len(futures) >= workers * 2:
+                    collect(poll_interval)
+                store.mark(broadcast_id, "SUBMITTING")
+                futures[pool.submit(submit_one, broadcast_id, input_s3, bucket, role, limiter, generation)] = broadcast_id
+        while futures:
+            collect(poll_interval)
+
+    poll(store, limiter)
+    while wait_for_jobs and store.open_jobs()[0]:
+        time.sleep(poll_interval)
+        poll(store, limiter)
+        report(store)
+    report(store)
+
+
+def report(store):
+    print(" ".join(f"{status}={count}" for status, count in store.counts().items()), flush=True)
+
+
+def _timestamp(value):
+    # MediaConvert returns datetimes, the local transcoder epoch seconds
+    return value.timestamp() if hasattr(value, "timestamp") else float(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default=BACKFILL_DB, help="SQLite checkpoint file")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run")
+    run_parser.add_argument("manifest", nargs="?", help="JSONL or CSV of input_s3[,id]; omit to resume")
+    run_parser.add_argument("--role", default=os.environ.get("MEDIACONVERT_ROLE"))
+    run_parser.add_argument("--bucket", default=os.environ.get("DESTINATION_BUCKET"))
+    run_parser.add_argument("--rate", type=float, default=CREATE_JOB_RATE, help="MediaConvert requests per second")
+    run_parser.add_argument("--workers", type=int, default=BACKFILL_WORKERS)
+    run_parser.add_argument("--poll-interval", type=int, default=POLL_INTERVAL_SECONDS)
+    run_parser.add_argument("--wait", action="store_true", help="keep polling until every job has finished")
+    run_parser.add_argument("--retry-failed", action="store_true", help="resubmit broadcasts whose submission or job failed")
+    commands.add_parser("poll")
+    commands.add_parser("status")
+    args = parser.parse_args(argv)
+
+    store = Checkpoint(args.db)
+    if args.command == "status":
+        report(store)
+    elif args.command == "poll":
+        poll(store, TokenBucket(CREATE_JOB_RATE))
+        report(store)
+    else:
+        if not args.role or not args.bucket:
+            parser.error("run needs --role and --bucket (or MEDIACONVERT_ROLE and DESTINATION_BUCKET)")
+        if args.manifest:
+            batch = []
+            for row in read_manifest(args.manifest):
+                batch.append(row)
+                if len(batch) >= 1000:
+                    store.add(batch)
+                    batch = []
+            store.add(batch)
+        if args.retry_failed:
+            store.retry_failed()
+        run(store, args.bucket, args.role, args.rate, args.workers, args.poll_interval, args.wait)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,257 @@
+"""Cold-start benchmark for the Lambda handler modules.
+
+Each handler is imported in a fresh interpreter with boto3/botocore replaced by the fakes
+in benchmarks/fakes, then invoked once with a representative event. For every handler we
+record import time, first-invocation time, peak RSS and the AWS calls attempted while the
+module was being imported (which are network round trips on a real cold start).
+
+    python benchmarks/coldStartBenchmark.py --runs 5 --json report.json --markdown report.md
+    python benchmarks/coldStartBenchmark.py --compare report.json
+"""
+import argparse
+import hashlib
+import hmac
+import importlib.machinery
+import importlib.util
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKES_DIR = os.path.join(REPO_ROOT, "benchmarks", "fakes")
+
+FAKE_ENV = {
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "MEDIACONVERT_ROLE": "arn:aws:iam::000000000000:role/MediaConvertRole",
+    "OUTPUT_BUCKET": "bench-output",
+    "DESTINATION_BUCKET": "bench-destination",
+    "SEGMENT_BUCKET": "bench-segments",
+    "CLOUDFRONT_DOMAIN": "bench.cloudfront.net",
+    "DB_SECRET_ARN": "arn:aws:secretsmanager:us-east-1:000000000000:secret:bench",
+    "DB_CLUSTER_ARN": "arn:aws:rds:us-east-1:000000000000:cluster:bench",
+    "DB_NAME": "metadatadb",
+    "SHARED_SECRET": "bench-secret",
+}
+
+SEGMENT_EVENT = {
+    "input_s3": "s3://input-proxy-bucket/2024/01/01/broadcast.mp4",
+    "segment_id": "bench-segment",
+    "start_time": "00:01:02.500",
+    "duration": "00:00:30.000",
+}
+
+BROADCAST_EVENT = {
+    "input_s3": "s3://input-proxy-bucket/2024/01/01/broadcast.mp4",
+    "id": "bench-broadcast",
+}
+
+STREAM_EVENT = {
+    "queryStringParameters": {"segment_id": "bench-segment"},
+    "requestContext": {"authorizer": {"claims": {"sub": "bench-user"}}},
+}
+
+BATCH_EVENT = {
+    "queryStringParameters": {"segment_ids": "bench-segment,bench-segment-2,bench-segment-3"},
+    "requestContext": {"authorizer": {"claims": {"sub": "bench-user"}}},
+}
+
+MANIFEST_EVENT = {
+    "queryStringParameters": {"path": "segments/bench-segment/hls/master.m3u8"},
+    "requestContext": {"authorizer": {"claims": {"sub": "bench-user"}}},
+}
+
+HANDLERS = {
+    "createHLSSegment.py": SEGMENT_EVENT,
+    "streamAPILambda.py": STREAM_EVENT,
+    "streamAPILambdaCloudFormation.py": STREAM_EVENT,
+    "segmentStreamRequestLambdaWithCookie.py": STREAM_EVENT,
+    "segmentStatusLambda.py": STREAM_EVENT,
+    "streamBatchLambda.py": BATCH_EVENT,
+    "manifestLambda.py": MANIFEST_EVENT,
+    "video-access-validation.py": "edge",
+    "mp42HLSThumbnail.py": BROADCAST_EVENT,
+    "createSegmentsLambda/createSegment.py": SEGMENT_EVENT,
+    "createSegmentsLambda/createSegmentHLS.py": SEGMENT_EVENT,
+    "createSegmentsLambda/createDownloadSegmentTested.py": SEGMENT_EVENT,
+    "processSegmentsLambdas/create_segment_lambda_working.py": SEGMENT_EVENT,
+    "processBroadcastLambdas/dev2streamlambda.py": BROADCAST_EVENT,
+    "processBroadcastLambdas/process2streamsThumbnail.py": BROADCAST_EVENT,
+}
+
+
+def edge_event(module):
+    # CloudFront viewer-request carrying a cookie signed with the module's own key
+    segment_id = "bench-segment"
+    expiry = int(time.time()) + 3600
+    payload = f"{segment_id}.{expiry}"
+    signature = hmac.new(module.SECRET_KEY, payload.encode(), hashlib.sha256).hexdigest()
+    return {"Records": [{"cf": {"request": {
+        "uri": f"/stream/{segment_id}/hls/master.m3u8",
+        "headers": {"cookie": [{"key": "Cookie", "value": f"theme=dark; segment_access={payload}.{signature}"}]},
+    }}}]}
+
+
+class _Context:
+    function_name = "cold-start-benchmark"
+    memory_limit_in_mb = 1024
+    aws_request_id = "bench"
+
+    def get_remaining_time_in_millis(self):
+        return 30000
+
+
+def probe(handler):
+    # Runs inside the fresh interpreter; prints one JSON result line
+    import resource
+
+    path = os.path.join(REPO_ROOT, handler)
+    name = os.path.splitext(os.path.basename(handler))[0].replace("-", "_")
+    sys.path.insert(0, os.path.dirname(path))
+    sys.path.insert(1, REPO_ROOT)
+    loader = importlib.machinery.SourceFileLoader(name, path)
+    spec = importlib.util.spec_from_file_location(name, path, loader=loader)
+    module = importlib.util.module_from_spec(spec)
+
+    started = time.perf_counter()
+    loader.exec_module(module)
+    import_ms = (time.perf_counter() - started) * 1000
+    import boto3
+    module_calls = [f"{c['service']}.{c['operation']}" for c in boto3.CALLS]
+    module_clients = list(boto3.CLIENTS)
+
+    event = HANDLERS.get(handler, SEGMENT_EVENT)
+    if event == "edge":
+        event = edge_event(module)
+    error = None
+    started = time.perf_counter()
+    try:
+        module.lambda_handler(json.loads(json.dumps(event)), _Context())
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    invoke_ms = (time.perf_counter() - started) * 1000
+
+    print(json.dumps({
+        "handler": handler,
+        "import_ms": import_ms,
+        "first_invoke_ms": invoke_ms,
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "module_scope_calls": module_calls,
+        "module_scope_clients": module_clients,
+        "invoke_calls": [f"{c['service']}.{c['operation']}" for c in boto3.CALLS[len(module_calls):]],
+        "error": error,
+    }))
+
+
+def run_once(handler, cache_dir):
+    env = dict(os.environ)
+    env.update(FAKE_ENV)
+    env.pop("MEDIACONVERT_ENDPOINT", None)
+    env["MEDIACONVERT_ENDPOINT_CACHE"] = os.path.join(cache_dir, "mediaconvert_endpoint.json")
+    env["PYTHONPATH"] = os.pathsep.join([FAKES_DIR, REPO_ROOT])
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--probe", handler],
+        env=env, capture_output=True, text=True, cwd=cache_dir
+    )
+    if proc.returncode != 0:
+        return {"handler": handler, "error": proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "probe failed"}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def benchmark(handlers, runs):
+    results = []
+    for handler in handlers:
+        samples = []
+        for _ in range(runs):
+            # A fresh /tmp per run so nothing persisted by a previous run hides cold-start work
+            with tempfile.TemporaryDirectory() as cache_dir:
+                samples.append(run_once(handler, cache_dir))
+        ok = [s for s in samples if "import_ms" in s]
+        if not ok:
+            results.append({"handler": handler, "error": samples[-1].get("error")})
+            continue
+        last = ok[-1]
+        results.append({
+            "handler": handler,
+            "runs": len(ok),
+            "import_ms": statistics.median(s["import_ms"] for s in ok),
+            "first_invoke_ms": statistics.median(s["first_invoke_ms"] for s in ok),
+            "peak_rss_kb": max(s["peak_rss_kb"] for s in ok),
+            "module_scope_network_calls": len(last["module_scope_calls"]),
+            "module_scope_calls": last["module_scope_calls"],
+            "module_scope_clients": last["module_scope_clients"],
+            "invoke_calls": last["invoke_calls"],
+            "error": last["error"],
+        })
+    return {
+        "python": sys.version.split()[0],
+        "runs": runs,
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "results": results,
+    }
+
+
+def to_markdown(report, baseline=None):
+    previous = {r["handler"]: r for r in (baseline or {}).get("results", [])}
+
+    def delta(result, key, fmt):
+        value = fmt.format(result[key])
+        before = previous.get(result["handler"], {}).get(key)
+        if before is None:
+            return value
+        return f"{value} ({result[key] - before:+.1f})"
+
+    lines = [
+        f"Cold-start benchmark (python {report['python']}, median of {report['runs']} runs)",
+        "",
+        "| handler | import ms | first invoke ms | peak RSS KB | module-scope calls | error |",
+        "|---|---:|---:|---:|---:|---|",
+    ]
+    for r in report["results"]:
+        if "import_ms" not in r:
+            lines.append(f"| {r['handler']} | | | | | {r['error']} |")
+            continue
+        lines.append(
+            f"| {r['handler']} | {delta(r, 'import_ms', '{:.1f}')} | {delta(r, 'first_invoke_ms', '{:.1f}')} "
+            f"| {delta(r, 'peak_rss_kb', '{:d}')} | {delta(r, 'module_scope_network_calls', '{:d}')} | {r['error'] or ''} |"
+        )
+    return "\n".join(lines) + "\n"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("handlers", nargs="*", help="handler paths relative to the repo root (default: all)")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--json", help="write the JSON report here")
+    parser.add_argument("--markdown", help="write the markdown report here")
+    parser.add_argument("--compare", help="previous JSON report to show deltas against")
+    parser.add_argument("--probe", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.probe:
+        probe(args.probe)
+        return 0
+
+    report = benchmark(args.handlers or list(HANDLERS), args.runs)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    markdown = to_markdown(report, baseline)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.markdown:
+        with open(args.markdown, "w") as f:
+            f.write(markdown)
+    print(markdown)
+    return 1 if any(r.get("error") for r in report["results"]) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+# Local boto3 stand-in for the cold-start benchmark. Every API operation is recorded in
+# CALLS instead of going to the network; responses come from RESPONSES (or {}).
+import re
+import time
+
+from botocore.exceptions import ClientError
+
+CALLS = []
+CLIENTS = []
+
+RESPONSES = {
+    ("mediaconvert", "describe_endpoints"): {"Endpoints": [{"Url": "https://fake.mediaconvert.us-east-1.amazonaws.com"}]},
+    ("mediaconvert", "create_job"): {"Job": {"Id": "1700000000000-fake"}},
+    ("rds-data", "execute_statement"): {"records": [[
+        {"stringValue": "bench-segment"},
+        {"stringValue": "s3://input-proxy-bucket/2024/01/01/broadcast.mp4"},
+        {"stringValue": "00:01:02"},
+        {"stringValue": "30"},
+    ]]},
+    ("s3", "list_objects_v2"): {"KeyCount": 0, "Contents": []},
+    ("dynamodb", "get_item"): {},
+    ("dynamodb", "query"): {"Items": []},
+}
+
+# Operations that answer with a not-found error, as they would against empty buckets
+ERRORS = {
+    ("s3", "get_object"): {"Error": {"Code": "NoSuchKey", "Message": "The specified key does not exist."}},
+}
+
+
+def _record(service, operation):
+    CALLS.append({"service": service, "operation": operation, "at": time.perf_counter()})
+
+
+class _FakeClient:
+    def __init__(self, service_name, **kwargs):
+        self._service_name = service_name
+        self._kwargs = kwargs
+        self.meta = type("Meta", (), {"endpoint_url": kwargs.get("endpoint_url"), "region_name": kwargs.get("region_name")})()
+        CLIENTS.append(service_name)
+
+    def __getattr__(self, operation):
+        if operation.startswith("_"):
+            raise AttributeError(operation)
+
+        def call(**kwargs):
+            _record(self._service_name, operation)
+            if (self._service_name, operation) in ERRORS:
+                raise ClientError(ERRORS[(self._service_name, operation)], operation)
+            return RESPONSES.get((self._service_name, operation), {})
+        return call
+
+
+class _FakeTable:
+    def __init__(self, name):
+        self.name = name
+
+    def __getattr__(self, operation):
+        if operation.startswith("_"):
+            raise AttributeError(operation)
+
+        def call(**kwargs):
+            _record("dynamodb", operation)
+            if operation == "update_item" and kwargs.get("ReturnValues") == "ALL_NEW":
+                return {"Attributes": _updated_item(kwargs)}
+            return RESPONSES.get(("dynamodb", operation), {})
+        return call
+
+
+def _updated_item(kwargs):
+    # The key plus every "name = :value" the update expression sets, as if the item was new
+    names = kwargs.get("ExpressionAttributeNames", {})
+    values = kwargs.get("ExpressionAttributeValues", {})
+    item = dict(kwargs["Key"])
+    for name, value in re.findall(r"([#\w]+) = (:\w+)", kwargs.get("UpdateExpression", "")):
+        item[names.get(name, name)] = values[value]
+    return item
+
+
+class _FakeResource:
+    def __init__(self, service_name, **kwargs):
+        self._service_name = service_name
+        self.meta = type("Meta", (), {"client": _FakeClient(service_name, **kwargs)})()
+        CLIENTS.append(f"{service_name}:resource")
+
+    def Table(self, name):
+        return _FakeTable(name)
+
+    def batch_get_item(self, **kwargs):
+        _record("dynamodb", "batch_get_item")
+        return RESPONSES.get(("dynamodb", "batch_get_item"), {"Responses": {}})
+
+
+def client(service_name, **kwargs):
+    return _FakeClient(service_name, **kwargs)
+
+
+def resource(service_name, **kwargs):
+    return _FakeResource(service_name, **kwargs)
+
+
+class session:
+    class Session:
+        def client(self, service_name, **kwargs):
+            return _FakeClient(service_name, **kwargs)
+
+        def resource(self, service_name, **kwargs):
+            return _FakeResource(service_name, **kwargs)
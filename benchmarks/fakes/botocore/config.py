@@ -0,0 +1,6 @@
+class Config:
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+
+    def merge(self, other):
+        return Config(**{**self.kwargs, **other.kwargs})
@@ -0,0 +1,25 @@
+# Minimal stand-ins for the botocore exceptions the handlers catch
+
+
+class BotoCoreError(Exception):
+    pass
+
+
+class ClientError(Exception):
+    def __init__(self, error_response, operation_name):
+        self.response = error_response
+        self.operation_name = operation_name
+        error = error_response.get("Error", {})
+        super().__init__(f"An error occurred ({error.get('Code')}) when calling the {operation_name} operation: {error.get('Message')}")
+
+
+class EndpointConnectionError(BotoCoreError):
+    pass
+
+
+class ConnectTimeoutError(BotoCoreError):
+    pass
+
+
+class ReadTimeoutError(BotoCoreError):
+    pass
@@ -0,0 +1,52 @@
+"""Per-request cost of building MediaConvert job settings from each compiled ladder.
+
+    python benchmarks/ladderBenchmark.py --iterations 20000
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import renditionLadder  # noqa: E402
+
+
+def build(template):
+    return renditionLadder.build_job(
+        template,
+        role="arn:aws:iam::000000000000:role/MediaConvertRole",
+        input_s3="s3://input-proxy-bucket/2024/01/01/broadcast.mp4",
+        destinations={
+            "mp4": "s3://bench-output/segments/bench/",
+            "thumbnail": "s3://bench-destination/thumbnails/segments/bench/",
+            "hls": "s3://bench-destination/bench/hls/segments/bench/",
+        },
+        clipping=("00:01:02:15", "00:01:32:15"),
+        user_metadata={"source": "broadcast.mp4", "job": "bench"},
+        mp4_name_modifier="_bench",
+        thumbnail_interval=30,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("ladders", nargs="*", help="ladder names (default: all)")
+    parser.add_argument("--iterations", type=int, default=10000)
+    args = parser.parse_args(argv)
+
+    print("| ladder | compile us | build_job us | payload bytes |")
+    print("|---|---:|---:|---:|")
+    for name in args.ladders or list(renditionLadder.LADDERS):
+        ladder = renditionLadder.LADDERS[name]
+        compile_us = timeit.timeit(lambda: renditionLadder.compile_ladder(ladder), number=1000) * 1000
+        template = renditionLadder.get_template(name)
+        build_us = timeit.timeit(lambda: build(template), number=args.iterations) / args.iterations * 1e6
+        payload = len(json.dumps(build(template)))
+        print(f"| {name} | {compile_us:.1f} | {build_us:.2f} | {payload} |")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
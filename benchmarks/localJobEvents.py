@@ -0,0 +1,83 @@
+"""Local stand-in for MediaConvert "Job State Change" events.
+
+Generates the EventBridge events a job emits over its lifetime and, with --deliver, feeds
+them to segmentJobEventsLambda (point boto3 at DynamoDB Local with AWS_ENDPOINT_URL).
+
+    python benchmarks/localJobEvents.py --segment-id seg-1 --job-id 1700000000000-abc
+    python benchmarks/localJobEvents.py --segment-id seg-1 --job-id 1700000000000-abc --error --deliver
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def job_state_event(job_id, status, user_metadata, percent=None, error=None, playlist_paths=None):
+    detail = {
+        "timestamp": int(time.time() * 1000),
+        "accountId": "000000000000",
+        "queue": "arn:aws:mediaconvert:us-east-1:000000000000:queues/Default",
+        "jobId": job_id,
+        "status": status,
+        "userMetadata": user_metadata,
+    }
+    if percent is not None:
+        detail["jobProgress"] = {"jobPercentComplete": percent, "currentPhase": "TRANSCODING"}
+    if error:
+        detail["errorCode"] = 1010
+        detail["errorMessage"] = error
+    if playlist_paths:
+        detail["outputGroupDetails"] = [{"type": "HLS_GROUP", "playlistFilePaths": playlist_paths}]
+    return {
+        "version": "0",
+        "id": f"{job_id}-{status.lower()}-{detail['timestamp']}",
+        "detail-type": "MediaConvert Job State Change",
+        "source": "aws.mediaconvert",
+        "account": "000000000000",
+        "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "region": "us-east-1",
+        "resources": [f"arn:aws:mediaconvert:us-east-1:000000000000:jobs/{job_id}"],
+        "detail": detail,
+    }
+
+
+def job_lifecycle(job_id, user_metadata, progress=(10, 40, 70), error=None, playlist_paths=None):
+    yield job_state_event(job_id, "PROGRESSING", user_metadata)
+    for percent in progress:
+        yield job_state_event(job_id, "STATUS_UPDATE", user_metadata, percent=percent)
+    if error:
+        yield job_state_event(job_id, "ERROR", user_metadata, error=error)
+    else:
+        yield job_state_event(job_id, "COMPLETE", user_metadata, playlist_paths=playlist_paths)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--segment-id", required=True)
+    parser.add_argument("--job-id", required=True)
+    parser.add_argument("--error", action="store_true", help="end with ERROR instead of COMPLETE")
+    parser.add_argument("--interval", type=float, default=0.0, help="seconds between events")
+    parser.add_argument("--deliver", action="store_true", help="invoke segmentJobEventsLambda with each event")
+    args = parser.parse_args(argv)
+
+    handler = None
+    if args.deliver:
+        sys.path.insert(0, REPO_ROOT)
+        import segmentJobEventsLambda
+        handler = segmentJobEventsLambda.lambda_handler
+
+    events = job_lifecycle(
+        args.job_id, {"segment_id": args.segment_id},
+        error="Simulated encode failure" if args.error else None
+    )
+    for event in events:
+        print(json.dumps(handler(event, None) if handler else event))
+        time.sleep(args.interval)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""Encode throughput of each rendition ladder through the local ffmpeg transcoder.
+
+Builds the same job settings the handlers submit (inline, clipped to --start/--duration)
+and runs them one at a time, so ladders can be compared without MediaConvert.
+
+    python benchmarks/transcodeBenchmark.py /path/to/broadcast.mp4 --duration 60
+    FFMPEG_BINARY=/opt/ffmpeg/ffmpeg python benchmarks/transcodeBenchmark.py in.mp4 segment --runs 3
+"""
+import argparse
+import glob
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ffmpegTranscoder  # noqa: E402
+import renditionLadder  # noqa: E402
+import timecode  # noqa: E402
+
+
+def build(ladder, input_path, start, duration):
+    return renditionLadder.build_job(
+        renditionLadder.get_template(ladder),
+        role="arn:aws:iam::000000000000:role/MediaConvertRole",
+        input_s3=input_path,
+        destinations={
+            "mp4": f"s3://bench-output/{ladder}/",
+            "thumbnail": f"s3://bench-destination/thumbnails/{ladder}/",
+            "hls": f"s3://bench-destination/{ladder}/hls/",
+        },
+        clipping=timecode.clip_range(start, duration),
+        user_metadata={"job": f"bench-{ladder}"},
+    )
+
+
+def output_bytes(root):
+    return sum(os.path.getsize(path) for path in glob.glob(os.path.join(root, "bench-*", "**"), recursive=True)
+               if os.path.isfile(path))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("input", help="local media file")
+    parser.add_argument("ladders", nargs="*", help="ladder names (default: all)")
+    parser.add_argument("--start", default="00:00:00")
+    parser.add_argument("--duration", default="30", help="seconds of input to encode")
+    parser.add_argument("--runs", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    seconds = timecode.to_seconds(args.duration)
+    print(f"| ladder | outputs | wall s (median of {args.runs}) | x realtime | output KB | error |")
+    print("|---|---:|---:|---:|---:|---|")
+    for ladder in args.ladders or list(renditionLadder.LADDERS):
+        job = build(ladder, os.path.abspath(args.input), args.start, args.duration)
+        outputs = sum(len(group["Outputs"]) for group in job["Settings"]["OutputGroups"])
+        walls, size, error = [], 0, ""
+        for _ in range(args.runs):
+            root = tempfile.mkdtemp(prefix="transcode-bench-")
+            try:
+                local = ffmpegTranscoder.FfmpegTranscoder(root=root, upload=False, workers=0)
+                started = time.perf_counter()
+                result = local.create_job(**job)["Job"]
+                walls.append(time.perf_counter() - started)
+                size = output_bytes(root)
+                error = result.get("ErrorMessage", "")
+            finally:
+                shutil.rmtree(root, ignore_errors=True)
+            if error:
+                break
+        wall = statistics.median(walls)
+        print(f"| {ladder} | {outputs} | {wall:.2f} | {seconds / wall:.1f} | {size // 1024} | {error} |")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,50 @@
+import encodeScheduler
+import jobTemplateRegistry
+import segmentLease
+import thumbnailIndex
+import virtualSegment
+
+# The single-job broadcast encode (HLS ladder plus interval thumbnails) submitted by
+# dev2streamlambda and by the backfill driver (backfillBroadcasts).
+
+
+def build(input_s3, broadcast_id, bucket, role, user_metadata=None, attempt=0):
+    output_prefix = f"{broadcast_id}/"
+    job_settings = jobTemplateRegistry.build_job(
+        "broadcast",
+        role=role,
+        input_s3=input_s3,
+        destinations={
+            "hls": f"s3://{bucket}/{broadcast_id}/hls/{output_prefix}",
+            "thumbnail": f"s3://{bucket}/{thumbnailIndex.thumbnail_prefix(broadcast_id)}",
+        },
+        user_metadata=dict(
+            user_metadata or {},
+            source=input_s3.split('/')[-1],
+            # broadcastIndexLambda flags the source's virtualSegment pointer ready from it
+            input=input_s3,
+            job=broadcast_id,
+            kind="broadcast",
+            thumbnail_interval=str(thumbnailIndex.THUMBNAIL_INTERVAL_SECONDS),
+        ),
+        thumbnail_interval=thumbnailIndex.THUMBNAIL_INTERVAL_SECONDS,
+    )
+    # Resubmitting the same broadcast returns the job already created for it; a retry after a
+    # failed job passes a new attempt to get a new job
+    job_settings["ClientRequestToken"] = segmentLease.idempotency_token(
+        f"broadcast:{broadcast_id}", job_settings, attempt
+    )
+    return job_settings
+
+
+def submit(input_s3, broadcast_id, bucket, role, encode_class=encodeScheduler.BROADCAST, user_metadata=None,
+           attempt=0):
+    # create_job response; raises encodeScheduler.EncodeBudgetExceeded when the class is at its budget
+    response = encodeScheduler.submit(
+        build(input_s3, broadcast_id, bucket, role, user_metadata, attempt), encode_class
+    )
+    # Lets segment requests for this source find the broadcast HLS and thumbnails once they are written
+    virtualSegment.record_broadcast_encode(
+        input_s3, broadcast_id, bucket=bucket, thumbnail_prefix=thumbnailIndex.thumbnail_prefix(broadcast_id)
+    )
+    return response
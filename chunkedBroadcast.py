@@ -0,0 +1,233 @@
+import json
+import math
+import os
+import posixpath
+
+from botocore.exceptions import ClientError
+
+import awsClients
+import encodeScheduler
+import hlsSegmentIndex
+import renditionLadder
+import segmentLease
+import thumbnailIndex
+import timecode
+import virtualSegment
+
+# Chunked broadcast encodes: the broadcast is split into InputClippings chunks that are
+# encoded as concurrent jobs, then the chunks' variant playlists are stitched into one set of
+# playlists and a master at the usual broadcast master key. Chunk boundaries fall on multiples
+# of the GOP, the HLS segment length and the thumbnail interval, and each chunk's TS timestamps
+# start at its offset in the broadcast, so segments join without discontinuities.
+# A chunk whose job ends in ERROR is resubmitted, under a new attempt, up to
+# BROADCAST_CHUNK_ATTEMPTS times in all; then the broadcast is marked failed.
+#
+# {broadcast}/hls/{broadcast}/chunks/plan.json   what was submitted, read back on each COMPLETE and ERROR
+# {broadcast}/hls/{broadcast}/chunks/000/...     chunk outputs
+# {broadcast}/hls/{broadcast}/chunks/failed.json the chunk that failed for good, and why
+# {broadcast}/hls/{broadcast}/<stem>.m3u8        stitched master (variants next to it)
+BROADCAST_CHUNKS = int(os.environ.get("BROADCAST_CHUNKS", "1"))
+# Chunks shorter than this cost more in job overhead than they save
+MIN_CHUNK_SECONDS = int(os.environ.get("BROADCAST_MIN_CHUNK_SECONDS", "300"))
+CHUNK_MAX_ATTEMPTS = int(os.environ.get("BROADCAST_CHUNK_ATTEMPTS", "3"))
+CHUNKS_DIR = "chunks/"
+PLAN_NAME = "plan.json"
+FAILED_NAME = "failed.json"
+MAX_SUBMIT_WORKERS = 16
+
+s3 = awsClients.client("s3")
+
+
+def boundary_seconds(thumbnail_interval=thumbnailIndex.THUMBNAIL_INTERVAL_SECONDS):
+    # Chunk lengths are multiples of this, so GOPs, HLS segments and captures all restart cleanly
+    gop = renditionLadder.H264_QVBR_SETTINGS["GopSize"]
+    segment = renditionLadder.HLS_GROUP_SETTINGS["SegmentLength"]
+    unit = math.lcm(int(gop), int(segment))
+    return math.lcm(unit, int(thumbnail_interval)) if thumbnail_interval else unit
+
+
+def plan_chunks(duration_seconds, chunks, unit=None):
+    # [(start seconds, end seconds or None for the last chunk)]
+    unit = unit or boundary_seconds()
+    length = max(MIN_CHUNK_SECONDS, duration_seconds / max(1, chunks))
+    length = max(1, round(length / unit)) * unit
+    # The remainder goes to the last chunk rather than into a sliver of its own
+    count = max(1, int(duration_seconds // length))
+    return [(i * length, (i + 1) * length if i < count - 1 else None) for i in range(count)]
+
+
+def broadcast_dir(broadcast_id, input_path):
+    return posixpath.dirname(virtualSegment.broadcast_master_key(broadcast_id, input_path)) + "/"
+
+
+def submit(input_path, broadcast_id, bucket, role, duration_seconds, chunks=BROADCAST_CHUNKS, user_metadata=None,
+           encode_class=encodeScheduler.BROADCAST):
+    # Job ids of the submitted chunk jobs, or None when the broadcast is too short to split
+    ranges = plan_chunks(duration_seconds, chunks)
+    if len(ranges) < 2:
+        return None
+    base_dir = broadcast_dir(broadcast_id, input_path)
+    thumbnail_prefix = thumbnailIndex.thumbnail_prefix(broadcast_id)
+    plan = {
+        "version": 2,
+        "broadcast_id": broadcast_id,
+        "input": input_path,
+        "bucket": bucket,
+        # What a failed chunk needs to be resubmitted from its ERROR event
+        "role": role,
+        "encode_class": encode_class,
+        "duration": duration_seconds,
+        "user_metadata": user_metadata or {},
+        "master": virtualSegment.broadcast_master_key(broadcast_id, input_path),
+        "thumbnails": thumbnail_prefix,
+        "thumbnail_interval": thumbnailIndex.THUMBNAIL_INTERVAL_SECONDS,
+        "chunks": [
+            {"start": start, "end": end, "prefix": f"{base_dir}{CHUNKS_DIR}{i:03d}/"}
+            for i, (start, end) in enumerate(ranges)
+        ],
+    }
+    plan_key = f"{base_dir}{CHUNKS_DIR}{PLAN_NAME}"
+    # Written first, so a chunk that finishes early can always find it
+    s3.put_object(Bucket=bucket, Key=plan_key, Body=json.dumps(plan).encode(), ContentType="application/json")
+
+    jobs = [chunk_job(plan, plan_key, i) for i in range(len(plan["chunks"]))]
+
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=min(MAX_SUBMIT_WORKERS, len(jobs))) as pool:
+        responses = list(pool.map(lambda args: encodeScheduler.submit(*args), jobs))
+    return [response["Job"]["Id"] for response in responses]
+
+
+def chunk_job(plan, plan_key, i, attempt=0):
+    # (job settings, encode class, seconds) of chunk i, as encodeScheduler.submit takes them.
+    # Chunks carry inline settings: the per-chunk PtsOffset cannot be set on a preset reference
+    chunk = plan["chunks"][i]
+    bucket = plan["bucket"]
+    start = timecode.Timecode.from_seconds(chunk["start"])
+    end = timecode.Timecode.from_seconds(chunk["end"]) if chunk["end"] is not None else None
+    job = renditionLadder.build_job(
+        renditionLadder.get_template("broadcast"), plan["role"], plan["input"],
+        destinations={
+            "hls": f"s3://{bucket}/{chunk['prefix']}",
+            "thumbnail": f"s3://{bucket}/{plan['thumbnails']}chunk-{i:03d}/",
+        },
+        clipping=(str(start), str(end) if end is not None else None),
+        user_metadata=dict(
+            plan["user_metadata"],
+            kind="broadcast_chunk",
+            job=plan["broadcast_id"],
+            chunk=str(i),
+            chunk_attempt=str(attempt),
+            chunk_plan=f"s3://{bucket}/{plan_key}",
+            thumbnail_interval=str(plan["thumbnail_interval"]),
+        ),
+        thumbnail_interval=plan["thumbnail_interval"],
+        hls_pts_offset=chunk["start"],
+    )
+    # Retried invocations resubmit the same chunks, which the token deduplicates; a resubmission
+    # after an ERROR is a new attempt and so a new job
+    job["ClientRequestToken"] = segmentLease.idempotency_token(f"{plan['broadcast_id']}:chunk:{i}", job, attempt)
+    return job, plan["encode_class"], (chunk["end"] or plan["duration"]) - chunk["start"]
+
+
+def on_chunk_error(user_metadata, error=None):
+    # Resubmits a failed chunk and returns its new job id, or marks the broadcast failed and
+    # returns None once the chunk has used its attempts. Raises EncodeBudgetExceeded when the
+    # class has no free slot, so the event is retried rather than the chunk given up on
+    bucket, plan_key = _plan_location(user_metadata)
+    plan = json.loads(_get_text(bucket, plan_key))
+    i = int(user_metadata["chunk"])
+    attempt = int(user_metadata.get("chunk_attempt") or 0) + 1
+    if attempt >= CHUNK_MAX_ATTEMPTS or "role" not in plan:
+        # Plans written before version 2 do not carry what a resubmission needs
+        mark_failed(plan, plan_key, i, error)
+        return None
+    job, encode_class, seconds = chunk_job(plan, plan_key, i, attempt)
+    print(f"Chunk {i} of {plan['broadcast_id']} failed ({error}), resubmitting as attempt {attempt + 1}")
+    return encodeScheduler.submit(job, encode_class, seconds)["Job"]["Id"]
+
+
+def mark_failed(plan, plan_key, chunk, error=None):
+    # The broadcast will not be stitched; record which chunk failed, for operators and failed()
+    key = posixpath.join(posixpath.dirname(plan_key), FAILED_NAME)
+    record = {"broadcast_id": plan["broadcast_id"], "chunk": chunk, "error": error}
+    s3.put_object(Bucket=plan["bucket"], Key=key, Body=json.dumps(record).encode(), ContentType="application/json")
+    print(f"Broadcast {plan['broadcast_id']} failed: chunk {chunk} gave up ({error})")
+    return key
+
+
+def failed(user_metadata):
+    # The failed.json record of a chunk's broadcast, or None while it can still complete
+    bucket, plan_key = _plan_location(user_metadata)
+    key = posixpath.join(posixpath.dirname(plan_key), FAILED_NAME)
+    try:
+        return json.loads(_get_text(bucket, key))
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("NoSuchKey", "404", "NotFound"):
+            return None
+        raise
+
+
+def on_chunk_complete(user_metadata):
+    # Stitches once every chunk's master exists; returns the plan when the broadcast is complete
+    bucket, plan_key = _plan_location(user_metadata)
+    plan = json.loads(_get_text(bucket, plan_key))
+    stem = posixpath.basename(plan["master"])
+    for chunk in plan["chunks"]:
+        if not _exists(bucket, chunk["prefix"] + stem):
+            return None
+    stitch(plan)
+    return plan
+
+
+def stitch(plan):
+    # Concatenates each rendition's chunk playlists; the master is written last
+    bucket, master_key = plan["bucket"], plan["master"]
+    base_dir = posixpath.dirname(master_key)
+    stem = posixpath.basename(master_key)
+    first_master = _get_text(bucket, plan["chunks"][0]["prefix"] + stem)
+
+    for _, variant in hlsSegmentIndex.parse_master_playlist(first_master):
+        entries = []
+        for chunk in plan["chunks"]:
+            relative = posixpath.relpath(chunk["prefix"].rstrip("/"), base_dir)
+            text = _get_text(bucket, chunk["prefix"] + variant)
+            entries += [(duration, f"{relative}/{uri}") for duration, uri in hlsSegmentIndex.parse_media_playlist(text)]
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:3",
+            f"#EXT-X-TARGETDURATION:{math.ceil(max(duration for duration, _ in entries))}",
+            "#EXT-X-MEDIA-SEQUENCE:1",
+            "#EXT-X-PLAYLIST-TYPE:VOD",
+        ]
+        for duration, uri in entries:
+            lines += [f"#EXTINF:{duration:.3f},", uri]
+        lines.append("#EXT-X-ENDLIST")
+        _put_playlist(bucket, posixpath.join(base_dir, variant), "\n".join(lines) + "\n")
+    # Variant names are the same in every chunk, so the first chunk's master serves as is
+    _put_playlist(bucket, master_key, first_master)
+    return master_key
+
+
+def _plan_location(user_metadata):
+    # (bucket, plan key) from a chunk job's UserMetadata
+    bucket, _, plan_key = user_metadata["chunk_plan"][len("s3://"):].partition("/")
+    return bucket, plan_key
+
+
+def _exists(bucket, key):
+    try:
+        s3.head_object(Bucket=bucket, Key=key)
+        return True
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("NoSuchKey", "404", "NotFound"):
+            return False
+        raise
+
+
+def _get_text(bucket, key):
+    return s3.get_object(Bucket=bucket, Key=key)["Body"].read().decode("utf-8")
+
+
+def _put_playlist(bucket, key, body):
+    s3.put_object(Bucket=bucket, Key=key, Body=body.encode("utf-8"), ContentType="application/vnd.apple.mpegurl")
@@ -0,0 +1,245 @@
+"""Route encodes by class to MediaConvert queues and priorities within per-class in-flight budgets.
+
+    python encodeScheduler.py status        in-flight slots per class
+    python encodeScheduler.py reap          free slots whose jobs have finished (lost events)
+"""
+import os
+import random
+import sys
+import time
+import uuid
+
+from botocore.exceptions import ClientError
+
+import awsClients
+import transcoder
+
+# Every create_job is tagged with an encode class. A class names its MediaConvert queue
+# (ENCODE_<CLASS>_QUEUE; unset means the default queue, where Priority alone orders jobs), a
+# Priority (-50..50), an in-flight budget (ENCODE_<CLASS>_BUDGET; 0 is unlimited) and whether
+# long clips may use accelerated transcoding. Budgets keep bulk work from taking the account's
+# concurrent-job capacity that user-waiting segments need.
+#
+# A budget of N is N lease slots per class in ENCODE_SLOTS_TABLE, taken with a conditional
+# write like segmentLease; segmentJobEventsLambda frees a job's slot on its final state change.
+# A slot whose event never arrives expires after SLOT_LEASE_SECONDS.
+INTERACTIVE = "interactive"   # a user is waiting on /stream
+PREFETCH = "prefetch"         # segments encoded ahead of a request
+BROADCAST = "broadcast"       # whole-broadcast ingest
+BACKFILL = "backfill"         # archive re-encodes
+
+ENCODE_SLOTS_TABLE = os.environ.get("ENCODE_SLOTS_TABLE", "tvna-encode-slots")
+SLOT_LEASE_SECONDS = int(os.environ.get("ENCODE_SLOT_LEASE_SECONDS", "21600"))
+RECORD_TTL_SECONDS = 86400
+# Accelerated transcoding starts slower and bills at a premium; it only pays off on long inputs
+ACCELERATION_MIN_SECONDS = float(os.environ.get("ACCELERATION_MIN_SECONDS", "300"))
+TERMINAL_STATUSES = ("COMPLETE", "ERROR", "CANCELED")
+
+dynamodb = awsClients.resource("dynamodb")
+
+
+class EncodeBudgetExceeded(Exception):
+    # Every slot of the class is taken; async invocations are retried by Lambda later
+
+    def __init__(self, encode_class, budget):
+        super().__init__(f"{encode_class} encodes at their in-flight budget of {budget}")
+        self.encode_class = encode_class
+        self.budget = budget
+
+
+class EncodeClass:
+    __slots__ = ("name", "queue", "priority", "budget", "accelerate")
+
+    def __init__(self, name, priority, budget, accelerate):
+        prefix = f"ENCODE_{name.upper()}"
+        self.name = name
+        self.queue = os.environ.get(f"{prefix}_QUEUE", "")
+        self.priority = int(os.environ.get(f"{prefix}_PRIORITY", priority))
+        self.budget = int(os.environ.get(f"{prefix}_BUDGET", budget))
+        self.accelerate = accelerate
+
+
+ENCODE_CLASSES = {
+    INTERACTIVE: EncodeClass(INTERACTIVE, priority=50, budget=0, accelerate=True),
+    PREFETCH: EncodeClass(PREFETCH, priority=10, budget=20, accelerate=False),
+    BROADCAST: EncodeClass(BROADCAST, priority=0, budget=10, accelerate=True),
+    # Nobody waits on a backfill, so it never pays for acceleration
+    BACKFILL: EncodeClass(BACKFILL, priority=-50, budget=4, accelerate=False),
+}
+
+
+def get_class(name):
+    try:
+        return ENCODE_CLASSES[name]
+    except KeyError:
+        raise ValueError(f"Unknown encode class: {name}") from None
+
+
+def acceleration_mode(encode_class, clip_seconds=None):
+    # Unknown durations count as long: only whole-input jobs leave them out
+    if not get_class(encode_class).accelerate:
+        return "DISABLED"
+    if clip_seconds is not None and clip_seconds < ACCELERATION_MIN_SECONDS:
+        return "DISABLED"
+    return "PREFERRED"
+
+
+def route(job_settings, encode_class, clip_seconds=None):
+    # Copy of create_job settings with the class's queue, priority and acceleration
+    settings = get_class(encode_class)
+    job = dict(job_settings)
+    job["Priority"] = settings.priority
+    job["AccelerationSettings"] = {"Mode": acceleration_mode(encode_class, clip_seconds)}
+    if settings.queue:
+        job["Queue"] = settings.queue
+    job["UserMetadata"] = dict(job.get("UserMetadata") or {}, encode_class=encode_class)
+    return job
+
+
+def submit(job_settings, encode_class, clip_seconds=None):
+    # transcoder.create_job within the class's budget; raises EncodeBudgetExceeded when it is spent
+    job = route(job_settings, encode_class, clip_seconds)
+    # A resubmission with the same ClientRequestToken finds the slot it already holds
+    holder = job.get("ClientRequestToken") or str(uuid.uuid4())
+    slot = acquire(encode_class, holder)
+    if slot is not None:
+        job["UserMetadata"].update(encode_slot=str(slot), encode_holder=holder)
+    try:
+        response = transcoder.create_job(**job)
+    except Exception:
+        if slot is not None:
+            release(encode_class, slot, holder)
+        raise
+    if slot is not None:
+        _record_job(encode_class, slot, holder, response["Job"]["Id"])
+    return response
+
+
+def acquire(encode_class, holder):
+    # Slot number now held by holder, or None for an unlimited class
+    budget = get_class(encode_class).budget
+    if budget <= 0:
+        return None
+    now = int(time.time())
+    taken = set()
+    for item in _slots(encode_class):
+        if item.get("holder") == holder:
+            return int(item["slot"])
+        if item.get("lease_expires", 0) >= now:
+            taken.add(int(item["slot"]))
+    free = [slot for slot in range(budget) if slot not in taken]
+    # Random order spreads concurrent submitters over different slots
+    random.shuffle(free)
+    table = dynamodb.Table(ENCODE_SLOTS_TABLE)
+    for slot in free:
+        try:
+            table.put_item(
+                Item={
+                    "encode_class": encode_class,
+                    "slot": slot,
+                    "holder": holder,
+                    "lease_expires": now + SLOT_LEASE_SECONDS,
+                    "expires_at": now + SLOT_LEASE_SECONDS + RECORD_TTL_SECONDS,
+                },
+                ConditionExpression="attribute_not_exists(slot) OR lease_expires < :now",
+                ExpressionAttributeValues={":now": now}
+            )
+            return slot
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+    raise EncodeBudgetExceeded(encode_class, budget)
+
+
+def release(encode_class, slot, holder):
+    # False when the slot was already freed or taken over (repeated or late events)
+    try:
+        dynamodb.Table(ENCODE_SLOTS_TABLE).delete_item(
+            Key={"encode_class": encode_class, "slot": int(slot)},
+            ConditionExpression="holder = :holder",
+            ExpressionAttributeValues={":holder": holder}
+        )
+        return True
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+        return False
+
+
+def apply_event(event):
+    # Frees the job's slot on its final MediaConvert state change; True when a slot was freed
+    detail = event.get("detail", {})
+    return release_job(detail.get("status"), detail.get("userMetadata", {}))
+
+
+def release_job(status, user_metadata):
+    # Same, from a job's status and UserMetadata (e.g. a list_jobs entry)
+    if status not in TERMINAL_STATUSES or "encode_slot" not in user_metadata:
+        return False
+    return release(user_metadata["encode_class"], user_metadata["encode_slot"], user_metadata["encode_holder"])
+
+
+def in_flight(encode_class):
+    # Slots of the class whose lease has not expired
+    now = int(time.time())
+    return [item for item in _slots(encode_class) if item.get("lease_expires", 0) >= now]
+
+
+def reap(encode_class):
+    # Frees slots whose job has finished; returns how many
+    freed = 0
+    for item in in_flight(encode_class):
+        if not item.get("job_id"):
+            continue
+        try:
+            status = transcoder.get_job(item["job_id"])["Job"]["Status"]
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in ("NotFoundException", "404"):
+                raise
+            status = "CANCELED"
+        if status in TERMINAL_STATUSES and release(encode_class, item["slot"], item["holder"]):
+            freed += 1
+    return freed
+
+
+def _slots(encode_class):
+    table = dynamodb.Table(ENCODE_SLOTS_TABLE)
+    kwargs = {
+        "KeyConditionExpression": "encode_class = :encode_class",
+        "ExpressionAttributeValues": {":encode_class": encode_class},
+        "ConsistentRead": True,
+    }
+    items = []
+    while True:
+        response = table.query(**kwargs)
+        items += response.get("Items", [])
+        if "LastEvaluatedKey" not in response:
+            return items
+        kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+def _record_job(encode_class, slot, holder, job_id):
+    try:
+        dynamodb.Table(ENCODE_SLOTS_TABLE).update_item(
+            Key={"encode_class": encode_class, "slot": slot},
+            UpdateExpression="SET job_id = :job_id",
+            ConditionExpression="holder = :holder",
+            ExpressionAttributeValues={":job_id": job_id, ":holder": holder}
+        )
+    except ClientError as e:
+        # The job already finished and freed its slot
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in ("status", "reap"):
+        sys.exit(f"usage: {sys.argv[0]} status|reap [class ...]")
+    for name in sys.argv[2:] or list(ENCODE_CLASSES):
+        settings = get_class(name)
+        if sys.argv[1] == "reap":
+            print(name, "freed", reap(name))
+        else:
+            budget = settings.budget or "unlimited"
+            print(f"{name}: {len(in_flight(name))}/{budget} in flight, queue={settings.queue or 'Default'} "
+                  f"priority={settings.priority}")
@@ -0,0 +1,152 @@
+import os
+import time
+from bisect import bisect_right
+from collections import OrderedDict
+
+import awsClients
+import hlsSegmentIndex
+import timecode
+import transcoder
+
+# Every finished HLS encode of a source, segment or whole broadcast, as a time range of that
+# source: one ENCODED_RANGES_TABLE item per encode under the source's input_s3. A request whose
+# range lies inside an earlier encode is served by virtualSegment as trimmed playlists over that
+# encode's TS files, so overlapping and nested segment requests don't start new jobs.
+#
+# Per source, the ranges are held in memory as an interval index (ranges sorted by start plus
+# the running maximum of their ends), so "which encode covers [start, end]" is one bisect.
+ENCODED_RANGES_TABLE = os.environ.get("ENCODED_RANGES_TABLE", "tvna-encoded-ranges")
+RANGES_CACHE_SIZE = int(os.environ.get("ENCODED_RANGES_CACHE_SIZE", "256"))
+# Newly recorded encodes elsewhere show up here after at most this long
+RANGES_CACHE_TTL_SECONDS = int(os.environ.get("ENCODED_RANGES_CACHE_TTL_SECONDS", "60"))
+# Frame rounding leaves an encode's playlist a few milliseconds short of the clip it was given
+COVER_TOLERANCE_SECONDS = 0.05
+
+dynamodb = awsClients.resource("dynamodb")
+
+_cache = OrderedDict()
+
+
+class EncodedRange:
+    __slots__ = ("start", "end", "bucket", "master_key")
+
+    def __init__(self, start, end, bucket, master_key):
+        # Seconds of the source
+        self.start = start
+        self.end = end
+        self.bucket = bucket
+        self.master_key = master_key
+
+
+class RangeIndex:
+    __slots__ = ("ranges", "starts", "reach")
+
+    def __init__(self, ranges):
+        self.ranges = sorted(ranges, key=lambda r: (r.start, -r.end))
+        self.starts = [r.start for r in self.ranges]
+        # reach[i]: index of the range ending latest among ranges[:i + 1]
+        self.reach = []
+        best = None
+        for i, encoded in enumerate(self.ranges):
+            if best is None or encoded.end > self.ranges[best].end:
+                best = i
+            self.reach.append(best)
+
+    def covering(self, start, end):
+        # An encode containing [start, end], or None
+        i = bisect_right(self.starts, start + COVER_TOLERANCE_SECONDS) - 1
+        if i < 0:
+            return None
+        encoded = self.ranges[self.reach[i]]
+        return encoded if encoded.end + COVER_TOLERANCE_SECONDS >= end else None
+
+
+def find_covering(input_path, start_seconds, duration_seconds):
+    return _load(input_path).covering(start_seconds, start_seconds + duration_seconds)
+
+
+def record(input_path, start_seconds, bucket, master_key):
+    # Adds a finished encode whose HLS starts at start_seconds of the source; its end comes
+    # from the encode's own playlists (and building their index warms it for later slicing)
+    index = hlsSegmentIndex.load_index(bucket, master_key)
+    if index is None or not index.renditions:
+        return None
+    end_seconds = start_seconds + min(rendition.starts[-1] for rendition in index.renditions)
+    start_ms, end_ms = int(round(start_seconds * 1000)), int(end_seconds * 1000)
+    dynamodb.Table(ENCODED_RANGES_TABLE).put_item(Item={
+        "input_s3": input_path,
+        # Unique per encode, and ordered by start within the source
+        "range_id": f"{start_ms:012d}:{end_ms:012d}:{bucket}/{master_key}",
+        "start_ms": start_ms,
+        "end_ms": end_ms,
+        "bucket": bucket,
+        "master_key": master_key,
+        "recorded_at": int(time.time()),
+    })
+    encoded = EncodedRange(start_ms / 1000, end_ms / 1000, bucket, master_key)
+    cached = _cache.get(input_path)
+    if cached is not None:
+        _remember(input_path, RangeIndex(cached[1].ranges + [encoded]))
+    return encoded
+
+
+def record_job(detail):
+    # Records the HLS outputs of a COMPLETE job event; the source and clipping come from the job
+    masters = [
+        path for group in detail.get("outputGroupDetails", []) if group.get("type") == "HLS_GROUP"
+        for path in group.get("playlistFilePaths", [])
+    ]
+    if not masters:
+        return []
+    inputs = transcoder.get_job(detail["jobId"])["Job"]["Settings"].get("Inputs", [])
+    # Stitched or multi-input jobs don't map onto one range of one source
+    if len(inputs) != 1 or len(inputs[0].get("InputClippings", [])) > 1:
+        return []
+    clippings = inputs[0].get("InputClippings") or [{}]
+    start = _label_seconds(clippings[0].get("StartTimecode"))
+    recorded = []
+    for path in masters:
+        bucket, master_key = path[len("s3://"):].split("/", 1)
+        encoded = record(inputs[0]["FileInput"], start, bucket, master_key)
+        if encoded:
+            recorded.append(encoded)
+    return recorded
+
+
+def _label_seconds(label):
+    if not label:
+        return 0.0
+    rate = timecode.FPS_2997_DF if ";" in label else timecode.FPS_30
+    return timecode.Timecode.parse(label, rate).seconds
+
+
+def _load(input_path):
+    cached = _cache.get(input_path)
+    if cached is not None and time.time() - cached[0] < RANGES_CACHE_TTL_SECONDS:
+        _cache.move_to_end(input_path)
+        return cached[1]
+    table = dynamodb.Table(ENCODED_RANGES_TABLE)
+    kwargs = {
+        "KeyConditionExpression": "input_s3 = :input_s3",
+        "ExpressionAttributeValues": {":input_s3": input_path},
+    }
+    ranges = []
+    while True:
+        response = table.query(**kwargs)
+        ranges += [
+            EncodedRange(int(item["start_ms"]) / 1000, int(item["end_ms"]) / 1000,
+                         item["bucket"], item["master_key"])
+            for item in response.get("Items", [])
+        ]
+        if "LastEvaluatedKey" not in response:
+            break
+        kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+    return _remember(input_path, RangeIndex(ranges))
+
+
+def _remember(input_path, index):
+    _cache[input_path] = (time.time(), index)
+    _cache.move_to_end(input_path)
+    while len(_cache) > RANGES_CACHE_SIZE:
+        _cache.popitem(last=False)
+    return index
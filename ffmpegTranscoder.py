@@ -0,0 +1,459 @@
+"""Local ffmpeg implementation of the transcoder interface (TRANSCODER=ffmpeg).
+
+Covers the subset of MediaConvert job settings this pipeline builds: one file input with
+optional InputClippings, HLS groups of H.264/AAC outputs (variant playlists plus a master),
+MP4 file groups and FRAME_CAPTURE outputs. Outputs keep MediaConvert's naming
+(<destination><input stem><NameModifier>.<ext>, TS segments _00001.ts, captures .0000000.jpg).
+
+s3://bucket/key maps to LOCAL_MEDIA_ROOT/bucket/key. With LOCAL_TRANSCODER_UPLOAD=true, missing
+inputs are downloaded and outputs uploaded through the S3 client, so pointing AWS_ENDPOINT_URL
+at a local S3 stand-in (MinIO, moto) serves the rest of the pipeline unchanged.
+
+Jobs run on LOCAL_TRANSCODER_WORKERS threads (0 runs them inside create_job), one ffmpeg
+process per job so the input is decoded once for all outputs. Each job emits the EventBridge
+"MediaConvert Job State Change" events a real job would, to the listeners passed in and to the
+lambda_handler of every module named in LOCAL_TRANSCODER_EVENT_HANDLERS, e.g.
+"segmentJobEventsLambda,broadcastIndexLambda".
+"""
+import glob
+import importlib
+import os
+import subprocess
+import threading
+import time
+import uuid
+
+from botocore.exceptions import ClientError
+
+import awsClients
+import timecode
+from transcoder import Transcoder
+
+FFMPEG_BINARY = os.environ.get("FFMPEG_BINARY", "ffmpeg")
+LOCAL_MEDIA_ROOT = os.environ.get("LOCAL_MEDIA_ROOT", "/tmp/tvna-media")
+LOCAL_TRANSCODER_UPLOAD = os.environ.get("LOCAL_TRANSCODER_UPLOAD", "false").lower() == "true"
+LOCAL_TRANSCODER_WORKERS = int(os.environ.get("LOCAL_TRANSCODER_WORKERS", "1"))
+EVENT_HANDLERS = [name for name in os.environ.get("LOCAL_TRANSCODER_EVENT_HANDLERS", "").split(",") if name]
+X264_PRESET = os.environ.get("LOCAL_X264_PRESET", "veryfast")
+
+_PROFILES = {"BASELINE": ("baseline", "avc1.42e01f"), "MAIN": ("main", "avc1.4d401f"), "HIGH": ("high", "avc1.64001f")}
+_CHANNELS = {"CODING_MODE_1_0": 1, "CODING_MODE_2_0": 2}
+_CONTENT_TYPES = {".m3u8": "application/vnd.apple.mpegurl", ".ts": "video/MP2T", ".mp4": "video/mp4", ".jpg": "image/jpeg"}
+
+s3 = awsClients.client("s3")
+
+
+class LocalJob:
+    __slots__ = ("id", "status", "settings", "user_metadata", "created_at", "error", "plan", "done")
+
+    def __init__(self, job_id, settings, user_metadata):
+        self.id = job_id
+        self.status = "SUBMITTED"
+        self.settings = settings
+        self.user_metadata = user_metadata
+        self.created_at = time.time()
+        self.error = None
+        self.plan = None
+        self.done = threading.Event()
+
+    def describe(self):
+        job = {
+            "Id": self.id,
+            "Status": self.status,
+            "CreatedAt": self.created_at,
+            "Settings": self.settings,
+            "UserMetadata": self.user_metadata,
+        }
+        if self.error:
+            job["ErrorMessage"] = self.error
+        return job
+
+
+class Plan:
+    # One ffmpeg command for a job, plus what it writes
+    __slots__ = ("args", "masters", "groups")
+
+    def __init__(self):
+        self.args = []
+        # (local path, uri, [(output settings, RFC 4281 codecs, variant name)])
+        self.masters = []
+        # (type, [(uri, local path, glob of every file the output writes)])
+        self.groups = []
+
+
+class FfmpegTranscoder(Transcoder):
+
+    def __init__(self, root=LOCAL_MEDIA_ROOT, upload=LOCAL_TRANSCODER_UPLOAD, workers=LOCAL_TRANSCODER_WORKERS,
+                 listeners=(), ffmpeg=FFMPEG_BINARY):
+        self.root = root
+        self.upload = upload
+        self.ffmpeg = ffmpeg
+        self.listeners = list(listeners) + [_handler_listener(name) for name in EVENT_HANDLERS]
+        self.jobs = {}
+        self._tokens = {}
+        self._lock = threading.Lock()
+        self._pool = None
+        if workers:
+            from concurrent.futures import ThreadPoolExecutor
+            self._pool = ThreadPoolExecutor(max_workers=workers)
+
+    def create_job(self, **job):
+        if "JobTemplate" in job:
+            raise ValueError("The ffmpeg transcoder needs inline settings; jobTemplateRegistry submits "
+                             "them when TRANSCODER=ffmpeg")
+        token = job.get("ClientRequestToken")
+        with self._lock:
+            if token and token in self._tokens:
+                return {"Job": self.jobs[self._tokens[token]].describe()}
+            local_job = LocalJob(f"{int(time.time() * 1000)}-{uuid.uuid4().hex[:6]}",
+                                 job["Settings"], job.get("UserMetadata", {}))
+            self.jobs[local_job.id] = local_job
+            if token:
+                self._tokens[token] = local_job.id
+        if self._pool:
+            self._pool.submit(self.run, local_job)
+        else:
+            self.run(local_job)
+        return {"Job": local_job.describe()}
+
+    def get_job(self, Id):
+        local_job = self.jobs.get(Id)
+        if local_job is None:
+            raise ClientError({"Error": {"Code": "NotFoundException", "Message": f"Job {Id} not found"}}, "GetJob")
+        return {"Job": local_job.describe()}
+
+    def list_jobs(self, MaxResults=20, NextToken=None, Order="DESCENDING", Status=None, Queue=None):
+        # Every local job runs on one queue, so Queue is accepted and ignored
+        jobs = sorted(self.jobs.values(), key=lambda job: job.created_at, reverse=Order == "DESCENDING")
+        if Status:
+            jobs = [job for job in jobs if job.status == Status]
+        start = int(NextToken or 0)
+        response = {"Jobs": [job.describe() for job in jobs[start:start + MaxResults]]}
+        if start + MaxResults < len(jobs):
+            response["NextToken"] = str(start + MaxResults)
+        return response
+
+    def wait(self, job_id, timeout=None):
+        local_job = self.jobs[job_id]
+        local_job.done.wait(timeout)
+        return local_job.describe()
+
+    def run(self, local_job):
+        local_job.status = "PROGRESSING"
+        self._emit(local_job)
+        try:
+            local_job.plan = plan_job(local_job.settings, self.root, self.ffmpeg)
+            self._fetch_input(local_job.settings)
+            for _, uri, _ in local_job.plan.masters:
+                os.makedirs(os.path.dirname(local_path(uri, self.root)), exist_ok=True)
+            for _, outputs in local_job.plan.groups:
+                for _, path, _ in outputs:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+            subprocess.run(local_job.plan.args, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            for path, _, variants in local_job.plan.masters:
+                write_master(path, variants)
+            if self.upload:
+                self._upload(local_job.plan)
+            local_job.status = "COMPLETE"
+        except subprocess.CalledProcessError as e:
+            # ffmpeg's last stderr line is the reason
+            local_job.status = "ERROR"
+            local_job.error = (e.stderr.decode("utf-8", "replace").strip().splitlines() or [str(e)])[-1]
+        except (ClientError, OSError, ValueError, KeyError) as e:
+            local_job.status = "ERROR"
+            local_job.error = f"{type(e).__name__}: {e}"
+        self._emit(local_job)
+        local_job.done.set()
+        return local_job
+
+    def _fetch_input(self, settings):
+        uri = settings["Inputs"][0]["FileInput"]
+        path = local_path(uri, self.root)
+        if self.upload and uri.startswith("s3://") and not os.path.exists(path):
+            bucket, key = _split_s3(uri)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            s3.download_file(bucket, key, path)
+
+    def _upload(self, plan):
+        written = [(path, uri) for path, uri, _ in plan.masters]
+        for _, outputs in plan.groups:
+            for uri, path, pattern in outputs:
+                for file_path in glob.glob(pattern):
+                    written.append((file_path, _sibling_uri(uri, path, file_path)))
+        for file_path, uri in written:
+            if not uri.startswith("s3://"):
+                continue
+            bucket, key = _split_s3(uri)
+            content_type = _CONTENT_TYPES.get(os.path.splitext(file_path)[1], "application/octet-stream")
+            s3.upload_file(file_path, bucket, key, ExtraArgs={"ContentType": content_type})
+
+    def _emit(self, local_job):
+        if not self.listeners:
+            return
+        event = job_state_event(local_job)
+        for listener in self.listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                # Event delivery never fails the job, as with EventBridge
+                print(f"Job event listener failed for {local_job.id}: {e}")
+
+
+def plan_job(settings, root=LOCAL_MEDIA_ROOT, ffmpeg=FFMPEG_BINARY):
+    inputs = settings.get("Inputs") or []
+    if len(inputs) != 1:
+        raise ValueError("The ffmpeg transcoder supports exactly one input")
+    job_input = inputs[0]
+    stem = os.path.splitext(job_input["FileInput"].rstrip("/").split("/")[-1])[0]
+
+    plan = Plan()
+    plan.args = [ffmpeg, "-hide_banner", "-nostdin", "-y"]
+    for clipping in job_input.get("InputClippings", [])[:1]:
+        if clipping.get("StartTimecode"):
+            plan.args += ["-ss", f"{timecode.Timecode.parse(clipping['StartTimecode']).seconds:.3f}"]
+        if clipping.get("EndTimecode"):
+            plan.args += ["-to", f"{timecode.Timecode.parse(clipping['EndTimecode']).seconds:.3f}"]
+    plan.args += ["-i", local_path(job_input["FileInput"], root)]
+
+    for group in settings["OutputGroups"]:
+        group_settings = group["OutputGroupSettings"]
+        if group_settings["Type"] == "HLS_GROUP_SETTINGS":
+            _plan_hls(plan, group, group_settings["HlsGroupSettings"], stem, root)
+        elif group_settings["Type"] == "FILE_GROUP_SETTINGS":
+            _plan_file_group(plan, group, group_settings["FileGroupSettings"], stem, root)
+        else:
+            raise ValueError(f"Unsupported output group: {group_settings['Type']}")
+    return plan
+
+
+def _plan_hls(plan, group, hls, stem, root):
+    base = _base(hls["Destination"], stem)
+    segment_length = hls.get("SegmentLength", 10)
+    variants = []
+    outputs = []
+    for output in group["Outputs"]:
+        name = base + output.get("NameModifier", "")
+        path = local_path(name, root)
+        video = output["VideoDescription"]
+        plan.args += _streams(output) + video_args(video, segment_length) + audio_args(output.get("AudioDescriptions"))
+        m3u8 = output.get("ContainerSettings", {}).get("M3u8Settings", {})
+        if m3u8.get("PtsOffsetMode") == "SECONDS":
+            plan.args += ["-output_ts_offset", str(m3u8.get("PtsOffset", 0))]
+        plan.args += ["-f", "hls", "-hls_time", str(segment_length), "-hls_playlist_type", "vod",
+                      "-start_number", "1", "-hls_segment_filename", f"{path}_%05d.ts", f"{path}.m3u8"]
+        variants.append((output, hls.get("CodecSpecification") == "RFC_4281", os.path.basename(path) + ".m3u8"))
+        outputs.append((name + ".m3u8", path + ".m3u8", glob.escape(path) + ".m3u8"))
+        outputs.append((name + "_00001.ts", path + "_00001.ts", glob.escape(path) + "_[0-9][0-9][0-9][0-9][0-9].ts"))
+    plan.masters.append((local_path(base + ".m3u8", root), base + ".m3u8", variants))
+    plan.groups.append(("HLS_GROUP", outputs))
+
+
+def _plan_file_group(plan, group, file_group, stem, root):
+    base = _base(file_group["Destination"], stem)
+    outputs = []
+    for output in group["Outputs"]:
+        name = base + output.get("NameModifier", "")
+        path = local_path(name, root)
+        container = output.get("ContainerSettings", {}).get("Container", "MP4")
+        video = output["VideoDescription"]
+        if container == "RAW" and video["CodecSettings"]["Codec"] == "FRAME_CAPTURE":
+            plan.args += ["-map", "0:v:0"] + capture_args(video) + [f"{path}.%07d.jpg"]
+            outputs.append((name + ".0000000.jpg", path + ".0000000.jpg", glob.escape(path) + ".[0-9]*.jpg"))
+        elif container == "MP4":
+            plan.args += _streams(output) + video_args(video) + audio_args(output.get("AudioDescriptions"))
+            plan.args += ["-movflags", "+faststart", f"{path}.mp4"]
+            outputs.append((name + ".mp4", path + ".mp4", glob.escape(path) + ".mp4"))
+        else:
+            raise ValueError(f"Unsupported file group container: {container}")
+    plan.groups.append(("FILE_GROUP", outputs))
+
+
+def video_args(video, segment_length=None):
+    codec = video["CodecSettings"]
+    if codec["Codec"] == "PASSTHROUGH":
+        # Stream copy; an input -ss before -i already starts on the preceding keyframe
+        return ["-c:v", "copy"]
+    if codec["Codec"] != "H_264":
+        raise ValueError(f"Unsupported video codec: {codec['Codec']}")
+    h264 = codec.get("H264Settings", {})
+    args = ["-c:v", "libx264", "-preset", X264_PRESET, "-pix_fmt", "yuv420p"]
+    profile = _PROFILES.get(h264.get("CodecProfile"))
+    if profile:
+        args += ["-profile:v", profile[0]]
+    args += _scale(video)
+
+    max_bitrate = h264.get("MaxBitrate")
+    if h264.get("RateControlMode", "QVBR") == "QVBR":
+        # QVBR quality 1-10 onto x264 CRF 35-17 (MediaConvert's default level 7 -> CRF 23)
+        args += ["-crf", str(37 - 2 * h264.get("QvbrSettings", {}).get("QvbrQualityLevel", 7))]
+        if max_bitrate:
+            args += ["-maxrate", str(max_bitrate), "-bufsize", str(h264.get("HrdBufferSize") or 2 * max_bitrate)]
+    else:
+        bitrate = h264.get("Bitrate") or max_bitrate
+        args += ["-b:v", str(bitrate)]
+        if h264["RateControlMode"] == "CBR":
+            args += ["-minrate", str(bitrate), "-maxrate", str(bitrate), "-bufsize", str(h264.get("HrdBufferSize") or 2 * bitrate)]
+        elif max_bitrate:
+            args += ["-maxrate", str(max_bitrate), "-bufsize", str(h264.get("HrdBufferSize") or 2 * max_bitrate)]
+
+    # Keyframes on the GOP (or HLS segment) boundaries so segments cut where MediaConvert's do
+    gop_seconds = h264.get("GopSize") if h264.get("GopSizeUnits") == "SECONDS" else None
+    if gop_seconds or segment_length:
+        args += ["-force_key_frames", f"expr:gte(t,n_forced*{gop_seconds or segment_length})", "-sc_threshold", "0"]
+    elif h264.get("GopSize"):
+        args += ["-g", str(int(h264["GopSize"]))]
+    return args
+
+
+def audio_args(descriptions):
+    if not descriptions:
+        return ["-an"]
+    codec = descriptions[0]["CodecSettings"]
+    if codec["Codec"] == "PASSTHROUGH":
+        return ["-c:a", "copy"]
+    if codec["Codec"] != "AAC":
+        raise ValueError(f"Unsupported audio codec: {codec['Codec']}")
+    aac = codec.get("AacSettings", {})
+    # ffmpeg's native encoder is AAC-LC whatever CodecProfile asks for
+    return ["-c:a", "aac", "-b:a", str(aac.get("Bitrate", 96000)), "-ar", str(aac.get("SampleRate", 48000)),
+            "-ac", str(_CHANNELS.get(aac.get("CodingMode"), 2))]
+
+
+def capture_args(video):
+    capture = video["CodecSettings"]["FrameCaptureSettings"]
+    rate = f"fps={capture.get('FramerateNumerator', 1)}/{capture.get('FramerateDenominator', 1)}"
+    scale = _scale(video)
+    # MediaConvert Quality 1-100 onto the JPEG qscale 31-2
+    qscale = 2 + (100 - capture.get("Quality", 80)) * 29 // 100
+    return ["-vf", ",".join([rate] + scale[1:]), "-frames:v", str(capture.get("MaxCaptures", 1)),
+            "-q:v", str(qscale), "-start_number", "0", "-an"]
+
+
+def stream_inf(output, codecs=True, playlist_path=None):
+    video = output["VideoDescription"]
+    h264 = video["CodecSettings"].get("H264Settings", {})
+    audio = [d["CodecSettings"].get("AacSettings", {}) for d in output.get("AudioDescriptions", [])]
+    bandwidth = h264.get("MaxBitrate") or h264.get("Bitrate")
+    if bandwidth:
+        bandwidth += sum(aac.get("Bitrate", 96000) for aac in audio)
+    else:
+        # Passthrough declares no bitrate; use the peak of what was written
+        bandwidth = peak_bandwidth(playlist_path) if playlist_path else 0
+    line = f"#EXT-X-STREAM-INF:BANDWIDTH={bandwidth}"
+    if video.get("Width") and video.get("Height"):
+        line += f",RESOLUTION={video['Width']}x{video['Height']}"
+    if codecs and video["CodecSettings"]["Codec"] != "PASSTHROUGH":
+        # The source's profile is unknown for passthrough, so no CODECS rather than a wrong one
+        avc = _PROFILES.get(h264.get("CodecProfile"), _PROFILES["HIGH"])[1]
+        line += f',CODECS="{avc}' + (',mp4a.40.2"' if audio else '"')
+    return line
+
+
+def peak_bandwidth(playlist_path):
+    # Highest segment bitrate in a media playlist, in bits per second
+    peak, duration = 0, None
+    directory = os.path.dirname(playlist_path)
+    with open(playlist_path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("#EXTINF:"):
+                duration = float(line[len("#EXTINF:"):].split(",")[0])
+            elif line and not line.startswith("#") and duration:
+                peak = max(peak, int(os.path.getsize(os.path.join(directory, line)) * 8 / duration))
+                duration = None
+    return peak
+
+
+def write_master(path, variants):
+    lines = ["#EXTM3U", "#EXT-X-VERSION:3", "#EXT-X-INDEPENDENT-SEGMENTS"]
+    for output, codecs, uri in variants:
+        lines += [stream_inf(output, codecs, os.path.join(os.path.dirname(path), uri)), uri]
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def job_state_event(local_job):
+    # EventBridge "MediaConvert Job State Change", as consumed by the job event Lambdas
+    detail = {
+        "timestamp": int(time.time() * 1000),
+        "accountId": "000000000000",
+        "queue": "local-ffmpeg",
+        "jobId": local_job.id,
+        "status": local_job.status,
+        "userMetadata": local_job.user_metadata,
+    }
+    if local_job.status == "ERROR":
+        detail["errorCode"] = 1999
+        detail["errorMessage"] = local_job.error
+    elif local_job.status == "COMPLETE" and local_job.plan:
+        detail["outputGroupDetails"] = _output_group_details(local_job.plan)
+    return {
+        "version": "0",
+        "id": f"{local_job.id}-{local_job.status.lower()}",
+        "detail-type": "MediaConvert Job State Change",
+        "source": "aws.mediaconvert",
+        "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "resources": [local_job.id],
+        "detail": detail,
+    }
+
+
+def _output_group_details(plan):
+    details = []
+    masters = iter(plan.masters)
+    for group_type, outputs in plan.groups:
+        group = {"type": group_type, "outputDetails": []}
+        if group_type == "HLS_GROUP":
+            group["playlistFilePaths"] = [next(masters)[1]]
+            # Variant playlists only, one per output
+            outputs = outputs[::2]
+        for uri, path, pattern in outputs:
+            written = sorted(glob.glob(pattern))
+            if written and written[-1] != path:
+                # Frame captures report the last capture written
+                uri = _sibling_uri(uri, path, written[-1])
+            group["outputDetails"].append({"outputFilePaths": [uri]})
+        details.append(group)
+    return details
+
+
+def local_path(uri, root=LOCAL_MEDIA_ROOT):
+    if uri.startswith("s3://"):
+        return os.path.join(root, uri[len("s3://"):])
+    if uri.startswith("file://"):
+        return uri[len("file://"):]
+    return uri
+
+
+def _base(destination, stem):
+    # MediaConvert appends the input's stem when the destination ends with "/"
+    return destination + stem if destination.endswith("/") else destination
+
+
+def _streams(output):
+    streams = ["-map", "0:v:0"]
+    if output.get("AudioDescriptions"):
+        streams += ["-map", "0:a:0?"]
+    return streams
+
+
+def _scale(video):
+    width, height = video.get("Width"), video.get("Height")
+    if not width and not height:
+        return []
+    return ["-vf", f"scale={width or -2}:{height or -2}"]
+
+
+def _split_s3(uri):
+    bucket, _, key = uri[len("s3://"):].partition("/")
+    return bucket, key
+
+
+def _sibling_uri(uri, path, file_path):
+    # URI of file_path, written next to the output whose local path is path
+    return uri[:len(uri) - len(os.path.basename(path))] + os.path.basename(file_path)
+
+
+def _handler_listener(module_name):
+    handler = importlib.import_module(module_name.strip()).lambda_handler
+    return lambda event: handler(event, None)
@@ -0,0 +1,183 @@
+import base64
+import json
+import os
+import posixpath
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+
+from botocore.exceptions import ClientError
+
+import awsClients
+
+# Per-broadcast index of HLS media segments: for each rendition, cumulative start times,
+# TS byte sizes and URIs in flat arrays, so the TS range covering any time window is two
+# bisects. Built once when a broadcast encode completes and stored next to its outputs.
+INDEX_NAME = "segment-index.json"
+INDEX_CACHE_SIZE = int(os.environ.get("HLS_INDEX_CACHE_SIZE", "64"))
+
+s3 = awsClients.client("s3")
+
+_cache = OrderedDict()
+
+
+class RenditionIndex:
+    __slots__ = ("stream_inf", "playlist", "starts", "sizes", "uris")
+
+    def __init__(self, stream_inf, playlist, starts, sizes, uris):
+        self.stream_inf = stream_inf
+        self.playlist = playlist
+        # starts has one more entry than uris: starts[-1] is the end of the last segment
+        self.starts = starts
+        self.sizes = sizes
+        self.uris = uris
+
+    def lookup(self, start_seconds, duration_seconds):
+        # (first, stop) indices of the segments overlapping [start, start + duration)
+        count = len(self.uris)
+        first = max(0, bisect_right(self.starts, start_seconds) - 1)
+        stop = min(count, bisect_left(self.starts, start_seconds + duration_seconds))
+        if first >= count or stop <= first:
+            return None
+        return first, stop
+
+    def duration(self, i):
+        return self.starts[i + 1] - self.starts[i]
+
+
+class SegmentIndex:
+    __slots__ = ("master_key", "renditions")
+
+    def __init__(self, master_key, renditions):
+        self.master_key = master_key
+        self.renditions = renditions
+
+    def to_json(self):
+        return json.dumps({
+            "version": 1,
+            "byteorder": sys.byteorder,
+            "master": self.master_key,
+            "renditions": [{
+                "stream_inf": r.stream_inf,
+                "playlist": r.playlist,
+                "starts": base64.b64encode(r.starts.tobytes()).decode(),
+                "sizes": base64.b64encode(r.sizes.tobytes()).decode(),
+                "uris": r.uris,
+            } for r in self.renditions]
+        }, separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, text):
+        data = json.loads(text)
+        swap = data["byteorder"] != sys.byteorder
+        renditions = []
+        for r in data["renditions"]:
+            starts = array("d", base64.b64decode(r["starts"]))
+            sizes = array("q", base64.b64decode(r["sizes"]))
+            if swap:
+                starts.byteswap()
+                sizes.byteswap()
+            renditions.append(RenditionIndex(r["stream_inf"], r["playlist"], starts, sizes, r["uris"]))
+        return cls(data["master"], renditions)
+
+
+def parse_master_playlist(text):
+    # [(#EXT-X-STREAM-INF line, variant uri)]
+    variants = []
+    stream_inf = None
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("#EXT-X-STREAM-INF"):
+            stream_inf = line
+        elif line and not line.startswith("#") and stream_inf:
+            variants.append((stream_inf, line))
+            stream_inf = None
+    return variants
+
+
+def parse_media_playlist(text):
+    # [(duration seconds, uri)] in playlist order
+    entries = []
+    duration = None
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("#EXTINF:"):
+            duration = float(line[8:].split(",", 1)[0])
+        elif line and not line.startswith("#") and duration is not None:
+            entries.append((duration, line))
+            duration = None
+    return entries
+
+
+def index_key(master_key):
+    return posixpath.join(posixpath.dirname(master_key), INDEX_NAME)
+
+
+def build_index(bucket, master_key):
+    # Reads the master and variant playlists plus one listing for TS sizes, then stores the index
+    master = _get_text(bucket, master_key)
+    if master is None:
+        return None
+    broadcast_dir = posixpath.dirname(master_key)
+    sizes_by_key = _list_sizes(bucket, broadcast_dir + "/")
+
+    renditions = []
+    for stream_inf, playlist in parse_master_playlist(master):
+        variant = _get_text(bucket, posixpath.join(broadcast_dir, playlist))
+        if variant is None:
+            return None
+        starts = array("d", [0.0])
+        sizes = array("q")
+        uris = []
+        for seg_duration, uri in parse_media_playlist(variant):
+            starts.append(starts[-1] + seg_duration)
+            sizes.append(sizes_by_key.get(posixpath.join(broadcast_dir, uri), 0))
+            uris.append(uri)
+        renditions.append(RenditionIndex(stream_inf, playlist, starts, sizes, uris))
+
+    index = SegmentIndex(master_key, renditions)
+    s3.put_object(Bucket=bucket, Key=index_key(master_key), Body=index.to_json().encode(), ContentType="application/json")
+    _remember((bucket, master_key), index)
+    return index
+
+
+def load_index(bucket, master_key, build=True):
+    # Memoized per warm container; indexes are immutable once written
+    key = (bucket, master_key)
+    index = _cache.get(key)
+    if index is not None:
+        _cache.move_to_end(key)
+        return index
+    text = _get_text(bucket, index_key(master_key))
+    if text is not None:
+        index = SegmentIndex.from_json(text)
+        _remember(key, index)
+        return index
+    # Broadcasts encoded before indexing existed get their index built on first use
+    return build_index(bucket, master_key) if build else None
+
+
+def _remember(key, index):
+    _cache[key] = index
+    _cache.move_to_end(key)
+    while len(_cache) > INDEX_CACHE_SIZE:
+        _cache.popitem(last=False)
+
+
+def _list_sizes(bucket, prefix):
+    sizes = {}
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            sizes[obj["Key"]] = obj["Size"]
+    return sizes
+
+
+def _get_text(bucket, key):
+    try:
+        return s3.get_object(Bucket=bucket, Key=key)["Body"].read().decode("utf-8")
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+            return None
+        raise
@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+import time
+from urllib.parse import quote
+
+from botocore.exceptions import ClientError
+
+import segmentLease
+
+# Segment encode status, kept on the segment's lease record in SEGMENT_JOBS_TABLE and driven by
+# MediaConvert "Job State Change" events rather than by polling S3 from the API.
+STATUS_URL_BASE = os.environ.get("STATUS_URL_BASE", "/stream/status")
+TERMINAL_STATUSES = ("COMPLETE", "ERROR")
+PROGRESS_STATUSES = ("PROGRESSING", "STATUS_UPDATE")
+
+
+def status_url(segment_id):
+    return f"{STATUS_URL_BASE}?segment_id={quote(segment_id)}"
+
+
+def get_status(segment_id, consistent=False):
+    table = segmentLease.dynamodb.Table(segmentLease.SEGMENT_JOBS_TABLE)
+    return table.get_item(Key={"segment_id": segment_id}, ConsistentRead=consistent).get("Item")
+
+
+def get_statuses(segment_ids):
+    # {segment_id: record} for the ids that have one; BatchGetItem takes 100 keys per call
+    table_name = segmentLease.SEGMENT_JOBS_TABLE
+    ids = list(dict.fromkeys(segment_ids))
+    records = {}
+    for i in range(0, len(ids), 100):
+        request = {table_name: {"Keys": [{"segment_id": segment_id} for segment_id in ids[i:i + 100]]}}
+        while request:
+            response = segmentLease.dynamodb.batch_get_item(RequestItems=request)
+            for item in response.get("Responses", {}).get(table_name, []):
+                records[item["segment_id"]] = item
+            request = response.get("UnprocessedKeys")
+    return records
+
+
+def describe(record):
+    # The client-facing view of a status record
+    if not record:
+        return {"status": "UNKNOWN", "progress": 0}
+    return {
+        "status": record.get("status", "UNKNOWN"),
+        "progress": int(record.get("progress", 0)),
+        "job_id": record.get("job_id"),
+        "error": record.get("error"),
+    }
+
+
+def etag(view):
+    # Strong validator over the client-facing view; changes whenever status or progress does
+    digest = hashlib.sha1(json.dumps(view, sort_keys=True).encode()).hexdigest()[:16]
+    return f'"{digest}"'
+
+
+def apply_event(event):
+    # Returns the new status, or None for events that are ignored or stale
+    detail = event.get("detail", {})
+    segment_id = detail.get("userMetadata", {}).get("segment_id")
+    status = detail.get("status")
+    job_id = detail.get("jobId")
+    if not segment_id or not job_id:
+        return None
+
+    # Only the job recorded on the lease may move it, and only while it is in flight: a late event
+    # from a previous job can't touch a lease that has been re-acquired (acquire removes job_id),
+    # and a redelivered terminal event is a no-op (ERROR must bump attempt exactly once)
+    names = {"#status": "status"}
+    condition = "job_id = :job_id AND #status IN (:submitting, :submitted, :progressing)"
+    values = {
+        ":job_id": job_id,
+        ":now": int(time.time()),
+        ":submitting": "SUBMITTING",
+        ":submitted": "SUBMITTED",
+        ":progressing": "PROGRESSING",
+    }
+    if status in PROGRESS_STATUSES:
+        update = "SET #status = :progressing, updated_at = :now"
+        if "jobProgress" in detail:
+            update += ", progress = :progress"
+            values[":progress"] = int(detail["jobProgress"].get("jobPercentComplete", 0))
+        status = "PROGRESSING"
+    elif status == "COMPLETE":
+        update = "SET #status = :complete, progress = :progress, updated_at = :now"
+        values.update({":complete": "COMPLETE", ":progress": 100})
+    elif status == "ERROR":
+        # Expire the lease so the next request can resubmit, under a new attempt (and so a new
+        # ClientRequestToken) instead of getting this failed job back
+        update = "SET #status = :error, #error = :message, updated_at = :now, lease_expires = :zero ADD attempt :one"
+        names["#error"] = "error"
+        values.update({":error": "ERROR", ":message": detail.get("errorMessage", "Encode failed"), ":zero": 0, ":one": 1})
+    else:
+        return None
+
+    try:
+        segmentLease.dynamodb.Table(segmentLease.SEGMENT_JOBS_TABLE).update_item(
+            Key={"segment_id": segment_id},
+            UpdateExpression=update,
+            ConditionExpression=condition,
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+        print(f"Ignoring stale {status} event for {segment_id} (job {job_id})")
+        return None
+    return status
@@ -0,0 +1,162 @@
+"""Sync rendition ladders to MediaConvert Presets/JobTemplates and submit jobs against them.
+
+Every preset and job template name ends in a hash of its settings, so a ladder change
+produces new names and syncing is idempotent. Jobs then carry only the template name,
+preset references and the per-request input, clipping, destinations and metadata.
+
+    python jobTemplateRegistry.py sync segment broadcast
+"""
+import hashlib
+import json
+import os
+import sys
+from functools import lru_cache
+
+from botocore.exceptions import ClientError
+
+import mediaConvertEndpoint
+import renditionLadder
+import transcoder
+
+TEMPLATE_PREFIX = os.environ.get("MEDIACONVERT_TEMPLATE_PREFIX", "tvna-streaming-solution-dev")
+TEMPLATE_CATEGORY = "tvnews"
+USE_JOB_TEMPLATES = os.environ.get("USE_JOB_TEMPLATES", "true").lower() == "true"
+SYNCED_CACHE_PATH = os.environ.get("MEDIACONVERT_TEMPLATE_CACHE", "/tmp/mediaconvert_templates.json")
+
+# Job-level fields MediaConvert accepts on a job template; anything else stays on the job
+TEMPLATE_JOB_FIELDS = ("AccelerationSettings", "Priority", "StatusUpdateInterval")
+# Thumbnails need a per-request capture interval, so they stay inline
+PRESET_KINDS = ("hls", "mp4")
+
+_synced = None
+
+
+def content_hash(value):
+    canonical = json.dumps(value, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()[:12]
+
+
+@lru_cache(maxsize=None)
+def get_registered_template(ladder_name):
+    # Split a compiled ladder into presets, a job template, and the slim per-job template,
+    # frozen like the compiled ladder it comes from
+    compiled = renditionLadder.thaw(renditionLadder.get_template(ladder_name))
+    presets = {}
+    template_groups = []
+    slim_groups = []
+    for kind, group in compiled["groups"]:
+        if kind not in PRESET_KINDS:
+            template_groups.append(group)
+            slim_groups.append((kind, group))
+            continue
+        outputs = []
+        for output in group["Outputs"]:
+            preset_settings = {k: v for k, v in output.items() if k != "NameModifier"}
+            preset_name = f"{TEMPLATE_PREFIX}_{ladder_name}_{kind}_{content_hash(preset_settings)}"
+            presets[preset_name] = preset_settings
+            ref = {"Preset": preset_name}
+            if "NameModifier" in output:
+                ref["NameModifier"] = output["NameModifier"]
+            outputs.append(ref)
+        slim = dict(group, Outputs=outputs)
+        template_groups.append(slim)
+        slim_groups.append((kind, slim))
+
+    template_settings = dict(compiled["settings"], OutputGroups=template_groups)
+    if compiled["input"]:
+        template_settings["Inputs"] = [compiled["input"]]
+    template_job = {k: v for k, v in compiled["job"].items() if k in TEMPLATE_JOB_FIELDS}
+    job_template = dict(template_job, Settings=template_settings)
+    job_template_name = f"{TEMPLATE_PREFIX}_{ladder_name}_{content_hash(job_template)}"
+
+    job = {k: v for k, v in compiled["job"].items() if k not in TEMPLATE_JOB_FIELDS}
+    job["JobTemplate"] = job_template_name
+    return renditionLadder.freeze({
+        "name": job_template_name,
+        "presets": presets,
+        "job_template": job_template,
+        "groups": slim_groups,
+        "input": compiled["input"],
+        "settings": {},
+        "job": job,
+    })
+
+
+def sync(ladder_name):
+    registered = get_registered_template(ladder_name)
+    name = registered["name"]
+    if name in _get_synced():
+        return name
+
+    # Presets are created before the template, so an existing template implies its presets exist
+    if not _exists("get_job_template", name):
+        for preset_name, settings in registered["presets"].items():
+            if not _exists("get_preset", preset_name):
+                _create("create_preset", Name=preset_name, Category=TEMPLATE_CATEGORY,
+                        Description=f"{ladder_name} ladder rendition", Settings=renditionLadder.thaw(settings))
+        _create("create_job_template", Name=name, Category=TEMPLATE_CATEGORY,
+                Description=f"{ladder_name} ladder", **renditionLadder.thaw(registered["job_template"]))
+        print(f"Registered MediaConvert job template {name}")
+
+    _get_synced().add(name)
+    _write_synced()
+    return name
+
+
+def build_job(ladder_name, role, input_s3, destinations, **kwargs):
+    # Job settings for create_job: template-based when the ladder is synced, inline otherwise
+    # (always inline for the local ffmpeg transcoder, which has no templates to sync)
+    if USE_JOB_TEMPLATES and transcoder.uses_mediaconvert():
+        try:
+            sync(ladder_name)
+            return renditionLadder.build_job(get_registered_template(ladder_name), role, input_s3, destinations, **kwargs)
+        except ClientError as e:
+            print(f"Job template sync failed for {ladder_name}, submitting inline settings:", str(e))
+    return renditionLadder.build_job(renditionLadder.get_template(ladder_name), role, input_s3, destinations, **kwargs)
+
+
+def _exists(operation, name):
+    try:
+        mediaConvertEndpoint.call(operation, Name=name)
+        return True
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("NotFoundException", "404"):
+            return False
+        raise
+
+
+def _create(operation, **kwargs):
+    try:
+        mediaConvertEndpoint.call(operation, **kwargs)
+    except ClientError as e:
+        # Another container registered the same content-addressed name first
+        if e.response["Error"]["Code"] != "ConflictException":
+            raise
+
+
+def _get_synced():
+    global _synced
+    if _synced is None:
+        try:
+            with open(SYNCED_CACHE_PATH) as f:
+                _synced = set(json.load(f))
+        except (OSError, ValueError):
+            _synced = set()
+    return _synced
+
+
+def _write_synced():
+    tmp_path = f"{SYNCED_CACHE_PATH}.{os.getpid()}"
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump(sorted(_synced), f)
+        os.replace(tmp_path, SYNCED_CACHE_PATH)
+    except OSError as e:
+        print("Could not persist synced job templates:", str(e))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "sync":
+        sys.exit(f"usage: {sys.argv[0]} sync [ladder ...]")
+    for ladder in sys.argv[2:] or list(renditionLadder.LADDERS):
+        print(ladder, sync(ladder))
@@ -0,0 +1,136 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import posixpath
+import re
+import time
+from urllib.parse import quote
+
+import awsClients
+import mediaTokenKey
+
+# Manifest-level authorization: a viewer is authorized once, when manifestLambda serves a
+# playlist, and every URI in that playlist is rewritten to carry a short-lived token scoped to
+# the directory it points into. Media requests then need no cookie, regex or per-segment lookup:
+#
+#   hmac        ?token=<expires>.<base64url scope>.<hmac>, checked at the edge by
+#               video-access-validation as a prefix compare plus one HMAC (mediaTokenKey)
+#   cloudfront  CloudFront signed-URL query (custom policy on "<scope>*"), checked by CloudFront
+#               itself, so media behaviors need no edge function at all. Needs the
+#               cryptography package and a key pair from CLOUDFRONT_KEY_PAIR_ID and
+#               CLOUDFRONT_PRIVATE_KEY_SECRET (a Secrets Manager PEM).
+#
+# One token is computed per directory per playlist, so rewriting a long broadcast's playlist
+# costs one HMAC (or RSA signature) per rendition, not one per TS file.
+MEDIA_URL_SIGNER = os.environ.get("MEDIA_URL_SIGNER", "hmac").lower()
+MEDIA_TOKEN_SECRET = mediaTokenKey.SECRET_KEY
+MEDIA_TOKEN_TTL_SECONDS = int(os.environ.get("MEDIA_TOKEN_TTL_SECONDS", "900"))
+# VOD playlists are fetched once, so tokens must outlive playback of the whole playlist
+MEDIA_TOKEN_GRACE_SECONDS = int(os.environ.get("MEDIA_TOKEN_GRACE_SECONDS", "1800"))
+CLOUDFRONT_KEY_PAIR_ID = os.environ.get("CLOUDFRONT_KEY_PAIR_ID")
+CLOUDFRONT_PRIVATE_KEY_SECRET = os.environ.get("CLOUDFRONT_PRIVATE_KEY_SECRET")
+TOKEN_PARAM = "token"
+
+_URI_ATTRIBUTE = re.compile(r'URI="([^"]+)"')
+# CloudFront's URL-safe base64 alphabet for Policy and Signature
+_CLOUDFRONT_B64 = bytes.maketrans(b"+=/", b"-_~")
+
+_private_key = None
+
+
+def sign_scope(scope, expires):
+    # Token for every path starting with scope ("/dir/"), valid until expires (epoch seconds)
+    encoded_scope = base64.urlsafe_b64encode(scope.encode()).rstrip(b"=").decode()
+    signature = hmac.new(MEDIA_TOKEN_SECRET, f"{expires}.{scope}".encode(), hashlib.sha256).hexdigest()
+    return f"{expires}.{encoded_scope}.{signature}"
+
+
+def verify(path, token, now=None):
+    # True when token is an unexpired HMAC token whose scope contains path
+    try:
+        expires, encoded_scope, signature = token.split(".")
+        scope = base64.urlsafe_b64decode(encoded_scope + "=" * (-len(encoded_scope) % 4)).decode()
+        expires_at = int(expires)
+    except (ValueError, UnicodeDecodeError):
+        return False
+    if expires_at < (now or time.time()) or not path.startswith(scope):
+        return False
+    expected = hmac.new(MEDIA_TOKEN_SECRET, f"{expires}.{scope}".encode(), hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def scope_query(scope, expires, base_url):
+    # Query string authorizing GETs under scope until expires
+    if MEDIA_URL_SIGNER == "cloudfront":
+        policy = json.dumps({
+            "Statement": [{
+                "Resource": f"{base_url}{scope}*",
+                "Condition": {"DateLessThan": {"AWS:EpochTime": expires}},
+            }]
+        }, separators=(",", ":")).encode()
+        signature = _rsa_sign(policy)
+        return (f"Policy={_cloudfront_b64(policy)}&Signature={_cloudfront_b64(signature)}"
+                f"&Key-Pair-Id={CLOUDFRONT_KEY_PAIR_ID}")
+    return f"{TOKEN_PARAM}={sign_scope(scope, expires)}"
+
+
+def playlist_expiry(text, now=None):
+    # Long enough to play the whole playlist, and never shorter than MEDIA_TOKEN_TTL_SECONDS
+    duration = sum(float(line[8:].split(",", 1)[0]) for line in text.splitlines() if line.startswith("#EXTINF:"))
+    return int((now or time.time()) + max(MEDIA_TOKEN_TTL_SECONDS, duration + MEDIA_TOKEN_GRACE_SECONDS))
+
+
+def tokenize_playlist(text, playlist_path, media_base_url, playlist_url, expires):
+    # Rewrites every URI in a master or media playlist at playlist_path ("/dir/x.m3u8"): media
+    # URIs become media_base_url + path + signed query; playlist URIs become playlist_url(path,
+    # token), so variants are authorized by the token of their own directory
+    base_dir = posixpath.dirname(playlist_path)
+    queries = {}
+    tokens = {}
+
+    def rewrite(uri):
+        if "://" in uri:
+            return uri
+        path = posixpath.normpath(posixpath.join(base_dir, uri.split("?", 1)[0]))
+        scope = posixpath.dirname(path).rstrip("/") + "/"
+        if path.endswith(".m3u8"):
+            if scope not in tokens:
+                tokens[scope] = sign_scope(scope, expires)
+            return playlist_url(path, tokens[scope])
+        if scope not in queries:
+            queries[scope] = scope_query(scope, expires, media_base_url)
+        return f"{media_base_url}{quote(path)}?{queries[scope]}"
+
+    lines = []
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped:
+            lines.append(line)
+        elif stripped.startswith("#"):
+            # EXT-X-MEDIA, EXT-X-MAP, EXT-X-I-FRAME-STREAM-INF and friends carry URI="..."
+            lines.append(_URI_ATTRIBUTE.sub(lambda m: f'URI="{rewrite(m.group(1))}"', line))
+        else:
+            lines.append(rewrite(stripped))
+    return "\n".join(lines) + "\n"
+
+
+def _rsa_sign(message):
+    # CloudFront signed URLs use RSA-SHA1 over the policy
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import padding
+    return _get_private_key().sign(message, padding.PKCS1v15(), hashes.SHA1())
+
+
+def _get_private_key():
+    global _private_key
+    if _private_key is None:
+        from cryptography.hazmat.primitives.serialization import load_pem_private_key
+        secret = awsClients.get_client("secretsmanager").get_secret_value(SecretId=CLOUDFRONT_PRIVATE_KEY_SECRET)
+        _private_key = load_pem_private_key(secret["SecretString"].encode(), password=None)
+    return _private_key
+
+
+def _cloudfront_b64(data):
+    return base64.b64encode(data).translate(_CLOUDFRONT_B64).decode()
@@ -0,0 +1,102 @@
+import hashlib
+import hmac
+import json
+import os
+import time
+from urllib.parse import quote
+
+from botocore.exceptions import ClientError
+
+import awsClients
+import manifestAuth
+import mediaTokenKey
+
+# GET /stream/manifest?path=<playlist key>[&token=...]
+# Authorizes the viewer once per playlist, then returns the playlist with every URI rewritten
+# by manifestAuth: media URIs point at CloudFront with a short-lived token scoped to their
+# directory, and variant playlists point back here with a token for theirs. A request is
+# authorized by that token, by the API's Cognito claims, or by the segment_access cookie that
+# segmentStreamRequestLambdaWithCookie sets for the segment the playlist belongs to.
+SEGMENT_BUCKET = os.environ["SEGMENT_BUCKET"]
+CLOUDFRONT_DOMAIN = os.environ["CLOUDFRONT_DOMAIN"]
+SHARED_SECRET = mediaTokenKey.SECRET_KEY
+# Relative, so variant URIs resolve against whatever stage and host served the master
+MANIFEST_URL = os.environ.get("MANIFEST_URL", "manifest")
+
+s3 = awsClients.client("s3")
+
+
+def lambda_handler(event, context):
+    params = event.get("queryStringParameters") or {}
+    path = "/" + (params.get("path") or "").lstrip("/")
+    if not path.endswith(".m3u8") or ".." in path.split("/"):
+        return respond(400, "Expected a playlist path")
+    if not authorized(event, path, params.get("token")):
+        return respond(403, "Not authorized for this playlist")
+
+    try:
+        text = s3.get_object(Bucket=SEGMENT_BUCKET, Key=path[1:])["Body"].read().decode("utf-8")
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+            return respond(404, "Playlist not found")
+        raise
+
+    body = manifestAuth.tokenize_playlist(
+        text, path, f"https://{CLOUDFRONT_DOMAIN}", playlist_url, manifestAuth.playlist_expiry(text)
+    )
+    return {
+        "statusCode": 200,
+        "headers": {
+            "Access-Control-Allow-Origin": "*",
+            "Access-Control-Allow-Credentials": "true",
+            "Content-Type": "application/vnd.apple.mpegurl",
+            # Tokens are per viewer; shared caches must not hand them to someone else
+            "Cache-Control": "private, max-age=60"
+        },
+        "body": body
+    }
+
+
+def playlist_url(path, token):
+    return f"{MANIFEST_URL}?path={quote(path)}&{manifestAuth.TOKEN_PARAM}={token}"
+
+
+def authorized(event, path, token):
+    if token:
+        return manifestAuth.verify(path, token)
+    claims = ((event.get("requestContext") or {}).get("authorizer") or {}).get("claims") or {}
+    if claims.get("sub"):
+        return True
+    segment_id = cookie_segment(event)
+    return bool(segment_id) and segment_id in path.split("/")
+
+
+def cookie_segment(event):
+    # Segment id of a valid, unexpired segment_access cookie, or None
+    headers = event.get("headers") or {}
+    cookie_header = headers.get("Cookie") or headers.get("cookie") or ""
+    for part in cookie_header.split(";"):
+        name, _, value = part.strip().partition("=")
+        if name != "segment_access":
+            continue
+        try:
+            segment_id, expiry, signature = value.split(".")
+            if int(expiry) < time.time():
+                return None
+        except ValueError:
+            return None
+        expected = hmac.new(SHARED_SECRET, f"{segment_id}.{expiry}".encode(), hashlib.sha256).hexdigest()
+        return segment_id if hmac.compare_digest(expected, signature) else None
+    return None
+
+
+def respond(status_code, message):
+    return {
+        "statusCode": status_code,
+        "headers": {
+            "Access-Control-Allow-Origin": "*",
+            "Access-Control-Allow-Credentials": "true",
+            "Content-Type": "application/json"
+        },
+        "body": json.dumps({"message": message})
+    }
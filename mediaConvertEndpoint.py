@@ -0,0 +1,74 @@
+import json
+import os
+
+from botocore.exceptions import ClientError, ConnectTimeoutError, EndpointConnectionError
+
+import awsClients
+
+# Account-specific MediaConvert endpoint, shared by every handler packaged with this module.
+# Resolution order: MEDIACONVERT_ENDPOINT env var, warm-container memory, /tmp file
+# (survives container reuse), and only then describe_endpoints.
+ENDPOINT_CACHE_PATH = os.environ.get("MEDIACONVERT_ENDPOINT_CACHE", "/tmp/mediaconvert_endpoint.json")
+
+_endpoint = None
+
+
+def get_endpoint(refresh=False):
+    global _endpoint
+    override = os.environ.get("MEDIACONVERT_ENDPOINT")
+    if override:
+        return override
+    if _endpoint and not refresh:
+        return _endpoint
+
+    if not refresh:
+        _endpoint = _read_cached_endpoint()
+        if _endpoint:
+            return _endpoint
+
+    response = awsClients.get_client("mediaconvert").describe_endpoints(MaxResults=1)
+    _endpoint = response["Endpoints"][0]["Url"]
+    _write_cached_endpoint(_endpoint)
+    return _endpoint
+
+
+def get_client(refresh=False):
+    return awsClients.get_client("mediaconvert", endpoint_url=get_endpoint(refresh=refresh))
+
+
+def call(operation, **kwargs):
+    # Invoke a MediaConvert operation, re-discovering the endpoint once if the cached one is stale
+    try:
+        return getattr(get_client(), operation)(**kwargs)
+    except (EndpointConnectionError, ConnectTimeoutError) as e:
+        if os.environ.get("MEDIACONVERT_ENDPOINT"):
+            raise
+        print("MediaConvert endpoint unreachable, refreshing:", str(e))
+    except ClientError as e:
+        if os.environ.get("MEDIACONVERT_ENDPOINT") or not _is_endpoint_error(e):
+            raise
+        print("MediaConvert endpoint rejected, refreshing:", str(e))
+    return getattr(get_client(refresh=True), operation)(**kwargs)
+
+
+def _is_endpoint_error(error):
+    message = error.response.get("Error", {}).get("Message", "")
+    return "endpoint" in message.lower()
+
+
+def _read_cached_endpoint():
+    try:
+        with open(ENDPOINT_CACHE_PATH) as f:
+            return json.load(f).get("Url")
+    except (OSError, ValueError):
+        return None
+
+
+def _write_cached_endpoint(url):
+    tmp_path = f"{ENDPOINT_CACHE_PATH}.{os.getpid()}"
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump({"Url": url}, f)
+        os.replace(tmp_path, ENDPOINT_CACHE_PATH)
+    except OSError as e:
+        print("Could not persist MediaConvert endpoint:", str(e))
@@ -0,0 +1,48 @@
+"""The one HMAC key behind segment_access cookies and manifest media tokens.
+
+Lambda@Edge functions cannot read environment variables, so the key is baked into the bundle
+at build time rather than configured per function. Write it once per deployment, before
+packaging, and ship media_token.key with the edge validator and with the regional functions:
+
+    python mediaTokenKey.py write            create media_token.key unless it exists
+    python mediaTokenKey.py write --force    rotate it (outstanding cookies and tokens stop working)
+
+Without the file, regional functions and local runs fall back to SHARED_SECRET. The edge has
+no environment, so a missing file fails its import instead of silently using another key.
+"""
+import os
+import secrets
+import sys
+
+KEY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "media_token.key")
+
+
+def load():
+    try:
+        with open(KEY_FILE, "rb") as f:
+            key = f.read().strip()
+    except FileNotFoundError:
+        key = os.environ.get("SHARED_SECRET", "").encode()
+    if not key:
+        raise RuntimeError(f"No media token key: run `python mediaTokenKey.py write` before packaging ({KEY_FILE})")
+    return key
+
+
+def write(force=False):
+    if os.path.exists(KEY_FILE) and not force:
+        return False
+    tmp_path = f"{KEY_FILE}.{os.getpid()}"
+    with open(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as f:
+        f.write(secrets.token_urlsafe(48))
+    os.replace(tmp_path, KEY_FILE)
+    return True
+
+
+SECRET_KEY = load() if __name__ != "__main__" else None
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "write":
+        sys.exit(f"usage: {sys.argv[0]} write [--force]")
+    created = write(force="--force" in sys.argv[2:])
+    print(f"{'Wrote' if created else 'Kept existing'} {KEY_FILE}")
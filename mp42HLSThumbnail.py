@@ -1,15 +1,13 @@
-import boto3
 import os
 
+import encodeScheduler
+import renditionLadder
+import thumbnailIndex
+
 MEDIACONVERT_ROLE = os.environ['MEDIACONVERT_ROLE']
 OUTPUT_BUCKET = os.environ['OUTPUT_BUCKET']
 DESTINATION_BUCKET = os.environ['DESTINATION_BUCKET']
 
-# Get MediaConvert endpoint
-mc_client = boto3.client('mediaconvert')
-endpoints = mc_client.describe_endpoints()
-mc_endpoint = endpoints['Endpoints'][0]['Url']
-mc = boto3.client('mediaconvert', endpoint_url=mc_endpoint)
 # Process inexplicably slow??!!
 def lambda_handler(event, context):
     input_s3 = event['input_s3']
@@ -116,9 +114,10 @@ def lambda_handler(event, context):
                                 "CodecSettings": {
                                     "Codec": "FRAME_CAPTURE",
                                     "FrameCaptureSettings": {
+                                        # One frame every interval for the whole input; indexed on COMPLETE
                                         "FramerateNumerator": 1,
-                                        "FramerateDenominator": 1,  # One frame every second
-                                        "MaxCaptures": 1,
+                                        "FramerateDenominator": thumbnailIndex.THUMBNAIL_INTERVAL_SECONDS,
+                                        "MaxCaptures": renditionLadder.MAX_INTERVAL_CAPTURES,
                                         "Quality": 80
                                     }
                                 }
@@ -142,11 +141,13 @@ def lambda_handler(event, context):
         },
         "UserMetadata": {
             "source": input_filename,
-            "job": segment_id
+            "job": segment_id,
+            "kind": "broadcast",
+            "thumbnail_interval": str(thumbnailIndex.THUMBNAIL_INTERVAL_SECONDS)
         }
     }
 
-    response = mc.create_job(**job_settings)
+    response = encodeScheduler.submit(job_settings, event.get('encode_class', encodeScheduler.BROADCAST))
     return {
         "status": "submitted",
         "jobId": response['Job']['Id'],
@@ -0,0 +1,260 @@
+import os
+import struct
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+
+from botocore.exceptions import ClientError
+
+import awsClients
+
+# Codec, resolution and keyframe table of a source MP4, read from its moov box with S3
+# ranged GETs (the head of the file, plus the moov itself when it sits after mdat), so a
+# segment request can decide on a stream-copy remux without downloading the proxy.
+# Keyframe times are presentation times, as clipping timecodes are: the decode times of the
+# video track's stss (sync samples) from stts (sample durations), plus their ctts composition
+# offsets (B-frames), shifted by the track's edit list (elst) onto the movie timeline.
+SOURCE_CACHE_SIZE = int(os.environ.get("MP4_KEYFRAMES_CACHE_SIZE", "256"))
+HEAD_BYTES = 64 * 1024
+# Larger moov boxes mean an unusually long or odd source; not worth reading for a remux
+MAX_MOOV_BYTES = 32 * 1024 * 1024
+
+_BOX = struct.Struct(">I4s")
+_LARGE_SIZE = struct.Struct(">Q")
+_CONTAINERS = {b"trak", b"edts", b"mdia", b"minf", b"stbl"}
+
+s3 = awsClients.client("s3")
+
+_cache = OrderedDict()
+
+
+class SourceInfo:
+    __slots__ = ("video_codec", "width", "height", "audio_codec", "keyframes", "duration")
+
+    def __init__(self, video_codec, width, height, audio_codec, keyframes, duration):
+        self.video_codec = video_codec
+        self.width = width
+        self.height = height
+        self.audio_codec = audio_codec
+        # Presentation times in seconds of the video track's sync samples, ascending
+        self.keyframes = keyframes
+        self.duration = duration
+
+    def keyframe_at_or_before(self, seconds):
+        i = bisect_right(self.keyframes, seconds + 1e-6) - 1
+        return self.keyframes[i] if i >= 0 else None
+
+
+def probe(input_path):
+    # SourceInfo for s3://bucket/key.mp4, or None when it is not a readable MP4 with a video track
+    info = _cache.get(input_path)
+    if info is not None:
+        _cache.move_to_end(input_path)
+        return info
+    bucket, _, key = input_path[len("s3://"):].partition("/")
+    try:
+        moov = _read_moov(bucket, key)
+        info = parse_moov(moov) if moov else None
+    except (ClientError, struct.error, ValueError) as e:
+        print(f"Could not read the MP4 index of {input_path}: {e}")
+        return None
+    if info is not None:
+        _cache[input_path] = info
+        while len(_cache) > SOURCE_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return info
+
+
+def parse_moov(moov):
+    # moov payload (without its own header) -> SourceInfo, or None without a video track
+    video = audio = None
+    duration = 0.0
+    movie_timescale = 1
+    for box_type, start, end in _boxes(moov, 0, len(moov)):
+        if box_type == b"mvhd":
+            # Edit list segment durations are in the movie timescale
+            movie_timescale = struct.unpack_from(">I", moov, start + (20 if moov[start] == 1 else 12))[0] or 1
+            continue
+        if box_type != b"trak":
+            continue
+        track = _parse_track(moov, start, end)
+        if track["handler"] == b"vide" and video is None:
+            video = track
+        elif track["handler"] == b"soun" and audio is None:
+            audio = track
+        duration = max(duration, track["duration"])
+    if video is None:
+        return None
+    return SourceInfo(
+        video["codec"], video["width"], video["height"],
+        audio["codec"] if audio else None, _keyframe_times(video, movie_timescale), duration
+    )
+
+
+def _read_moov(bucket, key):
+    head, size = _get_range(bucket, key, 0, HEAD_BYTES - 1)
+    offset = 0
+    while offset + _BOX.size <= size:
+        if offset + 16 > len(head):
+            # Past the bytes we have (moov after a large mdat): fetch just the next box header
+            header, _ = _get_range(bucket, key, offset, offset + 15)
+            base = offset
+        else:
+            header, base = head, 0
+        box_size, box_type = _BOX.unpack_from(header, offset - base)
+        header_size = _BOX.size
+        if box_size == 1:
+            box_size = _LARGE_SIZE.unpack_from(header, offset - base + _BOX.size)[0]
+            header_size += _LARGE_SIZE.size
+        elif box_size == 0:
+            box_size = size - offset
+        if box_size < header_size:
+            raise ValueError(f"corrupt box {box_type!r} at {offset}")
+        if box_type == b"moov":
+            if box_size > MAX_MOOV_BYTES:
+                return None
+            if offset + box_size <= len(head):
+                return head[offset + header_size:offset + box_size]
+            body, _ = _get_range(bucket, key, offset + header_size, offset + box_size - 1)
+            return body
+        offset += box_size
+    return None
+
+
+def _get_range(bucket, key, first, last):
+    # (bytes, total object size)
+    response = s3.get_object(Bucket=bucket, Key=key, Range=f"bytes={first}-{last}")
+    total = int(response["ContentRange"].rsplit("/", 1)[1])
+    return response["Body"].read(), total
+
+
+def _boxes(data, start, end):
+    # (type, payload start, box end) for each box in data[start:end]
+    offset = start
+    while offset + _BOX.size <= end:
+        box_size, box_type = _BOX.unpack_from(data, offset)
+        header_size = _BOX.size
+        if box_size == 1:
+            box_size = _LARGE_SIZE.unpack_from(data, offset + _BOX.size)[0]
+            header_size += _LARGE_SIZE.size
+        elif box_size == 0:
+            box_size = end - offset
+        if box_size < header_size or offset + box_size > end:
+            raise ValueError(f"corrupt box {box_type!r} at {offset}")
+        yield box_type, offset + header_size, offset + box_size
+        offset += box_size
+
+
+def _parse_track(data, start, end):
+    track = {"handler": None, "timescale": 1, "duration": 0.0, "codec": None, "width": 0, "height": 0,
+             "stts": None, "stss": None, "ctts": None, "elst": None}
+    _walk(data, start, end, track)
+    return track
+
+
+def _walk(data, start, end, track):
+    for box_type, payload, box_end in _boxes(data, start, end):
+        if box_type in _CONTAINERS:
+            _walk(data, payload, box_end, track)
+        elif box_type == b"mdhd":
+            version = data[payload]
+            if version == 1:
+                timescale, duration = struct.unpack_from(">IQ", data, payload + 20)
+            else:
+                timescale, duration = struct.unpack_from(">II", data, payload + 12)
+            track["timescale"] = timescale
+            track["duration"] = duration / timescale if timescale else 0.0
+        elif box_type == b"hdlr":
+            track["handler"] = data[payload + 8:payload + 12]
+        elif box_type == b"stsd":
+            # First sample entry: size, format, then for visual entries width/height at +32
+            entry = payload + 8
+            track["codec"] = data[entry + 4:entry + 8].decode("latin-1")
+            if track["handler"] == b"vide":
+                track["width"], track["height"] = struct.unpack_from(">HH", data, entry + 32)
+        elif box_type == b"stts":
+            count = struct.unpack_from(">I", data, payload + 4)[0]
+            track["stts"] = _u32_array(data, payload + 8, count * 2)
+        elif box_type == b"stss":
+            count = struct.unpack_from(">I", data, payload + 4)[0]
+            track["stss"] = _u32_array(data, payload + 8, count)
+        elif box_type == b"ctts":
+            # (sample count, offset) runs; offsets are signed in version 1, and writers put
+            # negative values in version 0 boxes too
+            count = struct.unpack_from(">I", data, payload + 4)[0]
+            runs = _u32_array(data, payload + 8, count * 2)
+            track["ctts"] = [(runs[i], runs[i + 1] - (1 << 32) if runs[i + 1] >= 1 << 31 else runs[i + 1])
+                             for i in range(0, len(runs), 2)]
+        elif box_type == b"elst":
+            # (segment duration in the movie timescale, media time or -1 for an empty edit)
+            version = data[payload]
+            count = struct.unpack_from(">I", data, payload + 4)[0]
+            entry = ">Qq" if version == 1 else ">Ii"
+            size = 20 if version == 1 else 12
+            track["elst"] = [struct.unpack_from(entry, data, payload + 8 + i * size) for i in range(count)]
+
+
+def _u32_array(data, offset, count):
+    values = array("I")
+    values.frombytes(data[offset:offset + count * 4])
+    if len(values) != count:
+        raise ValueError("truncated sample table")
+    values.byteswap()
+    return values
+
+
+def _keyframe_times(track, movie_timescale=1):
+    # Walks the stts and ctts runs once alongside the (ascending, 1-based) sync sample numbers
+    stts = track["stts"] or array("I")
+    timescale = track["timescale"] or 1
+    runs = [(stts[i], stts[i + 1]) for i in range(0, len(stts), 2)]
+    samples = track["stss"]
+    if samples is None:
+        # No stss: every sample is a sync sample
+        samples = range(1, sum(count for count, _ in runs) + 1)
+    offsets = _Runs(track["ctts"] or [])
+    shift = _edit_shift(track["elst"], timescale, movie_timescale)
+    times = array("d")
+    run, run_first, decode_time = 0, 1, 0
+    for sample in samples:
+        while run < len(runs) and sample >= run_first + runs[run][0]:
+            decode_time += runs[run][0] * runs[run][1]
+            run_first += runs[run][0]
+            run += 1
+        if run >= len(runs):
+            break
+        presentation = decode_time + (sample - run_first) * runs[run][1] + offsets.at(sample)
+        seconds = presentation / timescale + shift
+        # Keyframes the edit list cuts off are never presented
+        if seconds >= -1e-6:
+            times.append(max(seconds, 0.0))
+    # Sync samples are in decode order; with reordering their presentation order can differ
+    return array("d", sorted(times))
+
+
+def _edit_shift(elst, timescale, movie_timescale):
+    # Seconds to add to a media presentation time to put it on the movie timeline: empty edits
+    # delay the track, and the first real edit's media time is where presentation starts
+    delay = 0
+    for segment_duration, media_time in elst or ():
+        if media_time == -1:
+            delay += segment_duration
+            continue
+        return delay / movie_timescale - media_time / timescale
+    return delay / movie_timescale
+
+
+class _Runs:
+    # Value for ascending 1-based sample numbers from (count, value) runs; 0 past the last run
+    __slots__ = ("runs", "index", "first")
+
+    def __init__(self, runs):
+        self.runs = runs
+        self.index = 0
+        self.first = 1
+
+    def at(self, sample):
+        while self.index < len(self.runs) and sample >= self.first + self.runs[self.index][0]:
+            self.first += self.runs[self.index][0]
+            self.index += 1
+        return self.runs[self.index][1] if self.index < len(self.runs) else 0
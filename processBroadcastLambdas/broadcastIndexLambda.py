@@ -0,0 +1,80 @@
+import posixpath
+
+import chunkedBroadcast
+import encodedRanges
+import hlsSegmentIndex
+import thumbnailIndex
+import thumbnailSprites
+import virtualSegment
+
+# Triggered by EventBridge "MediaConvert Job State Change" events with status COMPLETE or ERROR.
+# Builds the HLS segment time index, the thumbnail capture index and the scrub-preview sprite
+# sheets with their WebVTT track next to a finished broadcast encode's outputs. Chunks of a
+# chunked broadcast are indexed once the last one completes and the chunks are stitched; a
+# chunk that fails is resubmitted, or the broadcast marked failed (chunkedBroadcast).
+# The broadcast's range of its source is then recorded for segment requests (encodedRanges),
+# and its virtualSegment pointer flagged ready so segment requests start slicing it.
+
+
+def lambda_handler(event, context):
+    detail = event.get('detail', {})
+    user_metadata = detail.get('userMetadata', {})
+    kind = user_metadata.get('kind')
+    if kind == 'broadcast_chunk' and detail.get('status') == 'ERROR':
+        job_id = chunkedBroadcast.on_chunk_error(user_metadata, detail.get('errorMessage'))
+        return {
+            "status": "resubmitted" if job_id else "failed",
+            "jobId": job_id or detail.get('jobId'),
+            "chunk": user_metadata.get('chunk')
+        }
+    if detail.get('status') != 'COMPLETE' or kind not in ('broadcast', 'broadcast_chunk'):
+        return {"status": "ignored"}
+
+    interval = int(user_metadata.get('thumbnail_interval') or thumbnailIndex.THUMBNAIL_INTERVAL_SECONDS)
+    indexed = []
+    if kind == 'broadcast_chunk':
+        plan = chunkedBroadcast.on_chunk_complete(user_metadata)
+        if plan is None:
+            status = "failed" if chunkedBroadcast.failed(user_metadata) else "waiting"
+            return {"status": status, "jobId": detail.get('jobId'), "chunk": user_metadata.get('chunk')}
+        indexed += index_hls(plan['bucket'], plan['master'], plan['input'])
+        encodedRanges.record(plan['input'], 0.0, plan['bucket'], plan['master'])
+        indexed += index_thumbnails(plan['bucket'], plan['thumbnails'], interval)
+        return {"status": "indexed", "jobId": detail.get('jobId'), "indexes": indexed}
+
+    for group in detail.get('outputGroupDetails', []):
+        if group.get('type') == 'HLS_GROUP':
+            for master_path in group.get('playlistFilePaths', []):
+                bucket, master_key = master_path[len('s3://'):].split('/', 1)
+                indexed += index_hls(bucket, master_key, user_metadata.get('input'))
+        elif group.get('type') == 'FILE_GROUP':
+            # Frame capture outputs report the last capture written
+            for output in group.get('outputDetails', []):
+                for path in output.get('outputFilePaths', []):
+                    if not path.lower().endswith(('.jpg', '.jpeg')):
+                        continue
+                    bucket, key = path[len('s3://'):].split('/', 1)
+                    indexed += index_thumbnails(bucket, posixpath.dirname(key) + '/', interval)
+
+    encodedRanges.record_job(detail)
+    return {
+        "status": "indexed",
+        "jobId": detail.get('jobId'),
+        "indexes": indexed
+    }
+
+
+def index_hls(bucket, master_key, input_path=None):
+    if not hlsSegmentIndex.build_index(bucket, master_key):
+        return []
+    if input_path:
+        virtualSegment.mark_broadcast_ready(input_path, bucket, master_key)
+    return [hlsSegmentIndex.index_key(master_key)]
+
+
+def index_thumbnails(bucket, prefix, interval):
+    index = thumbnailIndex.build_index(bucket, prefix, interval)
+    if not index:
+        return []
+    track = thumbnailSprites.build_sprites(bucket, prefix, index)
+    return [thumbnailIndex.index_key(prefix)] + ([track] if track else [])
@@ -1,316 +1,57 @@
-import boto3
 import uuid
 import os
 
+import broadcastJob
+import chunkedBroadcast
+import encodeScheduler
+import mp4Keyframes
+import thumbnailIndex
+import timecode
+import virtualSegment
+
 MEDIACONVERT_ROLE = os.environ['MEDIACONVERT_ROLE']
 OUTPUT_BUCKET = os.environ['OUTPUT_BUCKET']
 DESTINATION_BUCKET = os.environ['DESTINATION_BUCKET']
 
-# Get MediaConvert endpoint
-mc_client = boto3.client('mediaconvert')
-endpoints = mc_client.describe_endpoints()
-mc_endpoint = endpoints['Endpoints'][0]['Url']
-mc = boto3.client('mediaconvert', endpoint_url=mc_endpoint)
 
 def lambda_handler(event, context):
     input_s3 = event['input_s3']
     id = event.get('id', 'fulljob')
     input_filename = input_s3.split('/')[-1]
     output_prefix = f"{id}/"
+    thumbnail_prefix = thumbnailIndex.thumbnail_prefix(id)
+    encode_class = event.get('encode_class', encodeScheduler.BROADCAST)
 
-    job_settings = {
-        "UserMetadata": {
-            "source": input_filename,
-            "job": id
-        },
-        "Role": MEDIACONVERT_ROLE,
-        "Settings": {
-            "TimecodeConfig": {
-            "Source": "ZEROBASED"
-            },
-            "OutputGroups": [
-            {
-                "Name": "Apple HLS",
-                "Outputs": [
-                {
-                    "ContainerSettings": {
-                    "Container": "M3U8",
-                    "M3u8Settings": {
-                        "AudioFramesPerPes": 4,
-                        "PcrControl": "PCR_EVERY_PES_PACKET",
-                        "PmtPid": 480,
-                        "PrivateMetadataPid": 503,
-                        "ProgramNumber": 1,
-                        "PatInterval": 0,
-                        "PmtInterval": 0,
-                        "VideoPid": 481,
-                        "AudioPids": [
-                        482,
-                        483,
-                        484,
-                        485,
-                        486,
-                        487,
-                        488,
-                        489,
-                        490,
-                        491,
-                        492,
-                        493,
-                        494,
-                        495,
-                        496,
-                        497,
-                        498
-                        ]
-                    }
-                    },
-                    "VideoDescription": {
-                    "Width": 480,
-                    "ScalingBehavior": "DEFAULT",
-                    "Height": 270,
-                    "TimecodeInsertion": "DISABLED",
-                    "AntiAlias": "ENABLED",
-                    "Sharpness": 100,
-                    "CodecSettings": {
-                        "Codec": "H_264",
-                        "H264Settings": {
-                        "InterlaceMode": "PROGRESSIVE",
-                        "ParNumerator": 1,
-                        "NumberReferenceFrames": 3,
-                        "Syntax": "DEFAULT",
-                        "GopClosedCadence": 1,
-                        "HrdBufferInitialFillPercentage": 90,
-                        "GopSize": 3,
-                        "Slices": 1,
-                        "GopBReference": "ENABLED",
-                        "HrdBufferSize": 1000000,
-                        "MaxBitrate": 400000,
-                        "SlowPal": "DISABLED",
-                        "ParDenominator": 1,
-                        "SpatialAdaptiveQuantization": "ENABLED",
-                        "TemporalAdaptiveQuantization": "ENABLED",
-                        "FlickerAdaptiveQuantization": "ENABLED",
-                        "EntropyEncoding": "CABAC",
-                        "FramerateControl": "INITIALIZE_FROM_SOURCE",
-                        "RateControlMode": "QVBR",
-                        "QvbrSettings": {
-                            "QvbrQualityLevel": 7
-                        },
-                        "CodecProfile": "HIGH",
-                        "Telecine": "NONE",
-                        "MinIInterval": 0,
-                        "AdaptiveQuantization": "MEDIUM",
-                        "FieldEncoding": "PAFF",
-                        "SceneChangeDetect": "ENABLED",
-                        "QualityTuningLevel": "SINGLE_PASS_HQ",
-                        "FramerateConversionAlgorithm": "DUPLICATE_DROP",
-                        "UnregisteredSeiTimecode": "DISABLED",
-                        "GopSizeUnits": "SECONDS",
-                        "ParControl": "SPECIFIED",
-                        "NumberBFramesBetweenReferenceFrames": 5,
-                        "RepeatPps": "DISABLED",
-                        "DynamicSubGop": "ADAPTIVE"
-                        }
-                    },
-                    "AfdSignaling": "NONE",
-                    "DropFrameTimecode": "ENABLED",
-                    "RespondToAfd": "NONE",
-                    "ColorMetadata": "INSERT"
-                    },
-                    "AudioDescriptions": [
-                    {
-                        "AudioTypeControl": "FOLLOW_INPUT",
-                        "AudioSourceName": "Audio Selector 1",
-                        "CodecSettings": {
-                        "Codec": "AAC",
-                        "AacSettings": {
-                            "AudioDescriptionBroadcasterMix": "NORMAL",
-                            "Bitrate": 64000,
-                            "RateControlMode": "CBR",
-                            "CodecProfile": "HEV1",
-                            "CodingMode": "CODING_MODE_2_0",
-                            "RawFormat": "NONE",
-                            "SampleRate": 48000,
-                            "Specification": "MPEG4"
-                        }
-                        },
-                        "LanguageCodeControl": "FOLLOW_INPUT",
-                        "AudioType": 0
-                    }
-                    ],
-                    "NameModifier": "_Ott_Hls_Ts_Avc_Aac_16x9_480x270p_0.4Mbps_qvbr"
-                },
-                {
-                    "ContainerSettings": {
-                    "Container": "M3U8",
-                    "M3u8Settings": {
-                        "AudioFramesPerPes": 4,
-                        "PcrControl": "PCR_EVERY_PES_PACKET",
-                        "PmtPid": 480,
-                        "PrivateMetadataPid": 503,
-                        "ProgramNumber": 1,
-                        "PatInterval": 0,
-                        "PmtInterval": 0,
-                        "VideoPid": 481,
-                        "AudioPids": [
-                        482,
-                        483,
-                        484,
-                        485,
-                        486,
-                        487,
-                        488,
-                        489,
-                        490,
-                        491,
-                        492,
-                        493,
-                        494,
-                        495,
-                        496,
-                        497,
-                        498
-                        ]
-                    }
-                    },
-                    "VideoDescription": {
-                    "Width": 640,
-                    "ScalingBehavior": "DEFAULT",
-                    "Height": 360,
-                    "TimecodeInsertion": "DISABLED",
-                    "AntiAlias": "ENABLED",
-                    "Sharpness": 100,
-                    "CodecSettings": {
-                        "Codec": "H_264",
-                        "H264Settings": {
-                        "InterlaceMode": "PROGRESSIVE",
-                        "ParNumerator": 1,
-                        "NumberReferenceFrames": 3,
-                        "Syntax": "DEFAULT",
-                        "GopClosedCadence": 1,
-                        "HrdBufferInitialFillPercentage": 90,
-                        "GopSize": 3,
-                        "Slices": 1,
-                        "GopBReference": "ENABLED",
-                        "HrdBufferSize": 3750000,
-                        "MaxBitrate": 1500000,
-                        "SlowPal": "DISABLED",
-                        "ParDenominator": 1,
-                        "SpatialAdaptiveQuantization": "ENABLED",
-                        "TemporalAdaptiveQuantization": "ENABLED",
-                        "FlickerAdaptiveQuantization": "ENABLED",
-                        "EntropyEncoding": "CABAC",
-                        "FramerateControl": "INITIALIZE_FROM_SOURCE",
-                        "RateControlMode": "QVBR",
-                        "QvbrSettings": {
-                            "QvbrQualityLevel": 7
-                        },
-                        "CodecProfile": "HIGH",
-                        "Telecine": "NONE",
-                        "MinIInterval": 0,
-                        "AdaptiveQuantization": "MEDIUM",
-                        "FieldEncoding": "PAFF",
-                        "SceneChangeDetect": "ENABLED",
-                        "QualityTuningLevel": "SINGLE_PASS_HQ",
-                        "FramerateConversionAlgorithm": "DUPLICATE_DROP",
-                        "UnregisteredSeiTimecode": "DISABLED",
-                        "GopSizeUnits": "SECONDS",
-                        "ParControl": "SPECIFIED",
-                        "NumberBFramesBetweenReferenceFrames": 5,
-                        "RepeatPps": "DISABLED",
-                        "DynamicSubGop": "ADAPTIVE"
-                        }
-                    },
-                    "AfdSignaling": "NONE",
-                    "DropFrameTimecode": "ENABLED",
-                    "RespondToAfd": "NONE",
-                    "ColorMetadata": "INSERT"
-                    },
-                    "AudioDescriptions": [
-                    {
-                        "AudioTypeControl": "FOLLOW_INPUT",
-                        "AudioSourceName": "Audio Selector 1",
-                        "CodecSettings": {
-                        "Codec": "AAC",
-                        "AacSettings": {
-                            "AudioDescriptionBroadcasterMix": "NORMAL",
-                            "Bitrate": 64000,
-                            "RateControlMode": "CBR",
-                            "CodecProfile": "HEV1",
-                            "CodingMode": "CODING_MODE_2_0",
-                            "RawFormat": "NONE",
-                            "SampleRate": 48000,
-                            "Specification": "MPEG4"
-                        }
-                        },
-                        "LanguageCodeControl": "FOLLOW_INPUT",
-                        "AudioType": 0
-                    }
-                    ],
-                    "NameModifier": "_Ott_Hls_Ts_Avc_Aac_16x9_640x360p_1.5Mbps_qvbr"
-                }
-                ],
-                "OutputGroupSettings": {
-                "Type": "HLS_GROUP_SETTINGS",
-                "HlsGroupSettings": {
-                    "ManifestDurationFormat": "INTEGER",
-                    "SegmentLength": 3,
-                    "TimedMetadataId3Period": 10,
-                    "CaptionLanguageSetting": "OMIT",
-                    "Destination": f"s3://{DESTINATION_BUCKET}/{id}/hls/{output_prefix}",
-                    "TimedMetadataId3Frame": "PRIV",
-                    "CodecSpecification": "RFC_4281",
-                    "OutputSelection": "MANIFESTS_AND_SEGMENTS",
-                    "ProgramDateTimePeriod": 600,
-                    "MinSegmentLength": 0,
-                    "DirectoryStructure": "SINGLE_DIRECTORY",
-                    "ProgramDateTime": "EXCLUDE",
-                    "SegmentControl": "SEGMENTED_FILES",
-                    "ManifestCompression": "NONE",
-                    "ClientCache": "ENABLED",
-                    "StreamInfResolution": "INCLUDE"
-                }
-                }
+    # Long broadcasts are encoded as concurrent GOP-aligned chunks and stitched on completion
+    chunks = int(event.get('chunks') or chunkedBroadcast.BROADCAST_CHUNKS)
+    if chunks > 1:
+        duration = broadcast_duration(event, input_s3)
+        job_ids = duration and chunkedBroadcast.submit(
+            input_s3, id, DESTINATION_BUCKET, MEDIACONVERT_ROLE, duration, chunks,
+            user_metadata={"source": input_filename}, encode_class=encode_class
+        )
+        if job_ids:
+            virtualSegment.record_broadcast_encode(input_s3, id, bucket=DESTINATION_BUCKET, thumbnail_prefix=thumbnail_prefix)
+            return {
+                "status": "submitted",
+                "jobIds": job_ids,
+                "chunks": len(job_ids),
+                "outputPrefix": output_prefix
             }
-            ],
-            "AdAvailOffset": 0,
-            "Inputs": [
-            {
-                "AudioSelectors": {
-                "Audio Selector 1": {
-                    "Offset": 0,
-                    "DefaultSelection": "NOT_DEFAULT",
-                    "ProgramSelection": 1
-                }
-                },
-                "VideoSelector": {
-                "ColorSpace": "FOLLOW",
-                "Rotate": "DEGREE_0"
-                },
-                "FilterEnable": "AUTO",
-                "PsiControl": "USE_PSI",
-                "FilterStrength": 0,
-                "DeblockFilter": "DISABLED",
-                "DenoiseFilter": "DISABLED",
-                "TimecodeSource": "ZEROBASED",
-                "FileInput": input_s3,            }
-            ]
-        },
-        "BillingTagsSource": "JOB",
-        "AccelerationSettings": {
-            "Mode": "PREFERRED"
-        },
-        "StatusUpdateInterval": "SECONDS_60",
-        "Priority": 0,
-        "Tags": {
-            "SolutionId": "SO0021"
-        }
-    }
 
-    response = mc.create_job(**job_settings)
+    response = broadcastJob.submit(
+        input_s3, id, DESTINATION_BUCKET, MEDIACONVERT_ROLE, encode_class=encode_class
+    )
     return {
         "status": "submitted",
         "jobId": response['Job']['Id'],
         "outputPrefix": output_prefix
-    }
\ No newline at end of file
+    }
+
+
+def broadcast_duration(event, input_s3):
+    # Seconds, from the event or the source's MP4 index; None when neither knows
+    if event.get('duration'):
+        return timecode.to_seconds(event['duration'])
+    info = mp4Keyframes.probe(input_s3)
+    return info.duration if info else None
@@ -1,22 +1,22 @@
-import boto3
 import uuid
 import os
 
+import encodeScheduler
+import renditionLadder
+import thumbnailIndex
+import virtualSegment
+
 MEDIACONVERT_ROLE = os.environ['MEDIACONVERT_ROLE']
 OUTPUT_BUCKET = os.environ['OUTPUT_BUCKET']
 DESTINATION_BUCKET = os.environ['DESTINATION_BUCKET']
 
-# Get MediaConvert endpoint
-mc_client = boto3.client('mediaconvert')
-endpoints = mc_client.describe_endpoints()
-mc_endpoint = endpoints['Endpoints'][0]['Url']
-mc = boto3.client('mediaconvert', endpoint_url=mc_endpoint)
 
 def lambda_handler(event, context):
     input_s3 = event['input_s3']
     id = event.get('id', 'fulljob')
     input_filename = input_s3.split('/')[-1]
     output_prefix = f"{id}/"
+    thumbnail_prefix = thumbnailIndex.thumbnail_prefix(id)
 
     job_settings = {
         "Role": MEDIACONVERT_ROLE,
@@ -109,7 +109,7 @@ def lambda_handler(event, context):
                     "OutputGroupSettings": {
                         "Type": "FILE_GROUP_SETTINGS",
                         "FileGroupSettings": {
-                            "Destination": f"s3://{DESTINATION_BUCKET}/thumbnails/{output_prefix}"
+                            "Destination": f"s3://{DESTINATION_BUCKET}/{thumbnail_prefix}"
                         }
                     },
                     "Outputs": [
@@ -121,9 +121,10 @@ def lambda_handler(event, context):
                                 "CodecSettings": {
                                     "Codec": "FRAME_CAPTURE",
                                     "FrameCaptureSettings": {
+                                        # One frame every interval for the whole broadcast; segments pick the nearest
                                         "FramerateNumerator": 1,
-                                        "FramerateDenominator": 1,
-                                        "MaxCaptures": 1,
+                                        "FramerateDenominator": thumbnailIndex.THUMBNAIL_INTERVAL_SECONDS,
+                                        "MaxCaptures": renditionLadder.MAX_INTERVAL_CAPTURES,
                                         "Quality": 80
                                     }
                                 }
@@ -147,11 +148,15 @@ def lambda_handler(event, context):
         },
         "UserMetadata": {
             "source": input_filename,
-            "job": id
+            "input": input_s3,
+            "job": id,
+            "kind": "broadcast",
+            "thumbnail_interval": str(thumbnailIndex.THUMBNAIL_INTERVAL_SECONDS)
         }
     }
 
-    response = mc.create_job(**job_settings)
+    response = encodeScheduler.submit(job_settings, event.get('encode_class', encodeScheduler.BROADCAST))
+    virtualSegment.record_broadcast_encode(input_s3, id, bucket=DESTINATION_BUCKET, thumbnail_prefix=thumbnail_prefix)
     return {
         "status": "submitted",
         "jobId": response['Job']['Id'],
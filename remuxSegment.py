@@ -0,0 +1,58 @@
+import math
+import os
+
+import mp4Keyframes
+import timecode
+
+# Stream-copy fast path for segment encodes. When the source proxy is already H.264/AAC at a
+# usable resolution, the segment is packaged with the "segment_remux" ladder (video and audio
+# passthrough) instead of a QVBR re-encode. Passthrough clipping has to start on a keyframe,
+# so the clip is snapped back to the keyframe at or before the requested start; requests that
+# would gain more than REMUX_MAX_SNAP_SECONDS of lead-in get a full encode instead. The remux
+# ladder always carries a passthrough audio output, so sources without an AAC track (including
+# silent ones) are encoded as before.
+REMUX_SEGMENTS = os.environ.get("REMUX_SEGMENTS", "true").lower() == "true"
+REMUX_MAX_SNAP_SECONDS = float(os.environ.get("REMUX_MAX_SNAP_SECONDS", "2"))
+REMUX_MIN_HEIGHT = int(os.environ.get("REMUX_MIN_HEIGHT", "270"))
+REMUX_MAX_HEIGHT = int(os.environ.get("REMUX_MAX_HEIGHT", "1080"))
+REMUX_LADDER = "segment_remux"
+
+VIDEO_CODECS = ("avc1", "avc3")
+AUDIO_CODECS = ("mp4a",)
+
+
+def remux_clipping(input_path, start_time, duration):
+    # (StartTimecode, EndTimecode) snapped to a keyframe when the segment can be stream-copied,
+    # otherwise None and the caller encodes as before
+    if not REMUX_SEGMENTS or not input_path.lower().endswith((".mp4", ".m4v", ".mov")):
+        return None
+    info = mp4Keyframes.probe(input_path)
+    reason = ineligible(info)
+    if reason:
+        print(f"Re-encoding {input_path}: {reason}")
+        return None
+
+    start_ms = timecode.parse_milliseconds(start_time)
+    end_ms = start_ms + timecode.parse_milliseconds(duration)
+    keyframe = info.keyframe_at_or_before(start_ms / 1000)
+    if keyframe is None or start_ms / 1000 - keyframe > REMUX_MAX_SNAP_SECONDS:
+        print(f"Re-encoding {input_path}: no keyframe within {REMUX_MAX_SNAP_SECONDS}s before {start_time}")
+        return None
+    # Round up to the frame containing the keyframe, never into the frame before it
+    start = timecode.Timecode.from_milliseconds(math.ceil(keyframe * 1000))
+    return str(start), str(timecode.Timecode.from_milliseconds(end_ms))
+
+
+def ineligible(info):
+    # Why a source cannot be stream-copied, or None
+    if info is None:
+        return "no readable MP4 index"
+    if info.video_codec not in VIDEO_CODECS:
+        return f"video codec {info.video_codec}"
+    if info.audio_codec not in AUDIO_CODECS:
+        return f"audio codec {info.audio_codec}"
+    if not REMUX_MIN_HEIGHT <= info.height <= REMUX_MAX_HEIGHT:
+        return f"source height {info.height}"
+    if not info.keyframes:
+        return "no keyframes"
+    return None
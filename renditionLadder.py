@@ -0,0 +1,409 @@
+import re
+from functools import lru_cache
+
+# Compact rendition ladders, compiled once per container into MediaConvert job templates.
+# A compiled template is shared between invocations, so it is frozen (FrozenDict and tuples)
+# and a caller cannot corrupt it for later requests. build_job() copies only the branches it
+# patches per request (job root, Settings, Inputs[0] and its InputClippings, each group's
+# OutputGroupSettings, and the outputs given name modifiers, capture intervals or PTS offsets);
+# Outputs, codec settings and audio descriptions stay shared and frozen. FrozenDict is a dict
+# and tuples are sequences, so jobs serialize for create_job and JSON without copying.
+
+AUDIO_PIDS = list(range(482, 499))
+
+M3U8_SETTINGS = {
+    "AudioFramesPerPes": 4,
+    "PcrControl": "PCR_EVERY_PES_PACKET",
+    "PmtPid": 480,
+    "PrivateMetadataPid": 503,
+    "ProgramNumber": 1,
+    "PatInterval": 0,
+    "PmtInterval": 0,
+    "VideoPid": 481,
+    "AudioPids": AUDIO_PIDS
+}
+
+H264_QVBR_SETTINGS = {
+    "InterlaceMode": "PROGRESSIVE",
+    "ParNumerator": 1,
+    "NumberReferenceFrames": 3,
+    "Syntax": "DEFAULT",
+    "GopClosedCadence": 1,
+    "HrdBufferInitialFillPercentage": 90,
+    "GopSize": 3,
+    "Slices": 1,
+    "GopBReference": "ENABLED",
+    "SlowPal": "DISABLED",
+    "ParDenominator": 1,
+    "SpatialAdaptiveQuantization": "ENABLED",
+    "TemporalAdaptiveQuantization": "ENABLED",
+    "FlickerAdaptiveQuantization": "ENABLED",
+    "EntropyEncoding": "CABAC",
+    "FramerateControl": "INITIALIZE_FROM_SOURCE",
+    "RateControlMode": "QVBR",
+    "QvbrSettings": {
+        "QvbrQualityLevel": 7
+    },
+    "CodecProfile": "HIGH",
+    "Telecine": "NONE",
+    "MinIInterval": 0,
+    "AdaptiveQuantization": "MEDIUM",
+    "FieldEncoding": "PAFF",
+    "SceneChangeDetect": "ENABLED",
+    "QualityTuningLevel": "SINGLE_PASS_HQ",
+    "FramerateConversionAlgorithm": "DUPLICATE_DROP",
+    "UnregisteredSeiTimecode": "DISABLED",
+    "GopSizeUnits": "SECONDS",
+    "ParControl": "SPECIFIED",
+    "NumberBFramesBetweenReferenceFrames": 5,
+    "RepeatPps": "DISABLED",
+    "DynamicSubGop": "ADAPTIVE"
+}
+
+HLS_AUDIO_DESCRIPTION = {
+    "AudioTypeControl": "FOLLOW_INPUT",
+    "AudioSourceName": "Audio Selector 1",
+    "CodecSettings": {
+        "Codec": "AAC",
+        "AacSettings": {
+            "AudioDescriptionBroadcasterMix": "NORMAL",
+            "Bitrate": 64000,
+            "RateControlMode": "CBR",
+            "CodecProfile": "HEV1",
+            "CodingMode": "CODING_MODE_2_0",
+            "RawFormat": "NONE",
+            "SampleRate": 48000,
+            "Specification": "MPEG4"
+        }
+    },
+    "LanguageCodeControl": "FOLLOW_INPUT",
+    "AudioType": 0
+}
+
+HLS_GROUP_SETTINGS = {
+    "ManifestDurationFormat": "INTEGER",
+    "SegmentLength": 3,
+    "TimedMetadataId3Period": 10,
+    "CaptionLanguageSetting": "OMIT",
+    "TimedMetadataId3Frame": "PRIV",
+    "CodecSpecification": "RFC_4281",
+    "OutputSelection": "MANIFESTS_AND_SEGMENTS",
+    "ProgramDateTimePeriod": 600,
+    "MinSegmentLength": 0,
+    "DirectoryStructure": "SINGLE_DIRECTORY",
+    "ProgramDateTime": "EXCLUDE",
+    "SegmentControl": "SEGMENTED_FILES",
+    "ManifestCompression": "NONE",
+    "ClientCache": "ENABLED",
+    "StreamInfResolution": "INCLUDE"
+}
+
+SEGMENT_INPUT = {
+    "AudioSelectors": {
+        "Audio Selector 1": {"DefaultSelection": "DEFAULT"}
+    },
+    "TimecodeSource": "ZEROBASED"
+}
+
+BROADCAST_INPUT = {
+    "AudioSelectors": {
+        "Audio Selector 1": {
+            "Offset": 0,
+            "DefaultSelection": "NOT_DEFAULT",
+            "ProgramSelection": 1
+        }
+    },
+    "VideoSelector": {
+        "ColorSpace": "FOLLOW",
+        "Rotate": "DEGREE_0"
+    },
+    "FilterEnable": "AUTO",
+    "PsiControl": "USE_PSI",
+    "FilterStrength": 0,
+    "DeblockFilter": "DISABLED",
+    "DenoiseFilter": "DISABLED",
+    "TimecodeSource": "ZEROBASED"
+}
+
+# "hls" rungs are WIDTHxHEIGHT@MBPS; "mp4" is a max bitrate; either can be "copy" to pass the
+# source's H.264 and AAC through untouched (input clipping then starts on a keyframe, see remuxSegment);
+# "thumbnail" adds a frame capture:
+# True for a single frame, or N to capture a frame every N seconds for the whole input.
+# Output groups are emitted in the order the keys appear.
+LADDERS = {
+    "segment": {
+        # Thumbnails come from the broadcast's interval captures (thumbnailIndex)
+        "mp4": "5Mbps",
+        "hls": ("480x270@0.4Mbps", "640x360@1.5Mbps"),
+        "input": SEGMENT_INPUT,
+    },
+    "segment_remux": {
+        "mp4": "copy",
+        "hls": ("copy",),
+        "input": SEGMENT_INPUT,
+    },
+    "broadcast": {
+        "hls": ("480x270@0.4Mbps", "640x360@1.5Mbps"),
+        "thumbnail": 10,
+        "input": BROADCAST_INPUT,
+        "settings": {
+            "TimecodeConfig": {"Source": "ZEROBASED"},
+            "AdAvailOffset": 0
+        },
+        "job": {
+            "BillingTagsSource": "JOB",
+            "AccelerationSettings": {"Mode": "PREFERRED"},
+            "StatusUpdateInterval": "SECONDS_60",
+            "Priority": 0,
+            "Tags": {"SolutionId": "SO0021"}
+        },
+    },
+}
+
+# MediaConvert's upper bound; interval captures run for the whole input
+MAX_INTERVAL_CAPTURES = 10000000
+
+PASSTHROUGH_VIDEO = {
+    "CodecSettings": {
+        "Codec": "PASSTHROUGH",
+        "PassthroughSettings": {
+            "FrameControl": "NEAREST_IDRFRAME",
+            "VideoSelectorMode": "AUTO"
+        }
+    }
+}
+
+PASSTHROUGH_AUDIO = {
+    "AudioSourceName": "Audio Selector 1",
+    "CodecSettings": {"Codec": "PASSTHROUGH"}
+}
+
+_RUNG = re.compile(r"^(\d+)x(\d+)@([\d.]+)Mbps$")
+_GROUP_KINDS = ("mp4", "thumbnail", "hls")
+
+
+def parse_bitrate(spec):
+    if not spec.endswith("Mbps"):
+        raise ValueError(f"Unsupported bitrate: {spec}")
+    return int(round(float(spec[:-4]) * 1000000))
+
+
+def hls_output(spec):
+    if spec == "copy":
+        return {
+            "ContainerSettings": {
+                "Container": "M3U8",
+                "M3u8Settings": M3U8_SETTINGS
+            },
+            "VideoDescription": PASSTHROUGH_VIDEO,
+            "AudioDescriptions": [PASSTHROUGH_AUDIO],
+            "NameModifier": "_Ott_Hls_Ts_Avc_Aac_source_copy"
+        }
+    match = _RUNG.match(spec)
+    if not match:
+        raise ValueError(f"Unsupported HLS rung: {spec}")
+    width, height, mbps = int(match.group(1)), int(match.group(2)), match.group(3)
+    max_bitrate = parse_bitrate(f"{mbps}Mbps")
+    h264 = dict(H264_QVBR_SETTINGS, MaxBitrate=max_bitrate, HrdBufferSize=max_bitrate * 5 // 2)
+    return {
+        "ContainerSettings": {
+            "Container": "M3U8",
+            "M3u8Settings": M3U8_SETTINGS
+        },
+        "VideoDescription": {
+            "Width": width,
+            "ScalingBehavior": "DEFAULT",
+            "Height": height,
+            "TimecodeInsertion": "DISABLED",
+            "AntiAlias": "ENABLED",
+            "Sharpness": 100,
+            "CodecSettings": {
+                "Codec": "H_264",
+                "H264Settings": h264
+            },
+            "AfdSignaling": "NONE",
+            "DropFrameTimecode": "ENABLED",
+            "RespondToAfd": "NONE",
+            "ColorMetadata": "INSERT"
+        },
+        "AudioDescriptions": [HLS_AUDIO_DESCRIPTION],
+        "NameModifier": f"_Ott_Hls_Ts_Avc_Aac_16x9_{width}x{height}p_{mbps}Mbps_qvbr"
+    }
+
+
+def hls_group(rungs):
+    return {
+        "Name": "Apple HLS",
+        "Outputs": [hls_output(rung) for rung in rungs],
+        "OutputGroupSettings": {
+            "Type": "HLS_GROUP_SETTINGS",
+            "HlsGroupSettings": HLS_GROUP_SETTINGS
+        }
+    }
+
+
+def mp4_group(max_bitrate):
+    copy = max_bitrate == "copy"
+    video = PASSTHROUGH_VIDEO if copy else {
+        "CodecSettings": {
+            "Codec": "H_264",
+            "H264Settings": {
+                "RateControlMode": "QVBR",
+                "SceneChangeDetect": "TRANSITION_DETECTION",
+                "MaxBitrate": parse_bitrate(max_bitrate),
+                "QualityTuningLevel": "SINGLE_PASS"
+            }
+        }
+    }
+    return {
+        "Name": "File Group",
+        "OutputGroupSettings": {
+            "Type": "FILE_GROUP_SETTINGS",
+            "FileGroupSettings": {}
+        },
+        "Outputs": [{
+            "ContainerSettings": {"Container": "MP4"},
+            "VideoDescription": video,
+            "AudioDescriptions": [PASSTHROUGH_AUDIO if copy else {
+                "AudioSourceName": "Audio Selector 1",
+                "CodecSettings": {
+                    "Codec": "AAC",
+                    "AacSettings": {
+                        "Bitrate": 96000,
+                        "CodingMode": "CODING_MODE_2_0",
+                        "SampleRate": 48000
+                    }
+                }
+            }]
+        }]
+    }
+
+
+def thumbnail_group(interval=None):
+    return {
+        "Name": "Thumbnails",
+        "OutputGroupSettings": {
+            "Type": "FILE_GROUP_SETTINGS",
+            "FileGroupSettings": {}
+        },
+        "Outputs": [{
+            "ContainerSettings": {"Container": "RAW"},
+            "VideoDescription": {
+                "CodecSettings": {
+                    "Codec": "FRAME_CAPTURE",
+                    "FrameCaptureSettings": {
+                        "FramerateNumerator": 1,
+                        "FramerateDenominator": interval or 1,
+                        "MaxCaptures": MAX_INTERVAL_CAPTURES if interval else 1,
+                        "Quality": 80
+                    }
+                }
+            },
+            "NameModifier": "_thumb"
+        }]
+    }
+
+
+def compile_ladder(ladder):
+    groups = []
+    for kind in ladder:
+        if kind == "hls":
+            groups.append((kind, hls_group(ladder[kind])))
+        elif kind == "mp4":
+            groups.append((kind, mp4_group(ladder[kind])))
+        elif kind == "thumbnail" and ladder[kind]:
+            groups.append((kind, thumbnail_group(None if ladder[kind] is True else ladder[kind])))
+    return {
+        "groups": tuple(groups),
+        "input": ladder.get("input", {}),
+        "settings": ladder.get("settings", {}),
+        "job": ladder.get("job", {}),
+    }
+
+
+@lru_cache(maxsize=None)
+def get_template(name):
+    return freeze(compile_ladder(LADDERS[name]))
+
+
+class FrozenDict(dict):
+    # A dict that refuses to change; dict(frozen, Key=value) makes a plain, patchable copy
+    __slots__ = ()
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("compiled ladder templates are read-only; copy the branch to change it")
+
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __reduce__(self):
+        return FrozenDict, (dict(self),)
+
+
+def freeze(value):
+    # Read-only copy of a settings tree: dicts become FrozenDicts, lists become tuples
+    if isinstance(value, dict):
+        return FrozenDict({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def thaw(value):
+    # Plain dict/list copy of a (possibly frozen) settings tree
+    if isinstance(value, dict):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [thaw(item) for item in value]
+    return value
+
+
+def build_job(template, role, input_s3, destinations, clipping=None, user_metadata=None,
+              mp4_name_modifier=None, thumbnail_interval=None, hls_pts_offset=None):
+    # destinations maps each output group kind ("hls", "mp4", "thumbnail") to its S3 prefix;
+    # hls_pts_offset (whole seconds) starts TS timestamps there, for chunks of one timeline
+    groups = []
+    for kind, group in template["groups"]:
+        group = _with_destination(group, destinations[kind])
+        if kind == "mp4" and mp4_name_modifier:
+            group["Outputs"] = [dict(group["Outputs"][0], NameModifier=mp4_name_modifier)]
+        elif kind == "thumbnail" and thumbnail_interval:
+            group["Outputs"] = [_with_capture_interval(group["Outputs"][0], thumbnail_interval)]
+        elif kind == "hls" and hls_pts_offset is not None:
+            group["Outputs"] = [_with_pts_offset(output, hls_pts_offset) for output in group["Outputs"]]
+        groups.append(group)
+
+    job_input = dict(template["input"], FileInput=input_s3)
+    if clipping:
+        # An end of None runs to the end of the input
+        job_input["InputClippings"] = [{"StartTimecode": clipping[0]}]
+        if clipping[1] is not None:
+            job_input["InputClippings"][0]["EndTimecode"] = clipping[1]
+
+    settings = dict(template["settings"], OutputGroups=groups, Inputs=[job_input])
+    job = dict(template["job"], Role=role, Settings=settings)
+    if user_metadata:
+        job["UserMetadata"] = user_metadata
+    return job
+
+
+def _with_destination(group, destination):
+    group_settings = group["OutputGroupSettings"]
+    key = "HlsGroupSettings" if group_settings["Type"] == "HLS_GROUP_SETTINGS" else "FileGroupSettings"
+    return dict(group, OutputGroupSettings={
+        "Type": group_settings["Type"],
+        key: dict(group_settings[key], Destination=destination)
+    })
+
+
+def _with_capture_interval(output, seconds):
+    video = output["VideoDescription"]
+    codec = video["CodecSettings"]
+    capture = dict(codec["FrameCaptureSettings"], FramerateDenominator=seconds)
+    return dict(output, VideoDescription=dict(video, CodecSettings=dict(codec, FrameCaptureSettings=capture)))
+
+
+def _with_pts_offset(output, seconds):
+    container = output["ContainerSettings"]
+    m3u8 = dict(container.get("M3u8Settings", {}), PtsOffsetMode="SECONDS", PtsOffset=int(seconds))
+    return dict(output, ContainerSettings=dict(container, M3u8Settings=m3u8))
@@ -0,0 +1,31 @@
+from botocore.exceptions import ClientError
+
+import encodeScheduler
+import encodedRanges
+import jobStatus
+
+# EventBridge target for "MediaConvert Job State Change" events. Keeps each segment's
+# status record (status, progress, error) current so /stream never has to wait on S3,
+# frees the encode class slot (encodeScheduler) of every job that has finished, and records
+# each finished segment encode's range of its source (encodedRanges) for later overlapping requests.
+
+
+def lambda_handler(event, context):
+    status = jobStatus.apply_event(event)
+    released = encodeScheduler.apply_event(event)
+    detail = event.get("detail", {})
+    recorded = []
+    # Broadcasts are recorded by broadcastIndexLambda, once their index exists
+    if detail.get("status") == "COMPLETE" and \
+            detail.get("userMetadata", {}).get("kind") not in ("broadcast", "broadcast_chunk"):
+        try:
+            recorded = encodedRanges.record_job(detail)
+        except ClientError as e:
+            print(f"Could not record the encoded range of job {detail.get('jobId')}:", str(e))
+    return {
+        "segment_id": detail.get("userMetadata", {}).get("segment_id"),
+        "jobId": detail.get("jobId"),
+        "status": status or "ignored",
+        "slotReleased": released,
+        "rangesRecorded": len(recorded)
+    }
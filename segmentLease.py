@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+import time
+import uuid
+
+from botocore.exceptions import ClientError
+
+import awsClients
+import encodeScheduler
+
+# Single-flight encode submission: a conditional write in DynamoDB gives exactly one
+# invocation the right to submit a segment's MediaConvert job; concurrent requests for the
+# same segment_id see the lease and attach to that job instead of submitting their own.
+SEGMENT_JOBS_TABLE = os.environ.get("SEGMENT_JOBS_TABLE", "tvna-segment-jobs")
+# Long enough to cover an encode; an expired lease can be taken over (e.g. after a failed job)
+LEASE_SECONDS = int(os.environ.get("SEGMENT_LEASE_SECONDS", "900"))
+# DynamoDB TTL attribute, so finished leases are cleaned up
+RECORD_TTL_SECONDS = 86400
+
+dynamodb = awsClients.resource("dynamodb")
+
+
+def acquire(segment_id, owner, lease_seconds=LEASE_SECONDS):
+    # Returns the lease record; the caller holds the lease when record["owner"] == owner.
+    # An update rather than a put, so the record keeps its attempt counter across leases
+    now = int(time.time())
+    table = dynamodb.Table(SEGMENT_JOBS_TABLE)
+    try:
+        return table.update_item(
+            Key={"segment_id": segment_id},
+            UpdateExpression="SET #owner = :owner, #status = :submitting, lease_expires = :lease_expires,"
+                             " expires_at = :expires_at REMOVE job_id, #error, progress",
+            ConditionExpression="attribute_not_exists(segment_id) OR lease_expires < :now",
+            ExpressionAttributeNames={"#owner": "owner", "#status": "status", "#error": "error"},
+            ExpressionAttributeValues={
+                ":owner": owner,
+                ":submitting": "SUBMITTING",
+                ":lease_expires": now + lease_seconds,
+                ":expires_at": now + lease_seconds + RECORD_TTL_SECONDS,
+                ":now": now,
+            },
+            ReturnValues="ALL_NEW"
+        )["Attributes"]
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+    current = table.get_item(Key={"segment_id": segment_id}, ConsistentRead=True).get("Item")
+    # The holder can release between our failed write and this read; report it as held so we just poll
+    return current or {"segment_id": segment_id, "owner": None, "status": "SUBMITTING"}
+
+
+def record_job(segment_id, owner, job_id):
+    dynamodb.Table(SEGMENT_JOBS_TABLE).update_item(
+        Key={"segment_id": segment_id},
+        UpdateExpression="SET #status = :submitted, job_id = :job_id",
+        ConditionExpression="#owner = :owner",
+        ExpressionAttributeNames={"#status": "status", "#owner": "owner"},
+        ExpressionAttributeValues={":submitted": "SUBMITTED", ":job_id": job_id, ":owner": owner}
+    )
+
+
+def release(segment_id, owner):
+    # Give up the lease after a failed submission so the next request can retry immediately.
+    # The record is reset rather than deleted so its attempt counter survives
+    try:
+        dynamodb.Table(SEGMENT_JOBS_TABLE).update_item(
+            Key={"segment_id": segment_id},
+            UpdateExpression="SET lease_expires = :zero REMOVE #owner, #status, job_id",
+            ConditionExpression="#owner = :owner",
+            ExpressionAttributeNames={"#owner": "owner", "#status": "status"},
+            ExpressionAttributeValues={":owner": owner, ":zero": 0}
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+
+
+def submit_once(segment_id, owner, job_settings, encode_class=encodeScheduler.INTERACTIVE, clip_seconds=None):
+    # (record, submitted): submits only while holding the lease, otherwise attaches to the holder's job
+    lease = acquire(segment_id, owner)
+    if lease["owner"] != owner:
+        print(f"Encode of {segment_id} already in flight (owner {lease['owner']}), attaching")
+        return lease, False
+    try:
+        token = idempotency_token(segment_id, job_settings, int(lease.get("attempt", 0)))
+        job = dict(job_settings, ClientRequestToken=token)
+        response = encodeScheduler.submit(job, encode_class, clip_seconds)
+    except Exception:
+        release(segment_id, owner)
+        raise
+    job_id = response["Job"]["Id"]
+    record_job(segment_id, owner, job_id)
+    return dict(lease, status="SUBMITTED", job_id=job_id), True
+
+
+def idempotency_token(segment_id, job_settings, attempt=0):
+    # Same segment + same ladder/settings + same attempt -> same ClientRequestToken, so retried
+    # submissions are deduplicated by MediaConvert. attempt counts failed jobs (jobStatus bumps
+    # it on ERROR); without it a resubmission would get the failed job back
+    settings = {k: v for k, v in job_settings.items() if k != "ClientRequestToken"}
+    digest = hashlib.sha256(f"{segment_id}:{attempt}:{json.dumps(settings, sort_keys=True)}".encode()).digest()
+    return str(uuid.UUID(bytes=digest[:16]))
+
+
+def new_owner(context):
+    return getattr(context, "aws_request_id", None) or str(uuid.uuid4())
@@ -0,0 +1,170 @@
+import os
+import time
+from collections import OrderedDict
+
+import awsClients
+import segmentSnapshot
+
+# Warm-container cache of segment_metadata rows. Segment metadata does not change once
+# ingested, so a row is kept until it ages out (TTL) or is pushed out by newer ones (LRU).
+# A miss loads every segment of the same broadcast in one Data API call, since players
+# tend to request neighbouring segments next. Rows in the segmentSnapshot export are read from
+# the memory-mapped file, so only segments added since the last export reach (a possibly
+# paused) Aurora.
+DB_SECRET_ARN = os.environ.get("DB_SECRET_ARN")
+DB_CLUSTER_ARN = os.environ.get("DB_CLUSTER_ARN")
+DB_NAME = os.environ.get("DB_NAME")
+CACHE_SIZE = int(os.environ.get("SEGMENT_METADATA_CACHE_SIZE", "4096"))
+TTL_SECONDS = float(os.environ.get("SEGMENT_METADATA_TTL_SECONDS", "3600"))
+# Upper bound on rows pulled in by one broadcast prefetch
+PREFETCH_LIMIT = int(os.environ.get("SEGMENT_METADATA_PREFETCH_LIMIT", "500"))
+
+rds = awsClients.client("rds-data")
+
+_cache = OrderedDict()
+# hits: warm cache; snapshot: served from the mmap export; misses: had to query Aurora
+stats = {"hits": 0, "misses": 0, "snapshot": 0, "prefetched": 0}
+
+
+class SegmentMetadata:
+    __slots__ = ("segment_id", "input_path", "start_time", "duration", "expires")
+
+    def __init__(self, segment_id, input_path, start_time, duration, expires=0.0):
+        self.segment_id = segment_id
+        self.input_path = input_path
+        self.start_time = start_time
+        self.duration = duration
+        self.expires = expires
+
+    @classmethod
+    def from_record(cls, record, expires):
+        # Columns: segment_id, input_path, start_time, duration
+        return cls(*(field.get("stringValue") for field in record[:4]), expires=expires)
+
+
+# Requested row first, so it survives the LIMIT on very long broadcasts
+_BROADCAST_SQL = """
+    SELECT segment_id, input_path, start_time, duration
+    FROM segment_metadata
+    WHERE input_path = (
+        SELECT input_path FROM segment_metadata WHERE segment_id = :segment_id
+    )
+    ORDER BY segment_id = :segment_id DESC, start_time
+    LIMIT :limit
+"""
+
+
+def get(segment_id):
+    # Returns the SegmentMetadata for segment_id, or None if it does not exist
+    now = time.monotonic()
+    row = _cache.get(segment_id)
+    if row is not None and row.expires > now:
+        _cache.move_to_end(segment_id)
+        stats["hits"] += 1
+        log("hit", segment_id)
+        return row
+
+    row = from_snapshot(segment_id, now)
+    if row is not None:
+        log("snapshot", segment_id)
+        return row
+    stats["misses"] += 1
+    rows = prefetch_broadcast(segment_id, now)
+    log("miss", segment_id)
+    return rows.get(segment_id)
+
+
+def get_many(segment_ids):
+    # {segment_id: SegmentMetadata} for the ids that exist; misses are loaded with one IN (...) query
+    now = time.monotonic()
+    found = {}
+    missing = []
+    for segment_id in dict.fromkeys(segment_ids):
+        row = _cache.get(segment_id)
+        if row is not None and row.expires > now:
+            _cache.move_to_end(segment_id)
+            found[segment_id] = row
+        else:
+            missing.append(segment_id)
+    stats["hits"] += len(found)
+    unexported = []
+    for segment_id in missing:
+        row = from_snapshot(segment_id, now)
+        if row is not None:
+            found[segment_id] = row
+        else:
+            unexported.append(segment_id)
+    stats["misses"] += len(unexported)
+    if unexported:
+        found.update(load(unexported, now))
+    log("batch", f"of {len(segment_ids)}")
+    return found
+
+
+def from_snapshot(segment_id, now):
+    snapshot = segmentSnapshot.get_snapshot()
+    values = snapshot.lookup(segment_id) if snapshot is not None else None
+    if values is None:
+        return None
+    row = SegmentMetadata(segment_id, *values, expires=now + TTL_SECONDS)
+    remember((row,))
+    stats["snapshot"] += 1
+    return row
+
+
+def load(segment_ids, now=None):
+    expires = (now if now is not None else time.monotonic()) + TTL_SECONDS
+    names = [f"id{i}" for i in range(len(segment_ids))]
+    sql = f"""
+        SELECT segment_id, input_path, start_time, duration
+        FROM segment_metadata
+        WHERE segment_id IN ({", ".join(":" + name for name in names)})
+    """
+    result = rds.execute_statement(
+        secretArn=DB_SECRET_ARN,
+        resourceArn=DB_CLUSTER_ARN,
+        database=DB_NAME,
+        sql=sql,
+        parameters=[{"name": name, "value": {"stringValue": segment_id}} for name, segment_id in zip(names, segment_ids)]
+    )
+    rows = {}
+    for record in result.get("records") or []:
+        row = SegmentMetadata.from_record(record, expires)
+        rows[row.segment_id] = row
+    remember(rows.values())
+    return rows
+
+
+def prefetch_broadcast(segment_id, now=None):
+    expires = (now if now is not None else time.monotonic()) + TTL_SECONDS
+    result = rds.execute_statement(
+        secretArn=DB_SECRET_ARN,
+        resourceArn=DB_CLUSTER_ARN,
+        database=DB_NAME,
+        sql=_BROADCAST_SQL,
+        parameters=[
+            {"name": "segment_id", "value": {"stringValue": segment_id}},
+            {"name": "limit", "value": {"longValue": PREFETCH_LIMIT}},
+        ]
+    )
+    rows = {}
+    for record in result.get("records") or []:
+        row = SegmentMetadata.from_record(record, expires)
+        rows[row.segment_id] = row
+    remember(rows.values())
+    stats["prefetched"] += max(0, len(rows) - 1)
+    return rows
+
+
+def remember(rows):
+    for row in rows:
+        _cache[row.segment_id] = row
+        _cache.move_to_end(row.segment_id)
+    while len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+
+
+def log(outcome, segment_id):
+    print(f"segment_metadata {outcome} {segment_id} "
+          f"(hits={stats['hits']} misses={stats['misses']} snapshot={stats['snapshot']} "
+          f"prefetched={stats['prefetched']} size={len(_cache)})")
@@ -0,0 +1,133 @@
+import os
+import posixpath
+import time
+from collections import OrderedDict
+
+import awsClients
+
+# Existence of a segment's outputs (master and variant playlists, captions, thumbnail),
+# resolved with a single list_objects_v2 on the segment's prefix instead of one head_object
+# per artifact. Results are kept per warm container: positives for a while (outputs are
+# immutable once written), misses only briefly so a finishing encode is picked up quickly.
+POSITIVE_TTL_SECONDS = float(os.environ.get("SEGMENT_OUTPUTS_TTL_SECONDS", "300"))
+NEGATIVE_TTL_SECONDS = float(os.environ.get("SEGMENT_OUTPUTS_NEGATIVE_TTL_SECONDS", "5"))
+CACHE_SIZE = int(os.environ.get("SEGMENT_OUTPUTS_CACHE_SIZE", "1024"))
+# Concurrent prefix listings for batch lookups (within awsClients' connection pool)
+LIST_WORKERS = int(os.environ.get("SEGMENT_OUTPUTS_LIST_WORKERS", "16"))
+
+THUMBNAIL_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+s3 = awsClients.client("s3")
+
+_cache = OrderedDict()
+
+
+class SegmentOutputs:
+    __slots__ = ("prefix", "master", "variants", "captions", "thumbnail")
+
+    def __init__(self, prefix, master=None, variants=(), captions=None, thumbnail=None):
+        self.prefix = prefix
+        self.master = master
+        self.variants = variants
+        self.captions = captions
+        self.thumbnail = thumbnail
+
+    @property
+    def exists(self):
+        return self.master is not None
+
+
+def segment_prefix(segment_id):
+    return f"segments/{segment_id}/"
+
+
+def master_key(segment_id):
+    return f"segments/{segment_id}/hls/master.m3u8"
+
+
+def resolve(bucket, segment_id, refresh=False):
+    cached = None if refresh else _cached(bucket, segment_id)
+    if cached is not None:
+        return cached
+    return _store(bucket, segment_id, _list_outputs(bucket, segment_id))
+
+
+def resolve_many(bucket, segment_ids):
+    # {segment_id: SegmentOutputs}; cache misses are listed in parallel
+    results = {}
+    missing = []
+    for segment_id in dict.fromkeys(segment_ids):
+        cached = _cached(bucket, segment_id)
+        if cached is not None:
+            results[segment_id] = cached
+        else:
+            missing.append(segment_id)
+    if len(missing) == 1:
+        results[missing[0]] = resolve(bucket, missing[0], refresh=True)
+    elif missing:
+        # Imported here: concurrent.futures adds noticeably to cold starts of the single-segment handlers
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=min(LIST_WORKERS, len(missing))) as pool:
+            listed = pool.map(lambda segment_id: _list_outputs(bucket, segment_id), missing)
+            # The cache is only touched from this thread
+            for segment_id, outputs in zip(missing, listed):
+                results[segment_id] = _store(bucket, segment_id, outputs)
+    return results
+
+
+def invalidate(bucket, segment_id):
+    # Called when an encode completes or playlists are written, so the next resolve re-lists
+    _cache.pop((bucket, segment_id), None)
+
+
+def classify(segment_id, keys):
+    master = master_key(segment_id)
+    outputs = SegmentOutputs(segment_prefix(segment_id))
+    variants = []
+    for key in keys:
+        name = posixpath.basename(key).lower()
+        if key == master:
+            outputs.master = key
+        elif name.endswith(".m3u8"):
+            variants.append(key)
+        elif name.startswith("captions."):
+            outputs.captions = key
+        elif name.endswith(THUMBNAIL_EXTENSIONS):
+            outputs.thumbnail = outputs.thumbnail or key
+    outputs.variants = tuple(variants)
+    return outputs
+
+
+def _cached(bucket, segment_id):
+    key = (bucket, segment_id)
+    cached = _cache.get(key)
+    if cached is None or cached[0] <= time.monotonic():
+        return None
+    _cache.move_to_end(key)
+    return cached[1]
+
+
+def _store(bucket, segment_id, outputs):
+    key = (bucket, segment_id)
+    ttl = POSITIVE_TTL_SECONDS if outputs.exists else NEGATIVE_TTL_SECONDS
+    _cache[key] = (time.monotonic() + ttl, outputs)
+    _cache.move_to_end(key)
+    while len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+    return outputs
+
+
+def _list_outputs(bucket, segment_id):
+    return classify(segment_id, _list_keys(bucket, segment_prefix(segment_id)))
+
+
+def _list_keys(bucket, prefix):
+    # Segment encodes are a few hundred keys at most, so this is nearly always one request
+    kwargs = {"Bucket": bucket, "Prefix": prefix}
+    while True:
+        page = s3.list_objects_v2(**kwargs)
+        for obj in page.get("Contents", []):
+            yield obj["Key"]
+        if not page.get("IsTruncated"):
+            return
+        kwargs["ContinuationToken"] = page["NextContinuationToken"]
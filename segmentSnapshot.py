@@ -0,0 +1,188 @@
+"""Memory-mapped snapshot of segment_metadata, so lookups never wait on a paused Aurora cluster.
+
+The exporter pages through segment_metadata and writes one sorted, fixed-width binary file:
+
+    header   MAGIC, version, key width, record count, string table offset, generated_at
+    records  segment_id (NUL-padded to key width), input_path offset + length, start ms, duration ms
+    strings  UTF-8 input paths, each stored once (a broadcast's segments share one)
+
+Readers download it to /tmp, mmap it and binary-search the records; ids newer than the
+snapshot fall through to RDS in segmentMetadata.
+
+    python segmentSnapshot.py export [path]
+"""
+import mmap
+import os
+import struct
+import sys
+import time
+
+from botocore.exceptions import ClientError
+
+import awsClients
+import timecode
+
+SNAPSHOT_BUCKET = os.environ.get("METADATA_SNAPSHOT_BUCKET")
+SNAPSHOT_KEY = os.environ.get("METADATA_SNAPSHOT_KEY", "metadata/segment_metadata.snap")
+LOCAL_PATH = os.environ.get("METADATA_SNAPSHOT_PATH", "/tmp/segment_metadata.snap")
+# How long a warm container trusts its copy before checking S3 for a newer export
+REFRESH_SECONDS = float(os.environ.get("METADATA_SNAPSHOT_REFRESH_SECONDS", "900"))
+EXPORT_PAGE_SIZE = 5000
+
+MAGIC = b"TVNASEG1"
+VERSION = 1
+HEADER = struct.Struct("<8sHHIIq")
+# Appended to the key field of each record
+RECORD_TAIL = struct.Struct("<IHII")
+
+s3 = awsClients.client("s3")
+rds = awsClients.client("rds-data")
+
+_snapshot = None
+_checked_at = 0.0
+
+
+class Snapshot:
+    __slots__ = ("mm", "count", "key_width", "record_size", "strings_offset", "generated_at", "_file")
+
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        self.mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.key_width, self.count, self.strings_offset, self.generated_at = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a version {VERSION} segment_metadata snapshot")
+        self.record_size = self.key_width + RECORD_TAIL.size
+
+    def lookup(self, segment_id):
+        # (input_path, start_time, duration) or None
+        key = segment_id.encode("utf-8")
+        if len(key) > self.key_width:
+            return None
+        key = key.ljust(self.key_width, b"\0")
+        mm, width, size = self.mm, self.key_width, self.record_size
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset = HEADER.size + mid * size
+            probe = mm[offset:offset + width]
+            if probe < key:
+                lo = mid + 1
+            elif probe > key:
+                hi = mid
+            else:
+                path_offset, path_length, start_ms, duration_ms = RECORD_TAIL.unpack_from(mm, offset + width)
+                start = self.strings_offset + path_offset
+                input_path = mm[start:start + path_length].decode("utf-8")
+                return input_path, timecode.format_clock(start_ms), format_duration(duration_ms)
+        return None
+
+    def close(self):
+        self.mm.close()
+        self._file.close()
+
+
+def format_duration(ms):
+    # Durations are stored in segment_metadata as seconds
+    return str(ms // 1000) if ms % 1000 == 0 else f"{ms / 1000:.3f}"
+
+
+def write_snapshot(rows, path):
+    # rows: (segment_id, input_path, start_time, duration); written atomically
+    records = sorted((segment_id.encode("utf-8"), input_path, start, duration)
+                     for segment_id, input_path, start, duration in rows)
+    key_width = max((len(key) for key, *_ in records), default=1)
+    strings = bytearray()
+    path_offsets = {}
+    packed = bytearray()
+    for key, input_path, start, duration in records:
+        if input_path not in path_offsets:
+            path_offsets[input_path] = len(strings)
+            strings += input_path.encode("utf-8")
+        packed += key.ljust(key_width, b"\0")
+        packed += RECORD_TAIL.pack(path_offsets[input_path], len(input_path.encode("utf-8")), timecode.parse_milliseconds(start), timecode.parse_milliseconds(duration))
+
+    strings_offset = HEADER.size + len(packed)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, key_width, len(records), strings_offset, int(time.time())))
+        f.write(packed)
+        f.write(strings)
+    os.replace(tmp_path, path)
+    return len(records)
+
+
+def read_rows():
+    # Keyset pagination keeps each Data API response under its 1 MB limit
+    after = ""
+    while True:
+        result = rds.execute_statement(
+            secretArn=os.environ["DB_SECRET_ARN"],
+            resourceArn=os.environ["DB_CLUSTER_ARN"],
+            database=os.environ["DB_NAME"],
+            sql="""
+                SELECT segment_id, input_path, start_time, duration
+                FROM segment_metadata
+                WHERE segment_id > :after
+                ORDER BY segment_id
+                LIMIT :limit
+            """,
+            parameters=[
+                {"name": "after", "value": {"stringValue": after}},
+                {"name": "limit", "value": {"longValue": EXPORT_PAGE_SIZE}},
+            ]
+        )
+        records = result.get("records") or []
+        for record in records:
+            row = tuple(field.get("stringValue") for field in record[:4])
+            if None not in row:
+                yield row
+        if len(records) < EXPORT_PAGE_SIZE:
+            return
+        after = records[-1][0]["stringValue"]
+
+
+def export(path=LOCAL_PATH, bucket=SNAPSHOT_BUCKET, key=SNAPSHOT_KEY):
+    count = write_snapshot(read_rows(), path)
+    if bucket:
+        s3.upload_file(path, bucket, key)
+    print(f"Exported {count} segment_metadata rows to {path}" + (f" and s3://{bucket}/{key}" if bucket else ""))
+    return count
+
+
+def get_snapshot():
+    # The container's mapped snapshot, refreshed from S3 every REFRESH_SECONDS; None if unavailable
+    global _snapshot, _checked_at
+    now = time.monotonic()
+    if _checked_at and now - _checked_at < REFRESH_SECONDS:
+        return _snapshot
+    _checked_at = now
+    if not SNAPSHOT_BUCKET:
+        return None
+    try:
+        if _download_if_newer():
+            if _snapshot is not None:
+                _snapshot.close()
+            _snapshot = Snapshot(LOCAL_PATH)
+        elif _snapshot is None and os.path.exists(LOCAL_PATH):
+            _snapshot = Snapshot(LOCAL_PATH)
+    except (ClientError, OSError, ValueError) as e:
+        # Keep serving the copy we have (or RDS) rather than failing the request
+        print(f"segment_metadata snapshot unavailable: {e}")
+    return _snapshot
+
+
+def _download_if_newer():
+    head = s3.head_object(Bucket=SNAPSHOT_BUCKET, Key=SNAPSHOT_KEY)
+    if os.path.exists(LOCAL_PATH) and os.path.getmtime(LOCAL_PATH) >= head["LastModified"].timestamp():
+        return False
+    tmp_path = f"{LOCAL_PATH}.download"
+    s3.download_file(SNAPSHOT_BUCKET, SNAPSHOT_KEY, tmp_path)
+    os.replace(tmp_path, LOCAL_PATH)
+    return True
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "export":
+        sys.exit(f"usage: {sys.argv[0]} export [path]")
+    export(*sys.argv[2:3])
@@ -0,0 +1,10 @@
+import segmentSnapshot
+
+# Scheduled (EventBridge) export of segment_metadata to the memory-mapped snapshot in
+# METADATA_SNAPSHOT_BUCKET. Runs while the cluster is likely awake anyway; request paths
+# read the snapshot and only query RDS for segments added since the last export.
+
+
+def lambda_handler(event, context):
+    count = segmentSnapshot.export(path="/tmp/segment_metadata.export.snap")
+    return {"rows": count, "bucket": segmentSnapshot.SNAPSHOT_BUCKET, "key": segmentSnapshot.SNAPSHOT_KEY}
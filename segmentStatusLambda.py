@@ -0,0 +1,96 @@
+import json
+import os
+import time
+
+import jobStatus
+
+# GET /stream/status?segment_id=...[&wait=seconds]
+# Cheap polling path for players after a 202 from /stream: one DynamoDB read of the status
+# record, an ETag so unchanged polls get a bodyless 304, and an optional bounded long-poll
+# that returns as soon as the status (or progress) changes.
+CLOUDFRONT_DOMAIN = os.environ.get("CLOUDFRONT_DOMAIN")
+MAX_WAIT_SECONDS = float(os.environ.get("STATUS_MAX_WAIT_SECONDS", "20"))
+POLL_INTERVAL_SECONDS = float(os.environ.get("STATUS_POLL_INTERVAL_SECONDS", "1"))
+# Leave time to build the response before the function times out
+RESPONSE_MARGIN_MS = 1000
+
+
+def lambda_handler(event, context):
+    params = event.get("queryStringParameters") or {}
+    segment_id = params.get("segment_id")
+    if not segment_id:
+        return respond(400, {"message": "Missing required parameters"})
+
+    try:
+        wait = min(max(float(params.get("wait") or 0), 0), MAX_WAIT_SECONDS)
+    except ValueError:
+        return respond(400, {"message": "wait must be a number of seconds"})
+    if context is not None and hasattr(context, "get_remaining_time_in_millis"):
+        wait = min(wait, max(0, context.get_remaining_time_in_millis() - RESPONSE_MARGIN_MS) / 1000)
+
+    client_tags = parse_if_none_match(get_header(event, "If-None-Match"))
+    view, tag = read_status(segment_id)
+
+    # Long-poll only while the client already has the current state and it can still change
+    deadline = time.monotonic() + wait
+    while tag in client_tags and view["status"] not in jobStatus.TERMINAL_STATUSES:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        time.sleep(min(POLL_INTERVAL_SECONDS, remaining))
+        view, tag = read_status(segment_id)
+
+    if view["status"] == "UNKNOWN":
+        return respond(404, {"message": "No encode found for segment. Request it from /stream."}, tag)
+    if tag in client_tags or "*" in client_tags:
+        return respond(304, None, tag)
+
+    body = {"segment_id": segment_id, "status": view["status"], "progress": view["progress"]}
+    if view["error"]:
+        body["error"] = view["error"]
+    if view["status"] == "COMPLETE" and CLOUDFRONT_DOMAIN:
+        body["playlist_url"] = f"https://{CLOUDFRONT_DOMAIN}/segments/{segment_id}/hls/master.m3u8"
+    return respond(200, body, tag)
+
+
+def read_status(segment_id):
+    view = jobStatus.describe(jobStatus.get_status(segment_id))
+    return view, jobStatus.etag(view)
+
+
+def get_header(event, name):
+    # API Gateway passes headers with the client's casing
+    name = name.lower()
+    for key, value in (event.get("headers") or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+def parse_if_none_match(value):
+    if not value:
+        return set()
+    tags = set()
+    for tag in value.split(","):
+        tag = tag.strip()
+        # Weak comparison is fine for a status resource
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag:
+            tags.add(tag)
+    return tags
+
+
+def respond(status_code, body, tag=None):
+    headers = {
+        "Access-Control-Allow-Origin": "*",
+        "Access-Control-Allow-Credentials": "true",
+        "Access-Control-Expose-Headers": "ETag",
+        "Cache-Control": "no-cache",
+    }
+    if tag:
+        headers["ETag"] = tag
+    if body is None:
+        return {"statusCode": status_code, "headers": headers, "body": ""}
+    headers["Content-Type"] = "application/json"
+    return {"statusCode": status_code, "headers": headers, "body": json.dumps(body)}
@@ -1,21 +1,18 @@
 import json
 import os
-import time
-import boto3
-from botocore.exceptions import ClientError
 
-# AWS clients
-s3 = boto3.client("s3")
-mediaconvert = boto3.client("mediaconvert", endpoint_url=os.environ["MEDIACONVERT_ENDPOINT"])
-rds = boto3.client("rds-data")
+import jobStatus
+import segmentLease
+import segmentMetadata
+import segmentOutputs
+import timecode
+import virtualSegment
 
 # Environment variables
 SEGMENT_BUCKET = os.environ["SEGMENT_BUCKET"]
 MEDIACONVERT_ROLE = os.environ["MEDIACONVERT_ROLE"]
 CLOUDFRONT_DOMAIN = os.environ["CLOUDFRONT_DOMAIN"]
-DB_SECRET_ARN = os.environ["DB_SECRET_ARN"]
-DB_CLUSTER_ARN = os.environ["DB_CLUSTER_ARN"]
-DB_NAME = os.environ["DB_NAME"]
+VIRTUAL_SEGMENTS = os.environ.get("VIRTUAL_SEGMENTS", "true").lower() == "true"
 
 
 def lambda_handler(event, context):
@@ -28,106 +25,78 @@ def lambda_handler(event, context):
     s3_key = f"segments/{segment_id}/hls/master.m3u8"
     playlist_url = f"https://{CLOUDFRONT_DOMAIN}/{s3_key}"
 
-    # Step 1: Check if segment already exists
-    try:
-        s3.head_object(Bucket=SEGMENT_BUCKET, Key=s3_key)
-        caption_url = get_caption_url(segment_id)
+    # Step 1: Check if segment already exists (one cached listing covers playlists and captions)
+    outputs = segmentOutputs.resolve(SEGMENT_BUCKET, segment_id)
+    if outputs.exists:
         return respond(200, {
             "message": "Segment already exists",
             "segment_path": s3_key,
             "playlist_url": playlist_url,
-            "caption_url": caption_url
+            "caption_url": get_caption_url(outputs)
         })
-    except ClientError as e:
-        if e.response["Error"]["Code"] != "404":
-            print("Error checking S3:", str(e))
-            raise
 
-    # Step 2: Get metadata from RDS
-    metadata = get_segment_metadata(segment_id)
+    # Step 2: Get metadata from RDS (cached per container, whole broadcast on a miss)
+    metadata = segmentMetadata.get(segment_id)
     if not metadata:
         return respond(404, "Segment ID not found")
 
-    input_path = metadata["input_path"]
-    start_time = metadata["start_time"]
-    duration = metadata["duration"]
-
-    # Convert times to MediaConvert format
-    def time_to_seconds(t):
-        h, m, s = map(int, t.split(":"))
-        return h * 3600 + m * 60 + s
-
-    def seconds_to_time(secs):
-        h = secs // 3600
-        m = (secs % 3600) // 60
-        s = secs % 60
-        return f"{h:02}:{m:02}:{s:02}:00"  # MediaConvert timecode format
-
-    start_seconds = time_to_seconds(start_time)
-    duration_seconds = int(duration)
-    end_seconds = start_seconds + duration_seconds
-    start_tc = seconds_to_time(start_seconds)
-    end_tc = seconds_to_time(end_seconds)
+    input_path = metadata.input_path
+    start_time = metadata.start_time
+    duration = metadata.duration
+
+    # Convert times to MediaConvert format (frame-accurate, HH:MM:SS or HH:MM:SS.fff)
+    start_seconds = timecode.to_seconds(start_time)
+    duration_seconds = timecode.to_seconds(duration)
+    start_tc, end_tc = timecode.clip_range(start_time, duration)
+
+    # Step 3: Slice the broadcast's HLS if the whole broadcast has already been encoded
+    if VIRTUAL_SEGMENTS:
+        virtual_key = virtualSegment.write_virtual_segment(
+            input_path, SEGMENT_BUCKET, f"segments/{segment_id}/hls/", start_seconds, duration_seconds
+        )
+        if virtual_key:
+            segmentOutputs.invalidate(SEGMENT_BUCKET, segment_id)
+            caption_url = get_caption_url(segmentOutputs.resolve(SEGMENT_BUCKET, segment_id))
+            return respond(200, {
+                "message": "Segment is ready",
+                "segment_path": s3_key,
+                "playlist_url": playlist_url,
+                "caption_url": caption_url
+            })
 
-    # Step 3: Trigger MediaConvert job
+    # Step 4: Trigger MediaConvert job (concurrent requests for the segment attach to one job)
     job = build_mediaconvert_job(input_path, start_tc, end_tc, segment_id)
-    mediaconvert.create_job(Role=MEDIACONVERT_ROLE, Settings=job)
-    print(f"MediaConvert job created for {segment_id}: {start_tc} → {end_tc}")
-
-    # Step 4: Poll for segment readiness
-    wait_seconds = 60
-    poll_interval = 5
-    deadline = time.time() + wait_seconds
-    while time.time() < deadline:
-        try:
-            s3.head_object(Bucket=SEGMENT_BUCKET, Key=s3_key)
-            caption_url = get_caption_url(segment_id)
+    record, submitted = segmentLease.submit_once(
+        segment_id, segmentLease.new_owner(context),
+        {"Role": MEDIACONVERT_ROLE, "Settings": job, "UserMetadata": {"segment_id": segment_id}},
+        clip_seconds=duration_seconds
+    )
+    if submitted:
+        print(f"MediaConvert job {record['job_id']} created for {segment_id}: {start_tc} → {end_tc}")
+    elif record.get("status") == "COMPLETE":
+        # The encode finished since our listing was cached; drop the cached miss and serve it
+        segmentOutputs.invalidate(SEGMENT_BUCKET, segment_id)
+        outputs = segmentOutputs.resolve(SEGMENT_BUCKET, segment_id)
+        if outputs.exists:
             return respond(200, {
                 "message": "Segment is ready",
                 "segment_path": s3_key,
                 "playlist_url": playlist_url,
-                "caption_url": caption_url
+                "caption_url": get_caption_url(outputs)
             })
-        except ClientError as e:
-            if e.response["Error"]["Code"] == "404":
-                time.sleep(poll_interval)
-            else:
-                print("Error polling S3:", str(e))
-                raise
-
-    # Timed out
+
+    # Step 5: Return right away; completion arrives as a MediaConvert event (segmentJobEventsLambda)
+    status = jobStatus.describe(record)
     return respond(202, {
         "message": "Segment is being processed. Please try again in a moment.",
         "segment_path": s3_key,
-        "playlist_url": playlist_url
+        "playlist_url": playlist_url,
+        "status": status["status"],
+        "progress": status["progress"],
+        "status_url": jobStatus.status_url(segment_id)
     })
 
 
-def get_segment_metadata(segment_id):
-    sql = """
-        SELECT input_path, start_time, duration
-        FROM segment_metadata
-        WHERE segment_id = :segment_id
-    """
-    result = rds.execute_statement(
-        secretArn=DB_SECRET_ARN,
-        resourceArn=DB_CLUSTER_ARN,
-        database=DB_NAME,
-        sql=sql,
-        parameters=[{"name": "segment_id", "value": {"stringValue": segment_id}}]
-    )
-
-    records = result.get("records")
-    if not records:
-        return None
-    record = records[0]
-    return {
-        "input_path": record[0]["stringValue"],
-        "start_time": record[1]["stringValue"],
-        "duration": record[2]["stringValue"]
-    }
-
-
 def build_mediaconvert_job(input_path, start_time, end_time, segment_id):
     return {
         "Inputs": [
@@ -170,15 +139,10 @@ def build_mediaconvert_job(input_path, start_time, end_time, segment_id):
     }
 
 
-def get_caption_url(segment_id):
-    caption_key = f"segments/{segment_id}/hls/captions.vtt"
-    try:
-        s3.head_object(Bucket=SEGMENT_BUCKET, Key=caption_key)
-        return f"https://{CLOUDFRONT_DOMAIN}/{caption_key}"
-    except ClientError as e:
-        if e.response["Error"]["Code"] != "404":
-            print("Error checking captions:", str(e))
+def get_caption_url(outputs):
+    if not outputs.captions:
         return None
+    return f"https://{CLOUDFRONT_DOMAIN}/{outputs.captions}"
 
 
 def respond(status_code, body):
@@ -0,0 +1,90 @@
+import json
+import os
+
+import jobStatus
+import segmentMetadata
+import segmentOutputs
+
+# Batch variant of /stream for broadcast and search-result pages:
+#   GET  /stream/batch?segment_ids=a,b,c
+#   POST /stream/batch  {"segment_ids": ["a", "b", "c"]}
+# One Data API query for metadata, parallel prefix listings for outputs and one BatchGetItem
+# for encode status. Nothing is encoded here; players request /stream for the segment they play.
+SEGMENT_BUCKET = os.environ["SEGMENT_BUCKET"]
+CLOUDFRONT_DOMAIN = os.environ["CLOUDFRONT_DOMAIN"]
+MAX_BATCH_SIZE = int(os.environ.get("STREAM_BATCH_MAX_SEGMENTS", "100"))
+
+
+def lambda_handler(event, context):
+    user_id = event["requestContext"]["authorizer"]["claims"].get("sub")
+    segment_ids = parse_segment_ids(event)
+    if not segment_ids or not user_id:
+        return respond(400, {"message": "Missing required parameters"})
+    if len(segment_ids) > MAX_BATCH_SIZE:
+        return respond(400, {"message": f"At most {MAX_BATCH_SIZE} segment_ids per request"})
+
+    outputs = segmentOutputs.resolve_many(SEGMENT_BUCKET, segment_ids)
+    pending = [segment_id for segment_id in segment_ids if not outputs[segment_id].exists]
+    metadata = segmentMetadata.get_many(pending) if pending else {}
+    statuses = jobStatus.get_statuses([segment_id for segment_id in pending if segment_id in metadata]) if metadata else {}
+
+    segments = []
+    for segment_id in segment_ids:
+        segment_outputs = outputs[segment_id]
+        if segment_outputs.exists:
+            segments.append(ready(segment_id, segment_outputs))
+        elif segment_id not in metadata:
+            segments.append({"segment_id": segment_id, "status": "NOT_FOUND"})
+        elif segment_id in statuses:
+            status = jobStatus.describe(statuses[segment_id])
+            segments.append({
+                "segment_id": segment_id,
+                "status": status["status"],
+                "progress": status["progress"],
+                "status_url": jobStatus.status_url(segment_id)
+            })
+        else:
+            # Never requested; /stream encodes it (or slices the broadcast) on demand
+            segments.append({"segment_id": segment_id, "status": "NOT_ENCODED"})
+    return respond(200, {"segments": segments})
+
+
+def parse_segment_ids(event):
+    ids = None
+    if event.get("body"):
+        try:
+            ids = json.loads(event["body"]).get("segment_ids")
+        except (ValueError, AttributeError):
+            return None
+    if ids is None:
+        raw = (event.get("queryStringParameters") or {}).get("segment_ids") or ""
+        ids = raw.split(",")
+    if not isinstance(ids, list):
+        return None
+    # Keep request order, drop blanks and repeats
+    return list(dict.fromkeys(str(segment_id).strip() for segment_id in ids if str(segment_id).strip()))
+
+
+def ready(segment_id, outputs):
+    segment = {
+        "segment_id": segment_id,
+        "status": "READY",
+        "segment_path": outputs.master,
+        "playlist_url": f"https://{CLOUDFRONT_DOMAIN}/{outputs.master}",
+        "caption_url": None
+    }
+    if outputs.captions:
+        segment["caption_url"] = f"https://{CLOUDFRONT_DOMAIN}/{outputs.captions}"
+    return segment
+
+
+def respond(status_code, body):
+    return {
+        "statusCode": status_code,
+        "headers": {
+            "Access-Control-Allow-Origin": "*",
+            "Access-Control-Allow-Credentials": "true",
+            "Content-Type": "application/json"
+        },
+        "body": json.dumps(body)
+    }
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The modules under test are top-level files of the repository, as they are in the Lambda bundle
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# mediaTokenKey falls back to SHARED_SECRET when no media_token.key has been written
+os.environ.setdefault("SHARED_SECRET", "test-media-token-key")
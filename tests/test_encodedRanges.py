@@ -0,0 +1,32 @@
+from encodedRanges import EncodedRange, RangeIndex
+
+
+def encode(start, end):
+    return EncodedRange(start, end, "bucket", f"segments/{start:g}-{end:g}/master.m3u8")
+
+
+def test_covering_finds_an_encode_containing_the_window():
+    index = RangeIndex([encode(0, 60), encode(100, 160), encode(40, 120)])
+    assert index.covering(10, 50).master_key == "segments/0-60/master.m3u8"
+    assert index.covering(50, 110).master_key == "segments/40-120/master.m3u8"
+    assert index.covering(130, 160).master_key == "segments/100-160/master.m3u8"
+
+
+def test_covering_uses_a_long_encode_that_starts_earlier():
+    # The nearest start (30-40) is too short, but the whole-broadcast encode reaches past it
+    index = RangeIndex([encode(0, 600), encode(30, 40), encode(35, 45)])
+    assert index.covering(36, 50).master_key == "segments/0-600/master.m3u8"
+
+
+def test_overlap_alone_does_not_cover():
+    index = RangeIndex([encode(0, 60), encode(50, 100)])
+    assert index.covering(40, 70) is None
+    assert index.covering(90, 110) is None
+    assert index.covering(-5, 10) is None
+    assert RangeIndex([]).covering(0, 1) is None
+
+
+def test_covering_tolerates_frame_rounding_at_the_edges():
+    index = RangeIndex([encode(10, 39.98)])
+    assert index.covering(10.02, 40) is not None
+    assert index.covering(10, 40.5) is None
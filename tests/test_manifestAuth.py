@@ -0,0 +1,64 @@
+import importlib.util
+import os
+
+import manifestAuth
+
+NOW = 1_700_000_000
+SCOPE = "/segments/abc/hls/"
+
+
+def load_edge_validator():
+    # video-access-validation.py is not an importable module name
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "video-access-validation.py")
+    spec = importlib.util.spec_from_file_location("video_access_validation", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_token_verifies_under_its_scope():
+    token = manifestAuth.sign_scope(SCOPE, NOW + 60)
+    assert manifestAuth.verify(SCOPE + "v_360_00001.ts", token, now=NOW)
+    assert manifestAuth.verify(SCOPE + "sub/v_360.m3u8", token, now=NOW)
+
+
+def test_token_is_rejected_outside_its_scope():
+    token = manifestAuth.sign_scope(SCOPE, NOW + 60)
+    assert not manifestAuth.verify("/segments/abd/hls/v_360_00001.ts", token, now=NOW)
+    assert not manifestAuth.verify("/segments/", token, now=NOW)
+
+
+def test_token_expires():
+    token = manifestAuth.sign_scope(SCOPE, NOW + 60)
+    assert manifestAuth.verify(SCOPE + "a.ts", token, now=NOW + 60)
+    assert not manifestAuth.verify(SCOPE + "a.ts", token, now=NOW + 61)
+
+
+def test_tampered_or_malformed_tokens_are_rejected():
+    expires, scope, signature = manifestAuth.sign_scope(SCOPE, NOW + 60).split(".")
+    widened = manifestAuth.sign_scope("/", NOW + 60).split(".")[1]
+    assert not manifestAuth.verify(SCOPE + "a.ts", f"{NOW + 3600}.{scope}.{signature}", now=NOW)
+    assert not manifestAuth.verify("/other/a.ts", f"{expires}.{widened}.{signature}", now=NOW)
+    assert not manifestAuth.verify(SCOPE + "a.ts", "not-a-token", now=NOW)
+    assert not manifestAuth.verify(SCOPE + "a.ts", f"soon.{scope}.{signature}", now=NOW)
+
+
+def test_edge_accepts_tokens_from_playlists():
+    edge = load_edge_validator()
+    token = manifestAuth.sign_scope(SCOPE, NOW + 60)
+    assert edge.check_media_token(SCOPE + "v_360_00001.ts", token, NOW) is None
+    assert edge.check_media_token("/segments/other/v_360_00001.ts", token, NOW) == "Token scope mismatch"
+    assert edge.check_media_token(SCOPE + "../../other/a.ts", token, NOW) == "Token scope mismatch"
+
+
+def test_tokenize_playlist_signs_each_directory_once():
+    master = "#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=1\nv_360.m3u8\n#EXT-X-STREAM-INF:BANDWIDTH=2\nhi/v_720.m3u8\n"
+    rewritten = manifestAuth.tokenize_playlist(
+        master, SCOPE + "master.m3u8", "https://media.example", lambda path, token: f"{path}?t={token}", NOW + 60
+    )
+    variants = [line for line in rewritten.splitlines() if line and not line.startswith("#")]
+    assert [line.split("?")[0] for line in variants] == [SCOPE + "v_360.m3u8", SCOPE + "hi/v_720.m3u8"]
+    low, high = (line.split("?t=")[1] for line in variants)
+    assert manifestAuth.verify(SCOPE + "v_360.m3u8", low, now=NOW)
+    assert not manifestAuth.verify(SCOPE + "v_360.m3u8", high, now=NOW)
+    assert manifestAuth.verify(SCOPE + "hi/v_720.m3u8", high, now=NOW)
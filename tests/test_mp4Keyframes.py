@@ -0,0 +1,65 @@
+import struct
+
+import mp4Keyframes
+
+
+def box(box_type, payload=b""):
+    return struct.pack(">I4s", 8 + len(payload), box_type) + payload
+
+
+def full_box(box_type, payload, version=0):
+    return box(box_type, struct.pack(">B3x", version) + payload)
+
+
+def table(box_type, entries, fmt, version=0):
+    return full_box(box_type, struct.pack(">I", len(entries)) + b"".join(struct.pack(fmt, *e) for e in entries), version)
+
+
+def video_moov(stts, stss=None, ctts=None, elst=None, ctts_version=0, timescale=3000, movie_timescale=1000):
+    # A moov with one 640x360 avc1 track holding just the boxes mp4Keyframes reads
+    avc1 = struct.pack(">6xH16xHH", 1, 640, 360) + bytes(50)
+    stbl = [
+        full_box(b"stsd", struct.pack(">I", 1) + box(b"avc1", avc1)),
+        table(b"stts", stts, ">II"),
+    ]
+    if stss is not None:
+        stbl.append(table(b"stss", [(sample,) for sample in stss], ">I"))
+    if ctts is not None:
+        stbl.append(table(b"ctts", ctts, ">Ii" if ctts_version else ">II", ctts_version))
+    samples = sum(count for count, _ in stts)
+    mdia = box(b"mdia", full_box(b"mdhd", struct.pack(">IIIIHH", 0, 0, timescale, samples * stts[0][1], 0, 0))
+               + full_box(b"hdlr", struct.pack(">I4s12x", 0, b"vide"))
+               + box(b"minf", box(b"stbl", b"".join(stbl))))
+    trak = box(b"trak", (box(b"edts", table(b"elst", elst, ">Iihh")) if elst else b"") + mdia)
+    mvhd = full_box(b"mvhd", struct.pack(">III", 0, 0, movie_timescale) + bytes(84))
+    return mvhd + trak
+
+
+def test_keyframes_without_reordering_are_decode_times():
+    info = mp4Keyframes.parse_moov(video_moov([(10, 100)], stss=[1, 5, 9]))
+    assert (info.video_codec, info.width, info.height) == ("avc1", 640, 360)
+    assert list(info.keyframes) == [0.0, 400 / 3000, 800 / 3000]
+
+
+def test_keyframes_apply_composition_offsets_and_edit_list():
+    # B-frame stream: keyframes are presented 200-300 ticks after they are decoded, and the edit
+    # list delays the track by an empty 0.5 s edit, then starts presentation at media time 200
+    info = mp4Keyframes.parse_moov(video_moov(
+        [(10, 100)], stss=[1, 5, 9],
+        ctts=[(1, 200), (3, 400), (1, 300), (3, 100), (1, 200), (1, 0)],
+        elst=[(500, -1, 1, 0), (1000, 200, 1, 0)],
+    ))
+    expected = [0.5, 0.5 + 500 / 3000, 0.5 + 800 / 3000]
+    assert [round(t, 9) for t in info.keyframes] == [round(t, 9) for t in expected]
+    assert round(info.keyframe_at_or_before(0.7), 9) == round(expected[1], 9)
+
+
+def test_keyframes_with_signed_offsets_and_cut_by_edit_list():
+    # Version 1 ctts with negative offsets; the edit list starts after the first keyframe, which
+    # is never presented and so cannot be a cut point
+    info = mp4Keyframes.parse_moov(video_moov(
+        [(9, 100)], stss=[1, 4, 7],
+        ctts=[(1, 0), (2, -100), (1, 100), (2, -100), (1, 100), (2, 0)], ctts_version=1,
+        elst=[(1000, 350, 1, 0)],
+    ))
+    assert [round(t, 9) for t in info.keyframes] == [round(50 / 3000, 9), round(350 / 3000, 9)]
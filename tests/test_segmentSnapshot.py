@@ -0,0 +1,50 @@
+import random
+
+import pytest
+
+import segmentSnapshot
+
+
+@pytest.fixture
+def snapshot(tmp_path):
+    opened = []
+
+    def open_snapshot(rows):
+        path = str(tmp_path / "segment_metadata.snap")
+        segmentSnapshot.write_snapshot(rows, path)
+        opened.append(segmentSnapshot.Snapshot(path))
+        return opened[-1]
+
+    yield open_snapshot
+    for snap in opened:
+        snap.close()
+
+
+def test_lookup_finds_every_record(snapshot):
+    rows = [
+        (f"seg-{i}", f"s3://in/broadcast-{i % 7}.mp4", f"00:{i % 60:02d}:{i % 59:02d}", str(5 + i % 30))
+        for i in range(1000)
+    ]
+    random.Random(1).shuffle(rows)
+    snap = snapshot(rows)
+    assert snap.count == 1000
+    for segment_id, input_path, start, duration in rows:
+        assert snap.lookup(segment_id) == (input_path, start, duration)
+
+
+def test_lookup_misses_between_and_beyond_keys(snapshot):
+    snap = snapshot([("b", "s3://in/b.mp4", "00:00:01", "5"), ("bb", "s3://in/b.mp4", "00:00:02", "5"),
+                     ("d", "s3://in/d.mp4", "00:00:03", "5")])
+    for missing in ("a", "ba", "c", "bbb", "e", "", "too-long-for-the-key-width"):
+        assert snap.lookup(missing) is None
+    assert snap.lookup("bb") == ("s3://in/b.mp4", "00:00:02", "5")
+
+
+def test_fractional_times_and_shared_paths_round_trip(snapshot):
+    snap = snapshot([("x", "s3://in/é.mp4", "01:02:03.250", "7.5"), ("y", "s3://in/é.mp4", "00:00:00", "30")])
+    assert snap.lookup("x") == ("s3://in/é.mp4", "01:02:03.250", "7.500")
+    assert snap.lookup("y") == ("s3://in/é.mp4", "00:00:00", "30")
+
+
+def test_empty_snapshot(snapshot):
+    assert snapshot([]).lookup("seg-1") is None
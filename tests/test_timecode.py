@@ -0,0 +1,36 @@
+import pytest
+
+import timecode
+from timecode import FPS_2997_DF, FPS_30, Timecode
+
+
+def test_drop_frame_labels_round_trip():
+    # One frame either side of each minute boundary over the first hour, including the tenth minutes
+    frames = []
+    for minute in range(61):
+        boundary = timecode.label_to_frames(0, minute, 0, 2 if minute % 10 else 0, FPS_2997_DF)
+        frames += [boundary - 1, boundary, boundary + 1]
+    for frame in frames:
+        label = timecode.frames_to_label(frame, FPS_2997_DF)
+        assert timecode.label_to_frames(*label, FPS_2997_DF) == frame
+        assert Timecode.parse(str(Timecode(frame, FPS_2997_DF)), FPS_2997_DF).frames == frame
+    assert timecode.format_many(frames, FPS_2997_DF) == [str(Timecode(f, FPS_2997_DF)) for f in frames]
+
+
+def test_drop_frame_skips_first_two_labels_of_each_minute():
+    assert str(Timecode(1799, FPS_2997_DF)) == "00:00:59;29"
+    assert str(Timecode(1800, FPS_2997_DF)) == "00:01:00;02"
+    assert str(Timecode(17982, FPS_2997_DF)) == "00:10:00;00"
+
+
+def test_batch_parse_matches_scalar():
+    pytest.importorskip("numpy")
+    values = [
+        "00:00:05", "00:00:5", "0:0:5", "01:02:03.5", "01:02:03.45", "01:02:03.456", "01:02:03.",
+        "1:2:3", "10:00:00.000", "12.5", "90", " 00:01:00 ", "100:00:00", "00:00:05.1234",
+    ]
+    batch = timecode.parse_many_milliseconds(values)
+    assert batch.tolist() == [timecode.parse_milliseconds(value) for value in values]
+    assert timecode.parse_many(values, FPS_30).tolist() == [
+        Timecode.from_milliseconds(timecode.parse_milliseconds(value)).frames for value in values
+    ]
@@ -0,0 +1,105 @@
+import json
+import os
+import posixpath
+import re
+from collections import OrderedDict
+
+from botocore.exceptions import ClientError
+
+import awsClients
+import virtualSegment
+
+# Broadcast-level thumbnails: broadcast encodes capture a frame every THUMBNAIL_INTERVAL_SECONDS
+# into thumbnails/<broadcast id>/, and an index of those captures is written next to them when
+# the job completes. Segment requests pick the capture nearest their start time instead of
+# adding a FRAME_CAPTURE output to every segment encode.
+THUMBNAIL_INTERVAL_SECONDS = int(os.environ.get("THUMBNAIL_INTERVAL_SECONDS", "10"))
+INDEX_NAME = "thumbnail-index.json"
+INDEX_CACHE_SIZE = int(os.environ.get("THUMBNAIL_INDEX_CACHE_SIZE", "64"))
+
+# MediaConvert names interval captures <input stem><modifier>.<7-digit sequence>.jpg
+_CAPTURE = re.compile(r"\.(\d+)\.jpe?g$")
+
+s3 = awsClients.client("s3")
+
+_cache = OrderedDict()
+
+
+def thumbnail_prefix(broadcast_id):
+    return f"thumbnails/{broadcast_id}/"
+
+
+def index_key(prefix):
+    return posixpath.join(prefix, INDEX_NAME)
+
+
+def capture_number(key):
+    # Sequence number of an interval capture, or None for any other object
+    match = _CAPTURE.search(key)
+    return int(match.group(1)) if match else None
+
+
+def build_index(bucket, prefix, interval=THUMBNAIL_INTERVAL_SECONDS):
+    # Lists the captures under prefix once and stores them in capture order
+    captures = []
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            number = capture_number(obj["Key"])
+            if number is not None:
+                # Chunked broadcasts capture into one directory per chunk, each numbered from 0
+                captures.append((posixpath.dirname(obj["Key"]), number, obj["Key"]))
+    if not captures:
+        return None
+    captures.sort()
+    index = {"version": 1, "interval": interval, "keys": [key for _, _, key in captures]}
+    s3.put_object(Bucket=bucket, Key=index_key(prefix), Body=json.dumps(index).encode(), ContentType="application/json")
+    _remember((bucket, prefix), index)
+    return index
+
+
+def load_index(bucket, prefix):
+    key = (bucket, prefix)
+    index = _cache.get(key)
+    if index is not None:
+        _cache.move_to_end(key)
+        return index
+    try:
+        body = s3.get_object(Bucket=bucket, Key=index_key(prefix))["Body"].read()
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+            return None
+        raise
+    index = json.loads(body)
+    _remember(key, index)
+    return index
+
+
+def nearest(index, seconds):
+    # Capture i was taken at i * interval seconds
+    keys = index["keys"]
+    i = int(round(seconds / index["interval"]))
+    return keys[min(max(i, 0), len(keys) - 1)]
+
+
+def find_thumbnail(input_path, start_seconds):
+    # (bucket, key) of the broadcast capture nearest start_seconds, or None if none exist yet
+    pointer = virtualSegment.find_broadcast(input_path)
+    if not pointer or not pointer.get("thumbnails"):
+        return None
+    index = load_index(pointer["bucket"], pointer["thumbnails"])
+    if index is None:
+        return None
+    return pointer["bucket"], nearest(index, start_seconds)
+
+
+def thumbnail_uri(input_path, start_seconds):
+    found = find_thumbnail(input_path, start_seconds)
+    return f"s3://{found[0]}/{found[1]}" if found else None
+
+
+def _remember(key, index):
+    _cache[key] = index
+    _cache.move_to_end(key)
+    while len(_cache) > INDEX_CACHE_SIZE:
+        _cache.popitem(last=False)
@@ -0,0 +1,195 @@
+"""Sprite sheets and a WebVTT thumbnail track for scrub previews.
+
+A broadcast's interval captures (see thumbnailIndex) are tiled into a few sprite sheets of
+SPRITE_COLUMNS x SPRITE_ROWS thumbnails, and thumbnails.vtt maps each capture interval to its
+tile with a media fragment, so a player fetches one or two images instead of hundreds:
+
+    00:00:10.000 --> 00:00:20.000
+    sheet-000.jpg#xywh=160,0,160,90
+
+Captures are downloaded on a thread pool, then sheets are tiled in a process pool over the local
+copies. Pillow is optional and only imported when sheets are built; without it sprites are
+skipped.
+
+    python thumbnailSprites.py build <bucket> <thumbnail prefix>
+    python thumbnailSprites.py local <capture dir> <output dir> [interval]
+"""
+import os
+import posixpath
+import shutil
+import sys
+import tempfile
+
+import awsClients
+import thumbnailIndex
+
+SPRITE_COLUMNS = int(os.environ.get("SPRITE_COLUMNS", "10"))
+SPRITE_ROWS = int(os.environ.get("SPRITE_ROWS", "10"))
+SPRITE_TILE_WIDTH = int(os.environ.get("SPRITE_TILE_WIDTH", "160"))
+# "jpeg" or "webp"
+SPRITE_FORMAT = os.environ.get("SPRITE_FORMAT", "jpeg").lower()
+SPRITE_QUALITY = int(os.environ.get("SPRITE_QUALITY", "70"))
+SPRITE_WORKERS = int(os.environ.get("SPRITE_WORKERS", "0")) or os.cpu_count() or 1
+SPRITE_DOWNLOAD_WORKERS = int(os.environ.get("SPRITE_DOWNLOAD_WORKERS", "16"))
+SPRITES_DIR = "sprites/"
+TRACK_NAME = "thumbnails.vtt"
+
+_EXTENSIONS = {"jpeg": ".jpg", "webp": ".webp"}
+_CONTENT_TYPES = {"jpeg": "image/jpeg", "webp": "image/webp"}
+
+s3 = awsClients.client("s3")
+
+_pil = None
+
+
+def _image():
+    # PIL.Image, or None when Pillow is not installed
+    global _pil
+    if _pil is None:
+        try:
+            from PIL import Image
+            _pil = Image
+        except ImportError:
+            _pil = False
+    return _pil or None
+
+
+def sprites_prefix(thumbnail_prefix):
+    return posixpath.join(thumbnail_prefix, SPRITES_DIR)
+
+
+def sheet_name(number, image_format=SPRITE_FORMAT):
+    return f"sheet-{number:03d}{_EXTENSIONS[image_format]}"
+
+
+def tile_size(image_path, width=SPRITE_TILE_WIDTH):
+    # (width, height) of one tile, keeping the captures' aspect ratio
+    with _image().open(image_path) as image:
+        return width, max(1, round(image.height * width / image.width))
+
+
+def tile_sheet(job):
+    # Runs in a worker process: (capture paths, output path, tile size, format, quality)
+    paths, out_path, (width, height), image_format, quality = job
+    Image = _image()
+    columns = min(SPRITE_COLUMNS, len(paths))
+    rows = -(-len(paths) // SPRITE_COLUMNS)
+    sheet = Image.new("RGB", (columns * width, rows * height))
+    for i, path in enumerate(paths):
+        with Image.open(path) as capture:
+            tile = capture.convert("RGB").resize((width, height), Image.BILINEAR)
+        sheet.paste(tile, ((i % SPRITE_COLUMNS) * width, (i // SPRITE_COLUMNS) * height))
+    sheet.save(out_path, format=image_format.upper(), quality=quality)
+    return out_path
+
+
+def vtt_time(milliseconds):
+    seconds, millis = divmod(int(milliseconds), 1000)
+    return f"{seconds // 3600:02}:{seconds % 3600 // 60:02}:{seconds % 60:02}.{millis:03}"
+
+
+def webvtt(count, interval, tile, image_format=SPRITE_FORMAT):
+    # Cue i covers [i * interval, (i + 1) * interval), matching thumbnailIndex.nearest's captures
+    width, height = tile
+    per_sheet = SPRITE_COLUMNS * SPRITE_ROWS
+    lines = ["WEBVTT", ""]
+    for i in range(count):
+        start = i * interval * 1000
+        end = start + interval * 1000
+        cell = i % per_sheet
+        x, y = (cell % SPRITE_COLUMNS) * width, (cell // SPRITE_COLUMNS) * height
+        lines += [
+            f"{vtt_time(start)} --> {vtt_time(end)}",
+            f"{sheet_name(i // per_sheet, image_format)}#xywh={x},{y},{width},{height}",
+            "",
+        ]
+    return "\n".join(lines)
+
+
+def build_local(capture_paths, out_dir, interval=thumbnailIndex.THUMBNAIL_INTERVAL_SECONDS,
+                image_format=SPRITE_FORMAT, workers=SPRITE_WORKERS):
+    # Tiles captures (in capture order) into out_dir and writes the track; returns written file names
+    if not capture_paths or _image() is None:
+        return []
+    tile = tile_size(capture_paths[0])
+    per_sheet = SPRITE_COLUMNS * SPRITE_ROWS
+    jobs = [
+        (capture_paths[i:i + per_sheet], os.path.join(out_dir, sheet_name(i // per_sheet, image_format)),
+         tile, image_format, SPRITE_QUALITY)
+        for i in range(0, len(capture_paths), per_sheet)
+    ]
+    list(_map(tile_sheet, jobs, workers))
+    with open(os.path.join(out_dir, TRACK_NAME), "w", encoding="utf-8") as f:
+        f.write(webvtt(len(capture_paths), interval, tile, image_format))
+    return [os.path.basename(out_path) for _, out_path, *_ in jobs] + [TRACK_NAME]
+
+
+def build_sprites(bucket, thumbnail_prefix, index=None):
+    # Sheets and track under <thumbnail prefix>sprites/; returns the track key, or None
+    if _image() is None:
+        print("Pillow is not installed; skipping thumbnail sprites")
+        return None
+    index = index or thumbnailIndex.load_index(bucket, thumbnail_prefix)
+    if not index:
+        return None
+    work_dir = tempfile.mkdtemp(prefix="sprites-")
+    try:
+        downloads = [
+            (bucket, key, os.path.join(work_dir, f"capture-{i:07d}{os.path.splitext(key)[1]}"))
+            for i, key in enumerate(index["keys"])
+        ]
+        capture_paths = _download_all(downloads)
+        out_dir = os.path.join(work_dir, "out")
+        os.mkdir(out_dir)
+        prefix = sprites_prefix(thumbnail_prefix)
+        # Track last, so its existence means every sheet it references is in place
+        for name in build_local(capture_paths, out_dir, index["interval"]):
+            content_type = "text/vtt" if name == TRACK_NAME else _CONTENT_TYPES[SPRITE_FORMAT]
+            s3.upload_file(os.path.join(out_dir, name), bucket, prefix + name,
+                           ExtraArgs={"ContentType": content_type})
+        return prefix + TRACK_NAME
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _download(download):
+    bucket, key, path = download
+    s3.download_file(bucket, key, path)
+    return path
+
+
+def _download_all(downloads, workers=SPRITE_DOWNLOAD_WORKERS):
+    # Local paths in capture order; captures are small, so this is bound by S3 round trips
+    if workers <= 1 or len(downloads) <= 1:
+        return [_download(download) for download in downloads]
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=min(workers, len(downloads))) as pool:
+        return list(pool.map(_download, downloads))
+
+
+def _map(fn, jobs, workers):
+    if workers <= 1 or len(jobs) <= 1:
+        return map(fn, jobs)
+    from concurrent.futures import ProcessPoolExecutor
+    try:
+        pool = ProcessPoolExecutor(max_workers=min(workers, len(jobs)))
+    except OSError as e:
+        # Lambda has no /dev/shm for the pool's semaphores
+        print(f"Process pool unavailable ({e}); tiling sprite sheets serially")
+        return map(fn, jobs)
+    with pool:
+        return list(pool.map(fn, jobs))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 4 and sys.argv[1] == "build":
+        print(build_sprites(sys.argv[2], sys.argv[3]))
+    elif len(sys.argv) >= 4 and sys.argv[1] == "local":
+        captures = sorted((thumbnailIndex.capture_number(name), os.path.join(sys.argv[2], name))
+                          for name in os.listdir(sys.argv[2]) if thumbnailIndex.capture_number(name) is not None)
+        captures = [path for _, path in captures]
+        os.makedirs(sys.argv[3], exist_ok=True)
+        interval = int(sys.argv[4]) if len(sys.argv) > 4 else thumbnailIndex.THUMBNAIL_INTERVAL_SECONDS
+        print(build_local(captures, sys.argv[3], interval))
+    else:
+        sys.exit(f"usage: {sys.argv[0]} build <bucket> <prefix> | local <capture dir> <output dir> [interval]")
@@ -0,0 +1,241 @@
+"""Frame-accurate timecodes for MediaConvert clipping.
+
+A Timecode is an integer frame count at a FrameRate, so adding a duration to a start or
+comparing boundaries never goes through floats or datetime. Inputs can be clock times
+("HH:MM:SS", "HH:MM:SS.fff"), plain seconds ("30", "12.5") or SMPTE labels ("HH:MM:SS:FF",
+"HH:MM:SS;FF" for drop-frame). Output is the SMPTE label MediaConvert expects in
+InputClippings; 29.97 fps uses drop-frame labelling so labels track wall-clock time.
+
+Backfills can convert thousands of boundaries at once with parse_many / format_many /
+clip_ranges, which use NumPy when it is installed and fall back to the scalar path otherwise.
+"""
+from functools import total_ordering
+
+_numpy = None
+
+
+class FrameRate:
+    __slots__ = ("numerator", "denominator", "drop_frame", "nominal")
+
+    def __init__(self, numerator, denominator=1, drop_frame=False):
+        self.numerator = numerator
+        self.denominator = denominator
+        self.drop_frame = drop_frame
+        # Frames per labelled second ("30" for both 30 and 29.97 fps)
+        self.nominal = -(-numerator // denominator)
+
+    def __repr__(self):
+        rate = self.numerator / self.denominator
+        return f"FrameRate({rate:g}{' DF' if self.drop_frame else ''})"
+
+
+FPS_30 = FrameRate(30)
+FPS_2997_DF = FrameRate(30000, 1001, drop_frame=True)
+FRAME_RATES = {"30": FPS_30, "29.97": FPS_2997_DF}
+
+# Drop-frame constants for 29.97: labels ;00 and ;01 are skipped every minute except each tenth
+_DROPPED = 2
+_FRAMES_PER_MINUTE = 30 * 60 - _DROPPED
+_FRAMES_PER_10_MINUTES = _FRAMES_PER_MINUTE * 10 + _DROPPED
+
+
+@total_ordering
+class Timecode:
+    __slots__ = ("frames", "rate")
+
+    def __init__(self, frames, rate=FPS_30):
+        self.frames = int(frames)
+        self.rate = rate
+
+    @classmethod
+    def parse(cls, value, rate=FPS_30):
+        text = str(value).strip()
+        parts = text.replace(";", ":").split(":")
+        if len(parts) == 4:
+            hours, minutes, seconds, frames = (int(part) for part in parts)
+            return cls(label_to_frames(hours, minutes, seconds, frames, rate), rate)
+        return cls.from_milliseconds(parse_milliseconds(text), rate)
+
+    @classmethod
+    def from_milliseconds(cls, milliseconds, rate=FPS_30):
+        # The frame being shown at that instant (truncating, like the clipping always has)
+        return cls(_frames(milliseconds, rate), rate)
+
+    @classmethod
+    def from_seconds(cls, seconds, rate=FPS_30):
+        return cls.from_milliseconds(int(round(seconds * 1000)), rate)
+
+    @property
+    def seconds(self):
+        return self.frames * self.rate.denominator / self.rate.numerator
+
+    @property
+    def milliseconds(self):
+        return self.frames * 1000 * self.rate.denominator // self.rate.numerator
+
+    def __str__(self):
+        hours, minutes, seconds, frames = frames_to_label(self.frames, self.rate)
+        separator = ";" if self.rate.drop_frame else ":"
+        return f"{hours:02d}:{minutes:02d}:{seconds:02d}{separator}{frames:02d}"
+
+    def __repr__(self):
+        return f"Timecode({self}, {self.rate!r})"
+
+    def _check(self, other):
+        if not isinstance(other, Timecode):
+            return NotImplemented
+        if other.rate is not self.rate:
+            raise ValueError("Timecodes at different frame rates")
+        return other
+
+    def __add__(self, other):
+        other = self._check(other)
+        return other if other is NotImplemented else Timecode(self.frames + other.frames, self.rate)
+
+    def __sub__(self, other):
+        other = self._check(other)
+        return other if other is NotImplemented else Timecode(self.frames - other.frames, self.rate)
+
+    def __eq__(self, other):
+        return isinstance(other, Timecode) and other.rate is self.rate and other.frames == self.frames
+
+    def __lt__(self, other):
+        other = self._check(other)
+        return other if other is NotImplemented else self.frames < other.frames
+
+    def __hash__(self):
+        return hash((self.frames, self.rate.numerator, self.rate.denominator))
+
+
+def _frames(milliseconds, rate):
+    # Works on ints and on NumPy int64 arrays alike
+    return milliseconds * rate.numerator // (1000 * rate.denominator)
+
+
+def parse_milliseconds(value):
+    # "HH:MM:SS", "HH:MM:SS.fff" or plain seconds -> integer milliseconds, without floats
+    text = str(value).strip()
+    whole, _, fraction = text.partition(".")
+    milliseconds = int((fraction + "000")[:3]) if fraction else 0
+    total = 0
+    for part in whole.split(":"):
+        total = total * 60 + int(part or 0)
+    return total * 1000 + milliseconds
+
+
+def to_seconds(value):
+    return parse_milliseconds(value) / 1000
+
+
+def format_clock(milliseconds):
+    # Milliseconds -> "HH:MM:SS" or "HH:MM:SS.fff"
+    seconds, millis = divmod(int(milliseconds), 1000)
+    text = f"{seconds // 3600:02}:{seconds % 3600 // 60:02}:{seconds % 60:02}"
+    return f"{text}.{millis:03}" if millis else text
+
+
+def frames_to_label(frames, rate=FPS_30):
+    if rate.drop_frame:
+        tens, rest = divmod(frames, _FRAMES_PER_10_MINUTES)
+        frames += 9 * _DROPPED * tens
+        if rest > _DROPPED:
+            frames += _DROPPED * ((rest - _DROPPED) // _FRAMES_PER_MINUTE)
+    fps = rate.nominal
+    seconds, frame = divmod(frames, fps)
+    return seconds // 3600, seconds % 3600 // 60, seconds % 60, frame
+
+
+def label_to_frames(hours, minutes, seconds, frames, rate=FPS_30):
+    total = (hours * 3600 + minutes * 60 + seconds) * rate.nominal + frames
+    if rate.drop_frame:
+        total_minutes = hours * 60 + minutes
+        total -= _DROPPED * (total_minutes - total_minutes // 10)
+    return total
+
+
+def clip_range(start, duration, rate=FPS_30):
+    # (StartTimecode, EndTimecode) for InputClippings from a start time and a duration
+    start_ms = parse_milliseconds(start)
+    end_ms = start_ms + parse_milliseconds(duration)
+    return str(Timecode.from_milliseconds(start_ms, rate)), str(Timecode.from_milliseconds(end_ms, rate))
+
+
+def _np():
+    # NumPy is optional and only the batch helpers use it, so handlers don't pay its import time
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+            _numpy = numpy
+        except ImportError:
+            _numpy = False
+    return _numpy or None
+
+
+# Batch path. Clock strings of the common fixed layout ("HH:MM:SS" / "HH:MM:SS.fff") are parsed
+# as a byte matrix; anything else goes through the scalar parser.
+_CLOCK_WIDTH = 12
+_DIGITS = (0, 1, 3, 4, 6, 7, 9, 10, 11)
+_WEIGHTS = (36000000, 3600000, 600000, 60000, 10000, 1000, 100, 10, 1)
+
+
+def parse_many_milliseconds(values):
+    np = _np()
+    if np is None:
+        return [parse_milliseconds(value) for value in values]
+    encoded = [str(value).strip().encode() for value in values]
+    if not encoded:
+        return np.zeros(0, dtype=np.int64)
+    chars = np.array(encoded, dtype=f"S{_CLOCK_WIDTH}").view(np.uint8).reshape(-1, _CLOCK_WIDTH)
+    fixed = np.array([len(text) <= _CLOCK_WIDTH for text in encoded])
+    fixed &= (chars[:, 2] == ord(":")) & (chars[:, 5] == ord(":")) & np.isin(chars[:, 8], (0, ord(".")))
+    # NUL padding may only stand in for missing fraction digits; short clocks take the slow path
+    fixed &= (chars[:, _DIGITS[:6]] != 0).all(axis=1)
+    digits = np.where(chars[:, _DIGITS] == 0, ord("0"), chars[:, _DIGITS]).astype(np.int64) - ord("0")
+    fixed &= ((digits >= 0) & (digits <= 9)).all(axis=1)
+    milliseconds = digits @ np.array(_WEIGHTS, dtype=np.int64)
+    for i in np.flatnonzero(~fixed):
+        milliseconds[i] = parse_milliseconds(encoded[i].decode())
+    return milliseconds
+
+
+def parse_many(values, rate=FPS_30):
+    # Clock times -> frame counts (an int64 array when NumPy is available)
+    np = _np()
+    milliseconds = parse_many_milliseconds(values)
+    if np is None:
+        return [_frames(ms, rate) for ms in milliseconds]
+    return _frames(milliseconds, rate)
+
+
+def format_many(frames, rate=FPS_30):
+    np = _np()
+    if np is None:
+        return [str(Timecode(frame, rate)) for frame in frames]
+    frames = np.asarray(frames, dtype=np.int64)
+    if rate.drop_frame:
+        tens, rest = np.divmod(frames, _FRAMES_PER_10_MINUTES)
+        frames = frames + 9 * _DROPPED * tens + np.where(
+            rest > _DROPPED, _DROPPED * ((rest - _DROPPED) // _FRAMES_PER_MINUTE), 0
+        )
+    seconds, frame = np.divmod(frames, rate.nominal)
+    separator = ";" if rate.drop_frame else ":"
+    return [
+        f"{h:02d}:{m:02d}:{s:02d}{separator}{f:02d}"
+        for h, m, s, f in zip((seconds // 3600).tolist(), (seconds % 3600 // 60).tolist(),
+                              (seconds % 60).tolist(), frame.tolist())
+    ]
+
+
+def clip_ranges(starts, durations, rate=FPS_30):
+    # [(StartTimecode, EndTimecode)] for many segments at once
+    np = _np()
+    start_ms = parse_many_milliseconds(starts)
+    duration_ms = parse_many_milliseconds(durations)
+    if np is None:
+        start_frames = [_frames(ms, rate) for ms in start_ms]
+        end_frames = [_frames(s + d, rate) for s, d in zip(start_ms, duration_ms)]
+    else:
+        start_frames = _frames(start_ms, rate)
+        end_frames = _frames(start_ms + duration_ms, rate)
+    return list(zip(format_many(start_frames, rate), format_many(end_frames, rate)))
@@ -0,0 +1,78 @@
+import os
+from abc import ABC, abstractmethod
+
+import mediaConvertEndpoint
+
+# Encode backend behind every handler's create_job. TRANSCODER=mediaconvert (default) submits
+# to MediaConvert; TRANSCODER=ffmpeg runs the same job settings through a local ffmpeg
+# (ffmpegTranscoder), so the pipeline can be load-tested and ladders compared without AWS.
+BACKEND = os.environ.get("TRANSCODER", "mediaconvert").lower()
+
+_transcoder = None
+
+
+class Transcoder(ABC):
+    # Accepts MediaConvert CreateJob settings and answers with MediaConvert-shaped responses;
+    # a backend missing any of these fails when it is instantiated, not partway through an encode
+
+    @abstractmethod
+    def create_job(self, **job):
+        # {"Job": {"Id": ..., "Status": ...}}; a repeated ClientRequestToken returns the same job
+        ...
+
+    @abstractmethod
+    def get_job(self, Id):
+        ...
+
+    @abstractmethod
+    def list_jobs(self, **kwargs):
+        # One page of {"Jobs": [...], "NextToken": ...}, newest first unless Order="ASCENDING"
+        ...
+
+
+class MediaConvertTranscoder(Transcoder):
+
+    def create_job(self, **job):
+        return mediaConvertEndpoint.call("create_job", **job)
+
+    def get_job(self, Id):
+        return mediaConvertEndpoint.call("get_job", Id=Id)
+
+    def list_jobs(self, **kwargs):
+        return mediaConvertEndpoint.call("list_jobs", **kwargs)
+
+
+def uses_mediaconvert():
+    return BACKEND == "mediaconvert"
+
+
+def get_transcoder():
+    global _transcoder
+    if _transcoder is None:
+        if BACKEND == "mediaconvert":
+            _transcoder = MediaConvertTranscoder()
+        elif BACKEND == "ffmpeg":
+            # Only local runs pay for importing the ffmpeg backend
+            import ffmpegTranscoder
+            _transcoder = ffmpegTranscoder.FfmpegTranscoder()
+        else:
+            raise ValueError(f"Unknown TRANSCODER: {BACKEND}")
+    return _transcoder
+
+
+def set_transcoder(transcoder):
+    # Lets benchmarks and local harnesses install a configured backend
+    global _transcoder
+    _transcoder = transcoder
+
+
+def create_job(**job):
+    return get_transcoder().create_job(**job)
+
+
+def get_job(job_id):
+    return get_transcoder().get_job(Id=job_id)
+
+
+def list_jobs(**kwargs):
+    return get_transcoder().list_jobs(**kwargs)
@@ -5,61 +5,169 @@ import hashlib
 import re
 import base64
 import os
+from collections import OrderedDict
+
+# Lambda@Edge has no environment variables: the key comes from media_token.key, baked into
+# this bundle by mediaTokenKey, the same file the cookie and manifest Lambdas sign with
+from mediaTokenKey import SECRET_KEY
+
+# Playlists served by manifestLambda carry ?token=<expires>.<base64url scope>.<hmac> on every
+# media URI (manifestAuth, signed with SECRET_KEY), checked here without touching cookies
+TOKEN_PARAM = "token="
+COOKIE_NAME = "segment_access"
+SEGMENT_PATH = re.compile(r"^/stream/([^/]+)/")
+
+# The caches are sized here, as there is no environment to configure them from. A warm container
+# serves many segments of the same stream with the same cookie or token, so a verified
+# credential is remembered (its segment id or scope, and its expiry) until it expires, and a
+# rejected one is remembered briefly so replays of a bad cookie skip the HMAC too.
+VERIFIED_CACHE_SIZE = 2048
+REJECTED_CACHE_SIZE = 512
+REJECTED_TTL_SECONDS = 30
+
+_verified = OrderedDict()
+_rejected = OrderedDict()
+
 
-SECRET_KEY = b"SECRET_KEY" 
-# THIS IS A PLACEHOLDER: TODO WHEN COOKIE GENERATION IS SET UP 
 def lambda_handler(event, context):
     request = event["Records"][0]["cf"]["request"]
     headers = request.get("headers", {})
     uri = request.get("uri", "")
+    now = int(time.time())
+
+    token = query_token(request.get("querystring", ""))
+    if token is not None:
+        reason = check_media_token(uri, token, now)
+        if reason:
+            return deny(reason)
+        # Drop the token so every viewer shares one cached copy of the object
+        request["querystring"] = ""
+        return request
 
-    # Extract segment_id from URI: /segments/<segment_id>/...
-    match = re.match(r"^/stream/([^/]+)/", uri)
+    # Extract segment_id from URI: /stream/<segment_id>/...
+    match = SEGMENT_PATH.match(uri)
     if not match:
         return deny("Invalid segment path")
 
     segment_id = match.group(1)
 
-    # Extract cookies from headers
-    cookies = parse_cookies(headers.get("cookie", []))
-    cookie_value = cookies.get("segment_access")
+    cookie_value = find_cookie(headers.get("cookie", []), COOKIE_NAME)
     if not cookie_value:
         return deny("Missing segment_access cookie")
 
-    try:
-        cookie_segment_id, expiry_str, signature = cookie_value.split(".")
-        expiry = int(expiry_str)
-    except Exception:
-        return deny("Malformed cookie")
+    reason = check_cookie(cookie_value, segment_id, now)
+    if reason:
+        return deny(reason)
+
+    # All good — allow request
+    return request
+
+
+def query_token(querystring):
+    for param in querystring.split("&"):
+        if param.startswith(TOKEN_PARAM):
+            return param[len(TOKEN_PARAM):]
+    return None
 
-    # Check expiration
-    if expiry < int(time.time()):
-        return deny("Cookie expired")
 
-    # Validate signature
-    payload = f"{cookie_segment_id}.{expiry}"
-    expected_sig = hmac.new(SECRET_KEY, payload.encode("utf-8"), hashlib.sha256).hexdigest()
+def check_media_token(uri, token, now):
+    # None when the token is valid for uri, otherwise the reason to deny
+    if "/.." in uri:
+        return "Token scope mismatch"
+    verified = cached(token, now)
+    if isinstance(verified, str):
+        return verified
+    if verified is None:
+        try:
+            expiry_str, encoded_scope, signature = token.split(".")
+            scope = base64.urlsafe_b64decode(encoded_scope + "=" * (-len(encoded_scope) % 4)).decode("utf-8")
+            expiry = int(expiry_str)
+        except Exception:
+            return reject(token, "Malformed token", now)
+        if expiry < now:
+            return "Token expired"
+        expected_sig = hmac.new(SECRET_KEY, f"{expiry_str}.{scope}".encode("utf-8"), hashlib.sha256).hexdigest()
+        if not hmac.compare_digest(expected_sig, signature):
+            return reject(token, "Invalid signature", now)
+        verified = remember(token, scope, expiry)
+    # The token covers everything under its scope directory
+    if not uri.startswith(verified[0]):
+        return "Token scope mismatch"
+    return None
 
-    if expected_sig != signature:
-        return deny("Invalid signature")
+
+def check_cookie(cookie_value, segment_id, now):
+    # None when the cookie grants segment_id, otherwise the reason to deny
+    verified = cached(cookie_value, now)
+    if isinstance(verified, str):
+        return verified
+    if verified is None:
+        try:
+            cookie_segment_id, expiry_str, signature = cookie_value.split(".")
+            expiry = int(expiry_str)
+        except Exception:
+            return reject(cookie_value, "Malformed cookie", now)
+
+        # Check expiration
+        if expiry < now:
+            return "Cookie expired"
+
+        # Validate signature
+        payload = f"{cookie_segment_id}.{expiry}"
+        expected_sig = hmac.new(SECRET_KEY, payload.encode("utf-8"), hashlib.sha256).hexdigest()
+        if not hmac.compare_digest(expected_sig, signature):
+            return reject(cookie_value, "Invalid signature", now)
+        verified = remember(cookie_value, cookie_segment_id, expiry)
 
     # Check path match
-    if cookie_segment_id != segment_id:
-        return deny("Segment mismatch")
+    if verified[0] != segment_id:
+        return "Segment mismatch"
+    return None
 
-    # All good — allow request
-    return request
+
+def cached(credential, now):
+    # (granted segment id or scope, expiry) of a verified credential, the deny reason of a
+    # recently rejected one, or None when it has to be checked
+    verified = _verified.get(credential)
+    if verified is not None:
+        if verified[1] >= now:
+            _verified.move_to_end(credential)
+            return verified
+        del _verified[credential]
+    rejected = _rejected.get(credential)
+    if rejected is not None:
+        if rejected[1] >= now:
+            return rejected[0]
+        del _rejected[credential]
+    return None
+
+
+def remember(credential, grant, expiry):
+    verified = (grant, expiry)
+    _verified[credential] = verified
+    _verified.move_to_end(credential)
+    if len(_verified) > VERIFIED_CACHE_SIZE:
+        _verified.popitem(last=False)
+    return verified
+
+
+def reject(credential, reason, now):
+    _rejected[credential] = (reason, now + REJECTED_TTL_SECONDS)
+    _rejected.move_to_end(credential)
+    if len(_rejected) > REJECTED_CACHE_SIZE:
+        _rejected.popitem(last=False)
+    return reason
 
 
-def parse_cookies(cookie_header_list):
-    cookies = {}
+def find_cookie(cookie_header_list, name):
+    # Value of the first cookie called name, scanning the headers once and stopping there
+    prefix = name + "="
     for header in cookie_header_list:
-        parts = header["value"].split(";")
-        for part in parts:
-            if "=" in part:
-                name, value = part.strip().split("=", 1)
-                cookies[name] = value
-    return cookies
+        for part in header["value"].split(";"):
+            part = part.strip()
+            if part.startswith(prefix):
+                return part[len(prefix):]
+    return None
 
 
 def deny(reason):
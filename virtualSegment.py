@@ -0,0 +1,172 @@
+import json
+import math
+import os
+import posixpath
+
+from botocore.exceptions import ClientError
+
+import awsClients
+import encodedRanges
+import hlsSegmentIndex
+
+# "Virtual" segments: once a broadcast has been encoded to HLS by dev2streamlambda, a segment
+# is served by writing playlists that reference the broadcast's TS files covering the
+# requested window, instead of running a new MediaConvert job. Without a broadcast encode, any
+# earlier segment encode whose range contains the window (encodedRanges) serves the same way.
+BROADCAST_BUCKET = os.environ.get("BROADCAST_BUCKET") or os.environ.get("DESTINATION_BUCKET") or os.environ.get("SEGMENT_BUCKET")
+# Base URL for TS files when segment playlists and broadcast outputs are not in the same bucket
+BROADCAST_HLS_BASE_URL = os.environ.get("BROADCAST_HLS_BASE_URL")
+BROADCAST_INDEX_PREFIX = "broadcast-index/"
+
+s3 = awsClients.client("s3")
+
+
+def pointer_key(input_path):
+    # broadcast-index/<source key>.json, keyed by the source the broadcast was encoded from
+    source_key = input_path.split("://", 1)[-1].split("/", 1)[-1]
+    return f"{BROADCAST_INDEX_PREFIX}{source_key}.json"
+
+
+def broadcast_master_key(broadcast_id, input_path):
+    # MediaConvert names the master manifest after the input file
+    stem = os.path.splitext(input_path.split("/")[-1])[0]
+    return f"{broadcast_id}/hls/{broadcast_id}/{stem}.m3u8"
+
+
+def record_broadcast_encode(input_path, broadcast_id, bucket=None, thumbnail_prefix=None):
+    # Written at submit; segments are only served from the broadcast once mark_broadcast_ready
+    # flags the pointer, so requests made while it encodes don't probe for an index
+    bucket = bucket or BROADCAST_BUCKET
+    master_key = broadcast_master_key(broadcast_id, input_path)
+    pointer = {"broadcast_id": broadcast_id, "bucket": bucket, "master": master_key, "ready": False}
+    if thumbnail_prefix:
+        pointer["thumbnails"] = thumbnail_prefix
+    _put_pointer(bucket, input_path, pointer)
+    return master_key
+
+
+def mark_broadcast_ready(input_path, bucket, master_key):
+    # Called by broadcastIndexLambda once the broadcast's segment index is written
+    text = _get_text(bucket, pointer_key(input_path))
+    pointer = json.loads(text) if text is not None else {"bucket": bucket, "master": master_key}
+    if pointer["master"] != master_key:
+        # The source has been re-broadcast since; that encode owns the pointer
+        return False
+    _put_pointer(bucket, input_path, dict(pointer, ready=True))
+    return True
+
+
+def find_broadcast(input_path):
+    # The pointer record written by record_broadcast_encode, or None
+    pointer = _get_text(BROADCAST_BUCKET, pointer_key(input_path))
+    return json.loads(pointer) if pointer is not None else None
+
+
+def find_broadcast_master(input_path):
+    # (bucket, master key) of a broadcast whose index is written, or None
+    pointer = find_broadcast(input_path)
+    # Pointers written before the flag existed belong to broadcasts indexed on first use
+    if pointer is None or not pointer.get("ready", True):
+        return None
+    return pointer["bucket"], pointer["master"]
+
+
+def covers(index, start_seconds, duration_seconds):
+    # Whether every rendition of the index runs to the end of the window
+    end = start_seconds + duration_seconds
+    return all(rendition.starts[-1] + encodedRanges.COVER_TOLERANCE_SECONDS >= end for rendition in index.renditions)
+
+
+def slice_media_playlist(rendition, start_seconds, duration_seconds, uri_prefix=""):
+    # Media playlist covering [start, start + duration) with a precise start offset hint
+    found = rendition.lookup(start_seconds, duration_seconds)
+    if found is None:
+        return None
+    first, stop = found
+
+    target = max(math.ceil(rendition.duration(i)) for i in range(first, stop))
+    lines = [
+        "#EXTM3U",
+        "#EXT-X-VERSION:3",
+        f"#EXT-X-TARGETDURATION:{target}",
+        "#EXT-X-MEDIA-SEQUENCE:1",
+        "#EXT-X-PLAYLIST-TYPE:VOD",
+        f"#EXT-X-START:TIME-OFFSET={max(0.0, start_seconds - rendition.starts[first]):.3f},PRECISE=YES",
+    ]
+    for i in range(first, stop):
+        lines.append(f"#EXTINF:{rendition.duration(i):.3f},")
+        lines.append(uri_prefix + rendition.uris[i])
+    lines.append("#EXT-X-ENDLIST")
+    return "\n".join(lines) + "\n"
+
+
+def write_virtual_segment(input_path, segment_bucket, segment_prefix, start_seconds, duration_seconds):
+    # Returns the master playlist key under segment_prefix, or None when neither the broadcast
+    # nor an earlier encode covering the window (encodedRanges) has been encoded yet
+    located = find_broadcast_master(input_path)
+    index = hlsSegmentIndex.load_index(*located) if located else None
+    offset = 0.0
+    # A window running past the end of the broadcast would be served truncated
+    if index is None or not covers(index, start_seconds, duration_seconds):
+        covering = encodedRanges.find_covering(input_path, start_seconds, duration_seconds)
+        # Never slice a segment's own encode into itself
+        if covering is None or posixpath.dirname(covering.master_key) == segment_prefix.rstrip("/"):
+            return None
+        located, offset = (covering.bucket, covering.master_key), covering.start
+        index = hlsSegmentIndex.load_index(*located)
+        if index is None:
+            return None
+    broadcast_bucket, master_key = located
+    # Playlist times of the covering encode start at its own offset into the source
+    start_seconds -= offset
+
+    broadcast_dir = posixpath.dirname(master_key)
+    uri_prefix = _uri_prefix(broadcast_bucket, broadcast_dir, segment_bucket, segment_prefix)
+    if uri_prefix is None:
+        return None
+    master_lines = ["#EXTM3U", "#EXT-X-VERSION:3", "#EXT-X-INDEPENDENT-SEGMENTS"]
+    playlists = {}
+    for rendition in index.renditions:
+        sliced = slice_media_playlist(rendition, start_seconds, duration_seconds, uri_prefix)
+        if sliced is None:
+            return None
+        playlists[rendition.playlist] = sliced
+        master_lines += [rendition.stream_inf, rendition.playlist]
+
+    for variant_uri, body in playlists.items():
+        _put_playlist(segment_bucket, posixpath.join(segment_prefix, variant_uri), body)
+    segment_master_key = posixpath.join(segment_prefix, "master.m3u8")
+    # Master last, so its existence means the segment is playable
+    _put_playlist(segment_bucket, segment_master_key, "\n".join(master_lines) + "\n")
+    return segment_master_key
+
+
+def _uri_prefix(broadcast_bucket, broadcast_dir, segment_bucket, segment_prefix):
+    if broadcast_bucket == segment_bucket:
+        return posixpath.relpath(broadcast_dir, segment_prefix.rstrip("/")) + "/"
+    if not BROADCAST_HLS_BASE_URL:
+        print("BROADCAST_HLS_BASE_URL is required when broadcast and segment buckets differ")
+        return None
+    return f"{BROADCAST_HLS_BASE_URL.rstrip('/')}/{broadcast_dir}/"
+
+
+def _get_text(bucket, key):
+    try:
+        return s3.get_object(Bucket=bucket, Key=key)["Body"].read().decode("utf-8")
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+            return None
+        raise
+
+
+def _put_pointer(bucket, input_path, pointer):
+    s3.put_object(
+        Bucket=bucket,
+        Key=pointer_key(input_path),
+        Body=json.dumps(pointer).encode(),
+        ContentType="application/json"
+    )
+
+
+def _put_playlist(bucket, key, body):
+    s3.put_object(Bucket=bucket, Key=key, Body=body.encode("utf-8"), ContentType="application/vnd.apple.mpegurl")